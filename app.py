@@ -1,38 +1,42 @@
+import argparse
 import time
 import pygame
 from pygame._sdl2.video import Window as SDLWindow, Renderer, Texture
 import numpy as np
-import sys
 import os
-from pytoynes.bus import Bus
-from pytoynes.rom import Rom
-from pytoynes.mos6502 import MOS6502
-from pytoynes.cartridge import Cartridge
+from pytoynes import Emulator, Rewind
+from pytoynes.movie import Movie, MoviePlayer, MovieRecorder
 from pytoynes.ui.memoryview import draw_memory_view, draw_status_bits, draw_program_counter, draw_registers, draw_pattern_table, draw_ppu_screen, draw_fps, draw_apu_waveform
 from pytoynes.controller import *
 
 def main():
-    rom_path = './pytoynes/assets/nestest.nes'
-    if len(sys.argv) > 1:
-        rom_path = os.path.expanduser(sys.argv[1])
-
-    cpu = MOS6502()
-    bus = Bus()
-    cpu.connect(bus)
+    parser = argparse.ArgumentParser(description='Pytoynes NES emulator')
+    parser.add_argument('rom', nargs='?', default='./pytoynes/assets/nestest.nes')
+    movie_group = parser.add_mutually_exclusive_group()
+    movie_group.add_argument('--record', metavar='MOVIE', help='record the inputs into a movie file')
+    movie_group.add_argument('--play', metavar='MOVIE', help='play back a movie file')
+    args = parser.parse_args()
+    rom_path = os.path.expanduser(args.rom)
 
     try:
-        cartridge = Cartridge(rom_path)
+        emulator = Emulator(rom_path)
     except FileNotFoundError:
         print(f"Error: ROM file not found: {rom_path}")
         return
 
-    bus.cartridge = cartridge
+    cpu, bus = emulator.cpu, emulator.bus
     bus.ppu.ppu_mask = 0x1E
-
-    cpu.reset()
-    lo = bus.read(0xFFFC)
-    hi = bus.read(0xFFFD)
-    cpu.pc = (hi << 8) | lo
+    rewind = Rewind(emulator)
+    rewinding = False
+    # Rewinding is off while recording or playing a movie
+    recorder = MovieRecorder(emulator) if args.record else None
+    player = None
+    if args.play:
+        try:
+            player = MoviePlayer(Movie.load(os.path.expanduser(args.play)), emulator)
+        except (OSError, ValueError) as e:
+            print(f"Error: cannot play movie: {e}")
+            return
 
     pygame.display.init()
     pygame.font.init()
@@ -118,14 +122,34 @@ def main():
                     debug_mode = not debug_mode
                     if debug_mode: open_debug_window()
                     else: close_debug_window()
-                if e.key in key_map:
+                elif e.key == pygame.K_BACKSPACE:
+                    rewinding = True
+                if e.key in key_map and player is None:
                     bus.controllers[0].set_button(key_map[e.key], True)
             elif e.type == pygame.KEYUP:
-                if e.key in key_map:
+                if e.key in key_map and player is None:
                     bus.controllers[0].set_button(key_map[e.key], False)
-
-        # High-performance Cython frame execution
-        bus.run_frame(cpu)
+                elif e.key == pygame.K_BACKSPACE:
+                    rewinding = False
+
+        if player is not None and player.done:
+            # Back to the keyboard once the movie is over
+            player = None
+        if player is not None:
+            player.step()
+        elif rewinding and recorder is None and rewind.pop():
+            # Run the restored frame to show it, without playing its sound
+            emulator.step_frame()
+            bus.apu.audio_ptr = 0
+        else:
+            if recorder is not None:
+                recorder.record()
+            else:
+                # The state the frame starts from, which after rewinding is the
+                # one shown last, so no frame is missing from the history
+                rewind.push()
+            # High-performance Cython frame execution
+            bus.run_frame(cpu)
 
         # Audio Output
         if audio_enabled:
@@ -193,6 +217,9 @@ def main():
 
     close_debug_window()
     if bus.cartridge: bus.cartridge.save_sram()
+    if recorder is not None:
+        recorder.movie.save(os.path.expanduser(args.record))
+        print(f"Recorded {len(recorder.movie)} frames to {args.record}")
     pygame.quit()
 
 if __name__ == '__main__':
@@ -0,0 +1,5 @@
+from .bootcache import BootCache
+from .emulator import Emulator
+from .explore import BranchResult, ForkExplorer
+from .rewind import Rewind
+from .vector import VectorEmulator, ProcessVectorEmulator
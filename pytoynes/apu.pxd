@@ -118,6 +118,8 @@ cdef class APU:
     cpdef void clock(self)
     cpdef void clock_n(self, int n)
     cpdef void connect_bus(self, Bus bus)
+    cpdef int cycles_to_frame_step(self)
+    cpdef int cycles_to_dmc_fetch(self)
     cdef void _dmc_fetch_sample(self)
     cpdef int cpu_read(self, int addr)
     cpdef void cpu_write(self, int addr, int data)
@@ -1,3 +1,6 @@
+import array
+
+
 class APU:
     # Standard NES Duty Cycle sequences (8 steps each)
     DUTY_TABLE = [
@@ -26,6 +29,12 @@ class APU:
         428, 380, 340, 320, 286, 254, 226, 214, 190, 160, 142, 128, 106, 84, 72, 54
     ]
 
+    # Frame counter step positions for the 4-step and 5-step sequences
+    FRAME_STEPS = [
+        [7457, 14913, 22371, 29828, 29829],
+        [7457, 14913, 22371, 29829, 37281]
+    ]
+
     def __init__(self):
         self.bus = None
         # Channel Enable Status (Register 0x4015)
@@ -137,7 +146,7 @@ class APU:
         self.sample_ptr = 0
 
         # Audio Buffer
-        self.audio_buffer = [0.0] * 2048
+        self.audio_buffer = array.array('f', bytes(4 * 2048))
         self.audio_ptr = 0
         self.cycle_acc = 0
         self.cycles_per_sample = 40.584
@@ -274,6 +283,19 @@ class APU:
                 self.audio_buffer[self.audio_ptr] = (pulse_out + tnd_out) - 0.1
                 self.audio_ptr += 1
 
+    def cycles_to_frame_step(self):
+        for step in self.FRAME_STEPS[self.frame_counter_mode]:
+            if step > self.frame_counter_cycles:
+                return step - self.frame_counter_cycles
+        return 1
+
+    def cycles_to_dmc_fetch(self):
+        # Samples are only fetched when the output unit drains a full buffer
+        if not self.dmc_buffer_full or self.dmc_bytes_remaining == 0:
+            return -1
+        expiries = max(self.dmc_bits_remaining, 1)
+        return self.dmc_timer_value + 1 + (expiries - 1) * (self.dmc_timer_reload + 1)
+
     def _dmc_fetch_sample(self):
         if self.dmc_bytes_remaining > 0 and not self.dmc_buffer_full:
             if self.bus is not None:
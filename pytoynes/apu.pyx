@@ -32,6 +32,11 @@ DMC_TABLE = [
     428, 380, 340, 320, 286, 254, 226, 214, 190, 160, 142, 128, 106, 84, 72, 54
 ]
 
+# Frame counter step positions for the 4-step and 5-step sequences
+cdef int FRAME_STEPS[2][5]
+FRAME_STEPS[0] = [7457, 14913, 22371, 29828, 29829]
+FRAME_STEPS[1] = [7457, 14913, 22371, 29829, 37281]
+
 cdef class APU:
     def __init__(self):
         self.bus = None
@@ -285,6 +290,21 @@ cdef class APU:
         for i in range(n):
             self.clock()
 
+    cpdef int cycles_to_frame_step(self):
+        cdef int i
+        for i in range(5):
+            if FRAME_STEPS[self.frame_counter_mode][i] > self.frame_counter_cycles:
+                return FRAME_STEPS[self.frame_counter_mode][i] - self.frame_counter_cycles
+        return 1
+
+    cpdef int cycles_to_dmc_fetch(self):
+        # Samples are only fetched when the output unit drains a full buffer
+        cdef int expiries
+        if not self.dmc_buffer_full or self.dmc_bytes_remaining == 0:
+            return -1
+        expiries = max(self.dmc_bits_remaining, 1)
+        return self.dmc_timer_value + 1 + (expiries - 1) * (self.dmc_timer_reload + 1)
+
     cdef void _dmc_fetch_sample(self):
         if self.dmc_bytes_remaining > 0 and not self.dmc_buffer_full:
             if self.bus is not None:
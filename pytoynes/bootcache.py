@@ -0,0 +1,129 @@
+import hashlib
+import os
+import sys
+import tempfile
+from numbers import Integral
+from typing import Optional, Sequence
+from . import savestate
+from .emulator import Emulator, Inputs
+
+_SUFFIX = '.state'
+
+
+def _default_directory() -> str:
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'pytoynes', 'boot')
+
+
+class BootCache:
+    """Snapshots of consoles right after their boot sequence, kept on disk.
+
+    Entries are keyed by the ROM contents, the checkpoint (number of frames
+    and the inputs held during them) and the code of the emulator build that
+    made them, so a snapshot is only restored into a console that would have
+    reached the exact same state. The least recently used entries are deleted
+    to stay within max_bytes.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_bytes: int = 64 << 20):
+        self.directory = directory or _default_directory()
+        self.max_bytes = max_bytes
+        self._build_hashes = {}
+
+    def _build_hash(self, emulator: Emulator) -> bytes:
+        # Digest of the modules (sources or compiled extensions) that run the
+        # console and lay out its snapshot
+        bus = emulator.bus
+        chips = (emulator.cpu, bus, bus.ppu, bus.apu, bus.scheduler, bus.cartridge, bus.cartridge.mapper)
+        paths = sorted({sys.modules[type(chip).__module__].__file__ for chip in chips} | {savestate.__file__})
+        key = tuple(paths)
+        if key not in self._build_hashes:
+            digest = hashlib.sha256()
+            for path in paths:
+                with open(path, 'rb') as f:
+                    digest.update(f.read())
+            self._build_hashes[key] = digest.digest()
+        return self._build_hashes[key]
+
+    def key(self, emulator: Emulator, frames: int, inputs: Sequence[Inputs] = ()) -> str:
+        rom = emulator.bus.cartridge.rom
+        if rom is None:
+            raise ValueError('only cartridges loaded from a ROM file can be cached')
+        digest = hashlib.sha256(self._build_hash(emulator))
+        digest.update(bytes([rom.mapper & 0xFF, rom.mirroring]))
+        digest.update(rom.prg_rom_data)
+        digest.update(rom.chr_rom_data)
+        script = [state if isinstance(state, Integral) else tuple(state) for state in inputs]
+        digest.update(repr((frames, emulator.state_size, script)).encode())
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def boot(self, emulator: Emulator, frames: int, inputs: Sequence[Inputs] = ()) -> bool:
+        """Bring a freshly loaded emulator `frames` frames past power on,
+        holding inputs[i] during frame i and nothing after the last of them.
+        Restores the cached snapshot if there is one, otherwise runs the
+        frames and caches the result. Returns True on a cache hit."""
+        path = self._path(self.key(emulator, frames, inputs))
+        try:
+            with open(path, 'rb') as f:
+                buffer = f.read()
+        except OSError:
+            buffer = None
+        if buffer is not None and len(buffer) == emulator.state_size:
+            emulator.restore(buffer)
+            # Most recently used first when evicting
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            return True
+
+        for i in range(frames):
+            emulator.step_frame(inputs[i] if i < len(inputs) else 0)
+        self._store(path, emulator.snapshot())
+        return False
+
+    def _store(self, path: str, buffer: bytearray):
+        os.makedirs(self.directory, exist_ok=True)
+        # Written under a temporary name, so other processes never read half a file
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(buffer)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None):
+        # Delete the least recently used entries until the cache fits
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        if not os.path.isdir(self.directory):
+            return
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(_SUFFIX):
+                os.unlink(entry.path)
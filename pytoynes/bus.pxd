@@ -3,6 +3,7 @@ from .ppu cimport PPU
 from .cartridge cimport Cartridge
 from .apu cimport APU
 from .mos6502 cimport MOS6502
+from .scheduler cimport Scheduler
 
 cdef class Bus:
     cdef public unsigned char[:] ram
@@ -10,7 +11,29 @@ cdef class Bus:
     cdef public APU apu
     cdef public list controllers
     cdef public Cartridge _cartridge
+    cdef unsigned char* _read_pages[256]
+    cdef unsigned char* _write_pages[256]
+    cdef public long long total_cycles
+    cdef public Scheduler scheduler
 
+    cdef void _map_ram_pages(self)
+    cpdef void _map_cartridge_pages(self)
+    cpdef void _on_bank_switch(self)
     cpdef int read(self, int addr)
     cpdef void write(self, int addr, int data)
+    cdef int _read_io(self, int addr)
+    cdef void _write_io(self, int addr, int data)
+    cdef void _oam_dma(self, int page)
+    cdef void _sync_apu(self)
+    cdef void _sync_ppu(self)
+    cdef void _catch_up_apu(self)
+    cdef void _catch_up_ppu(self)
+    cdef void _schedule_apu_events(self)
+    cdef void _schedule_ppu_events(self)
+    cdef void _schedule_nmi_before(self)
+    cpdef void poll_irq(self)
+    cpdef void skip_idle_loop(self, int loop_cycles, bint reads_status=*)
+    cdef bint _irq_pending(self)
+    cdef void _schedule_irq_poll(self, MOS6502 cpu)
+    cdef void _service_events(self, MOS6502 cpu)
     cpdef void run_frame(self, MOS6502 cpu)
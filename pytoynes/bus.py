@@ -4,6 +4,8 @@ from .cartridge import Cartridge
 from .ppu import PPU
 from .controller import Controller
 from .apu import APU
+from .scheduler import (Scheduler, EVENT_FRAME_END, EVENT_NMI, EVENT_MAPPER_IRQ,
+                        EVENT_FRAME_COUNTER, EVENT_DMC, EVENT_IRQ_POLL)
 
 class Bus:
     def __init__(self):
@@ -13,6 +15,15 @@ class Bus:
         self.apu = APU()
         self.apu.connect_bus(self)
         self.controllers = [Controller(), Controller()]
+        # CPU address space split into 256-byte pages. A page backed by plain
+        # memory holds a view of it; None sends the access to the I/O handlers.
+        self._read_pages = [None] * 256
+        self._write_pages = [None] * 256
+        self._map_ram_pages()
+        # Absolute CPU cycle count; the APU and PPU lag behind it and are only
+        # brought up to date when an event is due or the CPU touches them.
+        self.total_cycles = 0
+        self.scheduler = Scheduler()
 
     @property
     def cartridge(self):
@@ -25,34 +36,94 @@ class Bus:
             self.ppu.connect_cartridge(cartridge)
             if hasattr(cartridge, 'rom') and cartridge.rom is not None:
                 self.ppu.mirror_mode = cartridge.rom.mirroring
+            cartridge.mapper.on_bank_switch = self._on_bank_switch
+        self._map_cartridge_pages()
 
     def set_cartridge(self, cartridge: Cartridge):
         self.cartridge = cartridge
 
+    def _map_ram_pages(self):
+        ram = memoryview(self.ram)
+        for page in range(0x00, 0x20):
+            offset = (page & 0x07) << 8
+            self._read_pages[page] = self._write_pages[page] = ram[offset:offset + 0x100]
+
+    def _map_cartridge_pages(self):
+        for page in range(0x20, 0x100):
+            if self._cartridge is not None and page >= 0x60:
+                self._read_pages[page] = self._cartridge.cpu_read_page(page)
+                self._write_pages[page] = self._cartridge.cpu_write_page(page)
+            else:
+                self._read_pages[page] = self._write_pages[page] = None
+
+    def _on_bank_switch(self):
+        # Mapper registers can swap PRG banks and change nametable mirroring
+        self._map_cartridge_pages()
+        self.ppu.map_nametables()
+
     def write(self, addr, data):
-        if addr <= 0x1FFF:
-            self.ram[addr & 0x07FF] = data & 0xFF
-        elif addr <= 0x3FFF:
-            self.ppu.cpu_write(0x2000 + (addr % 8), data)
+        page = self._write_pages[(addr >> 8) & 0xFF]
+        if page is not None:
+            page[addr & 0xFF] = data & 0xFF
+        else:
+            self._write_io(addr, data)
+
+    def read(self, addr):
+        page = self._read_pages[(addr >> 8) & 0xFF]
+        if page is not None:
+            return page[addr & 0xFF]
+        return self._read_io(addr)
+
+    def _write_io(self, addr, data):
+        if 0x2000 <= addr <= 0x3FFF:
+            if (addr & 0x07) in (0x00, 0x01, 0x05, 0x06):
+                # Replayed by the PPU at this dot the next time it catches up
+                self.ppu.defer_write(0x2000 + (addr % 8), data, self.total_cycles * 3)
+                if (addr & 0x07) == 0x00:
+                    self._schedule_nmi_before()
+            else:
+                self._catch_up_ppu()
+                self.ppu.cpu_write(0x2000 + (addr % 8), data)
         elif addr >= 0x4000 and addr <= 0x401F:
             if addr == 0x4014:
-                # OAM DMA
-                for i in range(256):
-                    self.ppu.oam_vram[self.ppu.oam_addr] = self.read((data << 8) | i)
-                    self.ppu.oam_addr = (self.ppu.oam_addr + 1) & 0xFF
+                self._oam_dma(data)
             elif addr == 0x4016:
                 self.controllers[0].write(data)
                 self.controllers[1].write(data)
             else:
+                self._catch_up_apu()
                 self.apu.cpu_write(addr, data)
         elif addr >= 0x4020:
             if self._cartridge is not None:
+                if addr >= 0x8000:
+                    # Bank switches change what the DMC fetches from ROM
+                    self._catch_up_apu()
+                if self._cartridge.mapper.affects_ppu(addr, data):
+                    self._catch_up_ppu()
                 self._cartridge.cpu_write(addr, data)
 
-    def read(self, addr):
-        if addr <= 0x1FFF:
-            return self.ram[addr & 0x07FF]
-        elif addr <= 0x3FFF:
+    def _oam_dma(self, page):
+        self._catch_up_ppu()
+        ppu = self.ppu
+        source = self._read_pages[page & 0xFF]
+        if source is not None:
+            # Plain memory is copied in one go, wrapping around at oam_addr
+            oam, split = memoryview(ppu.oam_vram), 256 - ppu.oam_addr
+            oam[ppu.oam_addr:] = source[:split]
+            oam[:ppu.oam_addr] = source[split:]
+        else:
+            for i in range(256):
+                ppu.oam_vram[(ppu.oam_addr + i) & 0xFF] = self.read((page << 8) | i)
+        # The CPU is halted for 256 reads and writes, a cycle for its own write
+        # to finish and one more to line up when the DMA starts on an odd cycle
+        self.total_cycles += 513 + (self.total_cycles & 1)
+
+    def _read_io(self, addr):
+        if 0x2000 <= addr <= 0x3FFF:
+            if (addr & 0x07) == 0x02 and self.total_cycles * 3 < self.ppu.status_stable_until():
+                # The status flags cannot have changed since the PPU last ran
+                return self.ppu.cpu_read(0x2002)
+            self._catch_up_ppu()
             return self.ppu.cpu_read(0x2000 + (addr % 8))
         elif addr >= 0x4000 and addr <= 0x401F:
             if addr == 0x4014:
@@ -62,33 +133,130 @@ class Bus:
             elif addr == 0x4017:
                 return self.controllers[1].read()
             else:
+                self._catch_up_apu()
                 return self.apu.cpu_read(addr)
         elif addr >= 0x4020:
             if self._cartridge is not None:
                 return self._cartridge.cpu_read(addr)
         return 0
 
+    def _sync_apu(self):
+        cycles = self.total_cycles - self.apu.total_cycles
+        if cycles > 0:
+            self.apu.clock_n(cycles)
+
+    def _sync_ppu(self):
+        self.ppu.run_to(self.total_cycles * 3)
+
+    # The CPU is about to touch a chip's state: bring it up to date and have
+    # its predictions re-evaluated once the current instruction is done. The
+    # PPU otherwise stays idle until a predicted NMI, mapper IRQ or frame end.
+    def _catch_up_apu(self):
+        self._sync_apu()
+        self.scheduler.schedule(EVENT_FRAME_COUNTER, self.total_cycles)
+        self.scheduler.schedule(EVENT_DMC, self.total_cycles)
+
+    def _catch_up_ppu(self):
+        self._sync_ppu()
+        self.scheduler.schedule(EVENT_NMI, self.total_cycles)
+        self.scheduler.schedule(EVENT_MAPPER_IRQ, self.total_cycles)
+
+    def _schedule_apu_events(self):
+        apu = self.apu
+        self.scheduler.schedule(EVENT_FRAME_COUNTER, apu.total_cycles + apu.cycles_to_frame_step())
+        dmc_cycles = apu.cycles_to_dmc_fetch()
+        if dmc_cycles < 0:
+            self.scheduler.cancel(EVENT_DMC)
+        else:
+            self.scheduler.schedule(EVENT_DMC, apu.total_cycles + dmc_cycles)
+
+    def _schedule_ppu_events(self):
+        # PPU timestamps are converted to the first CPU cycle that reaches them
+        for event, ppu_cycle in ((EVENT_NMI, self.ppu.next_nmi_cycle()),
+                                 (EVENT_MAPPER_IRQ, self.ppu.next_irq_cycle())):
+            if ppu_cycle < 0:
+                self.scheduler.cancel(event)
+            else:
+                self.scheduler.schedule(event, (ppu_cycle + 2) // 3)
+
+    def _schedule_nmi_before(self):
+        # A pending ctrl write may enable NMI before the PPU replays it
+        nmi_cycle = self.ppu.next_nmi_cycle()
+        if nmi_cycle >= 0:
+            self.scheduler.schedule_before(EVENT_NMI, (nmi_cycle + 2) // 3)
+
+    def poll_irq(self):
+        # The CPU cleared its I flag, check for a pending IRQ after this instruction
+        self.scheduler.schedule(EVENT_IRQ_POLL, self.total_cycles)
+
+    def skip_idle_loop(self, loop_cycles, reads_status=False):
+        # The CPU is spinning in a loop that can't see a change before the
+        # next event: charge the whole iterations that end before it at once
+        horizon = self.scheduler.next_event
+        if reads_status:
+            # Each iteration's $2002 read has to return the same flags
+            horizon = min(horizon, -(-self.ppu.status_stable_until() // 3))
+        if self.total_cycles < horizon:
+            self.total_cycles += (horizon - 1 - self.total_cycles) // loop_cycles * loop_cycles
+
+    def _irq_pending(self):
+        if self._cartridge is None or self._cartridge.mapper is None:
+            return False
+        return self._cartridge.mapper.irq_active or self.apu.frame_irq_active or self.apu.dmc_irq_active
+
+    def _schedule_irq_poll(self, cpu):
+        # While an interrupt can be taken it has to be checked after every
+        # instruction; a masked IRQ waits for poll_irq()
+        if self.ppu.nmi or (self._irq_pending() and not (cpu.p & 0x04)):
+            self.scheduler.schedule(EVENT_IRQ_POLL, self.total_cycles)
+        else:
+            self.scheduler.cancel(EVENT_IRQ_POLL)
+
+    def _service_events(self, cpu):
+        sched = self.scheduler
+        if self.ppu.nmi:
+            self.ppu.nmi = False
+            self.total_cycles += cpu.nmi()
+
+        now = self.total_cycles
+        apu_due = (sched.is_due(EVENT_FRAME_COUNTER, now) or sched.is_due(EVENT_DMC, now)
+                   or sched.is_due(EVENT_FRAME_END, now))
+        if apu_due:
+            self._sync_apu()
+
+        if self._irq_pending() and not (cpu.p & 0x04):
+            if self._cartridge.mapper.irq_active:
+                self._cartridge.mapper.irq_active = False
+            irq_cycles = cpu.irq()
+            if irq_cycles > 0:
+                self.total_cycles += irq_cycles
+
+        now = self.total_cycles
+        if (sched.is_due(EVENT_NMI, now) or sched.is_due(EVENT_MAPPER_IRQ, now)
+                or sched.is_due(EVENT_FRAME_END, now)):
+            self._sync_ppu()
+            self._schedule_ppu_events()
+        if apu_due:
+            self._schedule_apu_events()
+        self._schedule_irq_poll(cpu)
+
     def run_frame(self, cpu):
-        cycles_this_frame = 0
-        while cycles_this_frame < 29781:
-            instr_cycles = cpu.clock()
-            self.apu.clock_n(instr_cycles)
-            cycles_this_frame += instr_cycles
-
-            if self.ppu.nmi:
-                self.ppu.nmi = False
-                nmi_cycles = cpu.nmi()
-                self.apu.clock_n(nmi_cycles)
-                cycles_this_frame += nmi_cycles
-            
-            if self._cartridge is not None and self._cartridge.mapper is not None:
-                if (self._cartridge.mapper.irq_active or self.apu.frame_irq_active or self.apu.dmc_irq_active) and not (cpu.p & 0x04):
-                    if self._cartridge.mapper.irq_active:
-                        self._cartridge.mapper.irq_active = False
-                    irq_cycles = cpu.irq()
-                    if irq_cycles > 0:
-                        self.apu.clock_n(irq_cycles)
-                        cycles_this_frame += irq_cycles
-
-            # Synchronize PPU with the absolute CPU cycle count
-            self.ppu.run_to(self.apu.total_cycles * 3)
+        sched = self.scheduler
+        self.total_cycles = self.apu.total_cycles
+        frame_end = self.total_cycles + 29781
+        sched.schedule(EVENT_FRAME_END, frame_end)
+        self._sync_ppu()
+        self._schedule_apu_events()
+        self._schedule_ppu_events()
+        self._schedule_irq_poll(cpu)
+
+        cpu.fuse_pairs = True
+        try:
+            while self.total_cycles < frame_end:
+                cpu.run_block()
+                if self.total_cycles >= sched.next_event:
+                    self._service_events(cpu)
+        finally:
+            cpu.fuse_pairs = False
+
+        sched.cancel(EVENT_FRAME_END)
@@ -5,12 +5,19 @@ cdef class Cartridge:
     cdef public object rom
     cdef public str rom_path
     cdef public Mapper mapper
-    cdef public unsigned char[:] prg_memory
-    cdef public unsigned char[:] chr_memory
+    # Read-only when backed by the ROM file mapping
+    cdef public const unsigned char[:] prg_memory
+    cdef const unsigned char[:] _chr_memory
+    cdef public object tiles  # numpy array
+    cdef unsigned char[:, :, ::1] tile_view
     cdef public unsigned char[:] prg_ram
 
     cpdef int cpu_read(self, int addr)
     cpdef int cpu_write(self, int addr, int data)
+    cdef unsigned char* cpu_read_page(self, int page)
+    cdef unsigned char* cpu_write_page(self, int page)
+    cpdef Cartridge clone(self)
+    cpdef list chr_tile_bases(self)
     cpdef int ppu_read(self, int addr)
     cpdef int ppu_write(self, int addr, int data)
     cpdef str get_sram_path(self)
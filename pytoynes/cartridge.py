@@ -1,18 +1,29 @@
+import copy
 import os
-from typing import Optional
+from typing import List, Optional
+import numpy as np
 from .rom import Rom
 from .mapper import Mapper, Mapper000, Mapper001, Mapper002, Mapper003, Mapper004
 
+# Pixel bits of every possible bitplane byte, most significant (leftmost) first
+_PLANE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+
+def decode_tiles(chr_memory) -> np.ndarray:
+    """Decode CHR data into a (num_tiles, 8, 8) array of 2-bit pixel values."""
+    planes = np.frombuffer(bytes(chr_memory), dtype=np.uint8)
+    planes = planes[:len(planes) // 16 * 16].reshape(-1, 2, 8)
+    return _PLANE_BITS[planes[:, 0]] | (_PLANE_BITS[planes[:, 1]] << 1)
+
 class Cartridge:
     def __init__(self, rom_path: str = None):
         self.rom_path = rom_path
         if rom_path is not None:
             self.rom = Rom(rom_path)
-            # make deep copy for reset
-            self.prg_memory = bytearray(self.rom.prg_rom_data)
+            # ROM stays in the read-only file mapping, only RAM is private
+            self.prg_memory = self.rom.prg_rom_data
 
             if self.rom.num_chr_banks > 0:
-                self.chr_memory = bytearray(self.rom.chr_rom_data)
+                self.chr_memory = self.rom.chr_rom_data
             else:
                 self.chr_memory = bytearray(8192)
             
@@ -39,6 +50,46 @@ class Cartridge:
             self.prg_ram = bytearray(8192)
             self.mapper = Mapper000(1, 1)
 
+    @property
+    def prg_memory(self):
+        return self._prg_memory
+
+    @prg_memory.setter
+    def prg_memory(self, prg_memory):
+        self._prg_memory = prg_memory
+        # CPU code translated from prg_memory, see MOS6502.run_block
+        self.blocks = {}
+        self.block_visits = {}
+
+    @property
+    def chr_memory(self):
+        return self._chr_memory
+
+    @chr_memory.setter
+    def chr_memory(self, chr_memory):
+        self._chr_memory = chr_memory
+        # Decoded copy of chr_memory, one 8x8 tile per 16 bytes
+        self.tiles = decode_tiles(chr_memory)
+
+    def clone(self) -> 'Cartridge':
+        """Copy sharing the read-only PRG/CHR-ROM, decoded tiles and translated
+        blocks of the ROM. PRG-RAM, CHR-RAM and the mapper are copied."""
+        clone = copy.copy(self)
+        if isinstance(self._prg_memory, bytearray):
+            # PRG memory written to since loading, with its own translated blocks
+            clone.prg_memory = bytearray(self._prg_memory)
+        clone.prg_ram = bytearray(self.prg_ram)
+        if self.mapper.num_chr_banks == 0:
+            clone._chr_memory = bytearray(self._chr_memory)
+            clone.tiles = self.tiles.copy()
+        clone.mapper = self.mapper.clone()
+        return clone
+
+    def chr_tile_bases(self) -> List[int]:
+        """Index into `tiles` of the first tile in each 1 KB window of PPU
+        $0000-$1FFF, as currently banked in by the mapper."""
+        return [offset >> 4 for offset in self.mapper.chr_offsets]
+
     def cpu_read(self, addr: int):
         mapped_addr = self.mapper.map_cpu_read_addr(addr)
         if mapped_addr != -1:
@@ -53,20 +104,51 @@ class Cartridge:
             if mapped_addr & 0x10000000:
                 self.prg_ram[mapped_addr & 0x0FFFFFFF] = data
                 return data
+            if not isinstance(self._prg_memory, bytearray):
+                # Writing to the ROM image, move to a private copy first
+                self.prg_memory = bytearray(self._prg_memory)
+                self.mapper._bank_switch()
             self.prg_memory[mapped_addr] = data
+            self.blocks.clear()
+            self.block_visits.clear()
             return data
         return 0
 
+    def cpu_read_page(self, page: int) -> Optional[memoryview]:
+        """Return a 256-byte view backing CPU page `page`, or None if the page
+        is unmapped or not contiguous in PRG memory."""
+        base = page << 8
+        mapped_addr = self.mapper.map_cpu_read_addr(base)
+        if mapped_addr == -1 or self.mapper.map_cpu_read_addr(base | 0xFF) != mapped_addr + 0xFF:
+            return None
+        memory = self.prg_memory
+        if mapped_addr & 0x10000000:
+            memory = self.prg_ram
+            mapped_addr &= 0x0FFFFFFF
+        if mapped_addr + 0x100 > len(memory):
+            return None
+        return memoryview(memory)[mapped_addr:mapped_addr + 0x100]
+
+    def cpu_write_page(self, page: int) -> Optional[memoryview]:
+        """Only PRG-RAM pages can be written directly; writes elsewhere may hit
+        mapper registers and have to go through cpu_write."""
+        mapped_addr = self.mapper.map_cpu_read_addr(page << 8)
+        if mapped_addr != -1 and mapped_addr & 0x10000000:
+            return self.cpu_read_page(page)
+        return None
+
     def ppu_read(self, addr: int):
-        mapped_addr = self.mapper.map_ppu_read_addr(addr)
-        if mapped_addr != -1:
-            return self.chr_memory[mapped_addr]
+        if 0x0000 <= addr <= 0x1FFF:
+            return self._chr_memory[self.mapper.chr_offsets[addr >> 10] + (addr & 0x03FF)]
         return -1
 
     def ppu_write(self, addr: int, data: int):
         mapped_addr = self.mapper.map_ppu_write_addr(addr, data)
         if mapped_addr != -1:
-            self.chr_memory[mapped_addr] = data
+            chr_memory = self._chr_memory
+            chr_memory[mapped_addr] = data
+            row = mapped_addr & ~0x08
+            self.tiles[mapped_addr >> 4, row & 0x07] = _PLANE_BITS[chr_memory[row]] | (_PLANE_BITS[chr_memory[row | 0x08]] << 1)
             return data
         return -1
 
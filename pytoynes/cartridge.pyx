@@ -1,17 +1,27 @@
 # cython: language_level=3, boundscheck=False, wraparound=False
 import os
+import numpy as np
 from .rom import Rom
 from .mapper cimport Mapper, Mapper000, Mapper001, Mapper002, Mapper003, Mapper004
 
+# Pixel bits of every possible bitplane byte, most significant (leftmost) first
+_PLANE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+
+def decode_tiles(chr_memory):
+    """Decode CHR data into a (num_tiles, 8, 8) array of 2-bit pixel values."""
+    planes = np.frombuffer(bytes(chr_memory), dtype=np.uint8)
+    planes = planes[:len(planes) // 16 * 16].reshape(-1, 2, 8)
+    return _PLANE_BITS[planes[:, 0]] | (_PLANE_BITS[planes[:, 1]] << 1)
+
 cdef class Cartridge:
     def __init__(self, str rom_path=None):
         self.rom_path = rom_path
         if rom_path is not None:
             self.rom = Rom(rom_path)
-            # make deep copy for reset
-            self.prg_memory = bytearray(self.rom.prg_rom_data)
+            # ROM stays in the read-only file mapping, only RAM is private
+            self.prg_memory = self.rom.prg_rom_data
             if self.rom.num_chr_banks > 0:
-                self.chr_memory = bytearray(self.rom.chr_rom_data)
+                self.chr_memory = self.rom.chr_rom_data
             else:
                 self.chr_memory = bytearray(8192)
             
@@ -39,6 +49,41 @@ cdef class Cartridge:
             self.prg_ram = bytearray(8192)
             self.mapper = Mapper000(1, 1) # Default to mapper 0
 
+    property chr_memory:
+        def __get__(self):
+            return self._chr_memory
+        def __set__(self, val):
+            self._chr_memory = val
+            # Decoded copy of chr_memory, one 8x8 tile per 16 bytes
+            self.tiles = decode_tiles(val)
+            self.tile_view = self.tiles
+
+    cpdef Cartridge clone(self):
+        # Copy sharing the read-only PRG/CHR-ROM and decoded tiles. PRG-RAM,
+        # CHR-RAM and the mapper are copied.
+        cdef Cartridge clone = Cartridge.__new__(Cartridge)
+        clone.rom, clone.rom_path = self.rom, self.rom_path
+        if isinstance(self.prg_memory.base, bytearray):
+            # PRG memory written to since loading
+            clone.prg_memory = bytearray(self.prg_memory)
+        else:
+            clone.prg_memory = self.prg_memory
+        clone.prg_ram = bytearray(self.prg_ram)
+        if self.mapper.num_chr_banks == 0:
+            clone._chr_memory = bytearray(self._chr_memory)
+            clone.tiles = self.tiles.copy()
+        else:
+            clone._chr_memory = self._chr_memory
+            clone.tiles = self.tiles
+        clone.tile_view = clone.tiles
+        clone.mapper = self.mapper.clone()
+        return clone
+
+    cpdef list chr_tile_bases(self):
+        # Index into `tiles` of the first tile in each 1 KB window of PPU
+        # $0000-$1FFF, as currently banked in by the mapper
+        return [self.mapper.chr_offsets[window] >> 4 for window in range(8)]
+
     cpdef int cpu_read(self, int addr):
         cdef int mapped_addr = self.mapper.map_cpu_read_addr(addr)
         if mapped_addr != -1:
@@ -53,20 +98,54 @@ cdef class Cartridge:
             if mapped_addr & 0x10000000:
                 self.prg_ram[mapped_addr & 0x0FFFFFFF] = data
                 return data
-            self.prg_memory[mapped_addr] = data
+            if not isinstance(self.prg_memory.base, bytearray):
+                # Writing to the ROM image, move to a private copy first
+                self.prg_memory = bytearray(self.prg_memory)
+                self.mapper._bank_switch()
+            (<unsigned char*>&self.prg_memory[mapped_addr])[0] = data
             return data
         return 0
 
+    cdef unsigned char* cpu_read_page(self, int page):
+        # Pointer to the 256 bytes backing CPU page `page`, or NULL if the page
+        # is unmapped or not contiguous in PRG memory
+        cdef int base = page << 8
+        cdef int mapped_addr = self.mapper.map_cpu_read_addr(base)
+        if mapped_addr == -1 or self.mapper.map_cpu_read_addr(base | 0xFF) != mapped_addr + 0xFF:
+            return NULL
+        if mapped_addr & 0x10000000:
+            mapped_addr &= 0x0FFFFFFF
+            if mapped_addr + 0x100 > self.prg_ram.shape[0]:
+                return NULL
+            return &self.prg_ram[mapped_addr]
+        if mapped_addr + 0x100 > self.prg_memory.shape[0]:
+            return NULL
+        return <unsigned char*>&self.prg_memory[mapped_addr]
+
+    cdef unsigned char* cpu_write_page(self, int page):
+        # Only PRG-RAM pages can be written directly; writes elsewhere may hit
+        # mapper registers and have to go through cpu_write
+        cdef int mapped_addr = self.mapper.map_cpu_read_addr(page << 8)
+        if mapped_addr != -1 and mapped_addr & 0x10000000:
+            return self.cpu_read_page(page)
+        return NULL
+
     cpdef int ppu_read(self, int addr):
-        cdef int mapped_addr = self.mapper.map_ppu_read_addr(addr)
-        if mapped_addr != -1:
-            return self.chr_memory[mapped_addr]
+        if 0x0000 <= addr <= 0x1FFF:
+            return self._chr_memory[self.mapper.chr_offsets[addr >> 10] + (addr & 0x03FF)]
         return -1 # Correctly return -1 for unmapped PPU addresses
 
     cpdef int ppu_write(self, int addr, int data):
         cdef int mapped_addr = self.mapper.map_ppu_write_addr(addr, data)
+        cdef int row, lo, hi, p
         if mapped_addr != -1:
-            self.chr_memory[mapped_addr] = data
+            # Only CHR-RAM is mapped for writing
+            (<unsigned char*>&self._chr_memory[mapped_addr])[0] = data
+            row = mapped_addr & ~0x08
+            lo = self._chr_memory[row]
+            hi = self._chr_memory[row | 0x08]
+            for p in range(8):
+                self.tile_view[mapped_addr >> 4, row & 0x07, p] = (((hi >> (7 - p)) & 0x01) << 1) | ((lo >> (7 - p)) & 0x01)
             return data
         return -1 # Correctly return -1 for unmapped PPU addresses
 
@@ -0,0 +1,128 @@
+from numbers import Integral
+from typing import Optional, Sequence, Union
+import numpy as np
+from .bus import Bus
+from .cartridge import Cartridge
+from .mos6502 import MOS6502
+from .savestate import StateLayout
+
+# A button mask for the first controller, or one mask per controller
+Inputs = Union[int, Sequence[int]]
+
+
+class Emulator:
+    """Runs a cartridge frame by frame without a window or audio device.
+
+    The frame and audio buffers are views into the PPU and APU, they are only
+    valid until the next step_frame() call. Copy them to keep them around.
+    """
+
+    def __init__(self, rom: Optional[Union[str, Cartridge]] = None):
+        # The console is only built by load()
+        self.cpu: Optional[MOS6502] = None
+        self.bus: Optional[Bus] = None
+        self._state_layout: Optional[StateLayout] = None
+        self._clone_buffer: Optional[bytearray] = None
+        if rom is not None:
+            self.load(rom)
+
+    def _check_loaded(self):
+        if self.bus is None:
+            raise RuntimeError('no ROM loaded, call load() first')
+
+    def load(self, rom: Union[str, Cartridge]):
+        # A new console each time, nothing carries over from the previous ROM
+        cartridge = rom if isinstance(rom, Cartridge) else Cartridge(rom)
+        self.cpu = MOS6502()
+        self.bus = Bus()
+        self.cpu.connect(self.bus)
+        self.bus.cartridge = cartridge
+        self._state_layout = StateLayout(self.cpu, self.bus)
+        self._clone_buffer = None
+        self.reset()
+
+    def reset(self):
+        # Jumps to the reset vector
+        self._check_loaded()
+        self.cpu.reset()
+
+    def set_inputs(self, inputs: Inputs):
+        self._check_loaded()
+        if isinstance(inputs, Integral):
+            inputs = (inputs,)
+        for controller, state in zip(self.bus.controllers, inputs):
+            controller.state = int(state) & 0xFF
+
+    def step_frame(self, inputs: Optional[Inputs] = None):
+        # Inputs are held for the whole frame, None keeps the previous ones
+        self._check_loaded()
+        if inputs is not None:
+            self.set_inputs(inputs)
+        self.bus.apu.audio_ptr = 0
+        self.bus.run_frame(self.cpu)
+
+    def run_frames(self, n: int, inputs: Optional[Inputs] = None):
+        for _ in range(n):
+            self.step_frame(inputs)
+
+    @property
+    def state_size(self) -> int:
+        self._check_loaded()
+        return self._state_layout.size
+
+    def snapshot(self, buffer: Optional[bytearray] = None) -> bytearray:
+        # Pass a buffer of state_size bytes to reuse it instead of allocating
+        self._check_loaded()
+        if buffer is None:
+            buffer = bytearray(self._state_layout.size)
+        self._state_layout.save(buffer)
+        return buffer
+
+    def restore(self, buffer):
+        # The frame and audio buffers are not part of the state, they catch up
+        # with the next frame
+        self._check_loaded()
+        self._state_layout.load(buffer)
+
+    def clone(self, into: Optional['Emulator'] = None) -> 'Emulator':
+        """Copy of this console that runs on independently.
+
+        The clone shares the ROM, decoded CHR-ROM tiles and translated CPU
+        blocks, only the mutable state is copied. Building a new console is
+        the slow part, pass an earlier clone of the same cartridge as `into`
+        to overwrite it in place instead.
+        """
+        self._check_loaded()
+        cartridge = self.bus.cartridge
+        if into is None:
+            into = Emulator(cartridge.clone())
+        elif (into.bus is None or into.bus.cartridge.rom is not cartridge.rom
+              or into.state_size != self.state_size):
+            raise ValueError('can only clone into a console running the same cartridge')
+        if self._clone_buffer is None:
+            self._clone_buffer = bytearray(self.state_size)
+        into._state_layout.load(self.snapshot(self._clone_buffer))
+        np.copyto(into.frame, self.frame)
+        # Skip counting opcode pairs again once the hot ones are fused
+        cpu = self.cpu
+        if cpu.pair_counts is None:
+            into.cpu.fused[:] = cpu.fused
+            into.cpu.pair_counts = None
+        return into
+
+    @property
+    def frame(self) -> np.ndarray:
+        # 240x256 NES palette indices of the last frame
+        self._check_loaded()
+        return self.bus.ppu.pixels
+
+    @property
+    def audio(self) -> np.ndarray:
+        # Mono float32 samples of the last frame
+        self._check_loaded()
+        return np.asarray(self.bus.apu.audio_buffer)[:self.bus.apu.audio_ptr]
+
+    @property
+    def frame_count(self) -> int:
+        self._check_loaded()
+        return self.bus.ppu.frame_count
@@ -0,0 +1,112 @@
+import hashlib
+import os
+import selectors
+import struct
+import sys
+import traceback
+from typing import List, NamedTuple, Optional, Sequence, Tuple
+from .emulator import Emulator, Inputs
+
+# Frame count and RAM digest, followed by the watched bytes
+_HEADER = struct.Struct('<q16s')
+
+
+class BranchResult(NamedTuple):
+    frame_count: int
+    # blake2b digest of the 2 KiB of internal RAM
+    ram_hash: bytes
+    # Values of the watched RAM addresses, in the order they were given
+    watched: bytes
+
+
+class ForkExplorer:
+    """Runs input branches from the current state of a paused emulator.
+
+    Every branch runs in a child forked off this process, so the console,
+    ROM, decoded tiles and translated blocks are inherited copy-on-write
+    instead of being rebuilt or serialized. Children send a small result
+    back over a pipe and exit. At most max_workers of them run at a time.
+    Needs os.fork(), so not available on Windows.
+    """
+
+    def __init__(self, emulator: Emulator, max_workers: Optional[int] = None):
+        if not hasattr(os, 'fork'):
+            raise OSError('ForkExplorer needs os.fork()')
+        self.emulator = emulator
+        self.max_workers = max_workers or os.cpu_count() or 1
+
+    def _run_branch(self, inputs: Sequence[Inputs], addresses: Sequence[int]) -> bytes:
+        emulator = self.emulator
+        for frame_inputs in inputs:
+            emulator.step_frame(frame_inputs)
+        ram = emulator.bus.ram
+        watched = bytes(ram[address & 0x07FF] for address in addresses)
+        digest = hashlib.blake2b(ram, digest_size=16).digest()
+        return _HEADER.pack(emulator.frame_count, digest) + watched
+
+    def _fork(self, inputs: Sequence[Inputs], addresses: Sequence[int]) -> Tuple[int, int]:
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid:
+            os.close(write_fd)
+            return pid, read_fd
+        # Child: never return into the caller's code
+        status = 1
+        try:
+            os.close(read_fd)
+            payload = self._run_branch(inputs, addresses)
+            while payload:
+                payload = payload[os.write(write_fd, payload):]
+            status = 0
+        except BaseException:
+            # The parent only learns that the branch failed, tell why here
+            traceback.print_exc()
+            sys.stderr.flush()
+        finally:
+            os._exit(status)
+
+    def run(self, branches: Sequence[Sequence[Inputs]], addresses: Sequence[int] = ()) -> List[BranchResult]:
+        """Run each branch, a sequence of per frame inputs as accepted by
+        Emulator.step_frame(), and return their results in the same order.
+        The emulator itself is left untouched."""
+        results: List[Optional[BranchResult]] = [None] * len(branches)
+        failed = []
+        selector = selectors.DefaultSelector()
+        # Buffered output would otherwise be written again by every child
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+        def collect_one():
+            # Read the pipes as they fill up, a child only exits once its
+            # result has been taken
+            while True:
+                for key, _ in selector.select():
+                    index, pid, chunks = key.data
+                    chunk = os.read(key.fd, 65536)
+                    if chunk:
+                        chunks.append(chunk)
+                        continue
+                    selector.unregister(key.fd)
+                    os.close(key.fd)
+                    _, status = os.waitpid(pid, 0)
+                    payload = b''.join(chunks)
+                    if status or len(payload) != _HEADER.size + len(addresses):
+                        failed.append(index)
+                    else:
+                        frame_count, digest = _HEADER.unpack_from(payload)
+                        results[index] = BranchResult(frame_count, digest, payload[_HEADER.size:])
+                    return
+
+        try:
+            for index, inputs in enumerate(branches):
+                if len(selector.get_map()) >= self.max_workers:
+                    collect_one()
+                pid, read_fd = self._fork(inputs, addresses)
+                selector.register(read_fd, selectors.EVENT_READ, (index, pid, []))
+        finally:
+            while selector.get_map():
+                collect_one()
+            selector.close()
+        if failed:
+            raise ChildProcessError(f'branches {sorted(failed)} did not finish')
+        return results
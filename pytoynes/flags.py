@@ -0,0 +1,19 @@
+"""Status flag tables shared by the CPU cores and the block translator."""
+import array
+import numpy as np
+
+# Z and N flags of every result byte
+NZ = [(0x02 if v == 0 else 0) | (v & 0x80) for v in range(256)]
+
+_CARRY = np.arange(2, dtype=np.uint16)[:, None, None]
+_A = np.arange(256, dtype=np.uint16)[None, :, None]
+_VALUE = np.arange(256, dtype=np.uint16)[None, None, :]
+_SUM = _A + _VALUE + _CARRY
+
+# ADC of (carry << 16) | (a << 8) | value: the result byte in the high byte,
+# the C, Z, V and N flags in the low one. SBC adds the complemented value.
+ADC = array.array('H', (
+    ((_SUM & 0xFF) << 8) | (_SUM > 0xFF) | np.array(NZ, dtype=np.uint16)[_SUM & 0xFF]
+    | ((~(_A ^ _VALUE) & (_A ^ _SUM) & 0x80) >> 1)
+).astype(np.uint16).tobytes())
+del _CARRY, _A, _VALUE, _SUM
@@ -5,37 +5,45 @@ cdef class Mapper:
     cdef public int num_chr_banks
     cdef public int mirror_mode
     cdef public bint irq_active
+    cdef public object on_bank_switch
+    cdef int prg_offsets[4]
+    cdef int chr_offsets[8]
 
     cpdef int map_cpu_read_addr(self, int addr)
     cpdef int map_cpu_write_addr(self, int addr, int data)
     cpdef int map_ppu_read_addr(self, int addr)
     cpdef int map_ppu_write_addr(self, int addr, int data)
     cpdef void count_scanline(self)
+    cpdef int scanlines_to_irq(self)
+    cpdef bint affects_ppu(self, int addr, int data)
+    cdef void _update_banks(self)
+    cpdef void _bank_switch(self)
+    cpdef Mapper clone(self)
 
 cdef class Mapper000(Mapper):
-    cdef inline int _map_cpu_addr(self, int addr)
+    pass
 
 cdef class Mapper001(Mapper):
-    cdef int shift_reg
-    cdef int shift_count
-    cdef int control_reg
-    cdef int chr_bank0_reg
-    cdef int chr_bank1_reg
-    cdef int prg_bank_reg
+    cdef public int shift_reg
+    cdef public int shift_count
+    cdef public int control_reg
+    cdef public int chr_bank0_reg
+    cdef public int chr_bank1_reg
+    cdef public int prg_bank_reg
 
 cdef class Mapper002(Mapper):
-    cdef int prg_bank_lo
-    cdef int prg_bank_hi
+    cdef public int prg_bank_lo
+    cdef public int prg_bank_hi
 
 cdef class Mapper003(Mapper):
-    cdef int chr_bank
+    cdef public int chr_bank
 
 cdef class Mapper004(Mapper):
-    cdef int target_reg
-    cdef int prg_bank_mode
-    cdef int chr_invert
-    cdef int[8] regs
-    cdef int irq_counter
-    cdef int irq_latch
-    cdef bint irq_enabled
-    cdef bint reload_flag
+    cdef public int target_reg
+    cdef public int prg_bank_mode
+    cdef public int chr_invert
+    cdef public int[8] regs
+    cdef public int irq_counter
+    cdef public int irq_latch
+    cdef public bint irq_enabled
+    cdef public bint reload_flag
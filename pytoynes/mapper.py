@@ -1,3 +1,4 @@
+import copy
 from typing import Optional
 from abc import ABC, abstractmethod
 
@@ -7,18 +8,26 @@ class Mapper(ABC):
         self.num_chr_banks = num_chr_banks
         self.mirror_mode = mirror_mode
         self.irq_active = False
+        # Called after any PRG/CHR bank or mirroring register changes
+        self.on_bank_switch = None
+        # Offset into PRG memory of each 8 KB window at $8000-$FFFF and into
+        # CHR memory of each 1 KB window at $0000-$1FFF
+        self.prg_offsets = [0x0000, 0x2000, 0x4000, 0x6000]
+        self.chr_offsets = [window * 0x0400 for window in range(8)]
 
-    @abstractmethod
     def map_cpu_read_addr(self, addr) -> int:
-        pass
+        if 0x8000 <= addr <= 0xFFFF:
+            return self.prg_offsets[(addr >> 13) & 0x03] + (addr & 0x1FFF)
+        return -1
 
     @abstractmethod
     def map_cpu_write_addr(self, addr, data) -> int:
         pass
 
-    @abstractmethod
     def map_ppu_read_addr(self, addr) -> int:
-        pass
+        if 0x0000 <= addr <= 0x1FFF:
+            return self.chr_offsets[addr >> 10] + (addr & 0x03FF)
+        return -1
 
     @abstractmethod
     def map_ppu_write_addr(self, addr, data) -> int:
@@ -27,23 +36,42 @@ class Mapper(ABC):
     def count_scanline(self):
         pass
 
-class Mapper000(Mapper):
-    def _map_cpu_addr(self, addr: int) -> int:
-        if addr >= 0x8000 and addr <= 0xFFFF:
-            mask = 0x7FFF if self.num_prg_banks > 1 else 0x3FFF
-            return addr & mask
+    def scanlines_to_irq(self) -> int:
+        # Number of count_scanline() calls until irq_active gets set, or -1
         return -1
 
-    def map_cpu_read_addr(self, addr: int) -> int:
-        return self._map_cpu_addr(addr)
+    def affects_ppu(self, addr: int, data: int) -> bool:
+        # Whether a CPU write can change CHR banking, mirroring or the scanline IRQ
+        return addr >= 0x8000
 
-    def map_cpu_write_addr(self, addr: int, data: int) -> int:
-        return self._map_cpu_addr(addr)
+    def _update_banks(self):
+        # Recompute prg_offsets and chr_offsets from the bank registers
+        pass
 
-    def map_ppu_read_addr(self, addr: int) -> int:
-        if addr >= 0x0000 and addr <= 0x1FFF:
-            return addr
-        return -1
+    def _bank_switch(self):
+        self._update_banks()
+        if self.on_bank_switch is not None:
+            self.on_bank_switch()
+
+    def clone(self) -> 'Mapper':
+        # Same registers and banks, not wired to any bus yet
+        clone = copy.copy(self)
+        clone.prg_offsets, clone.chr_offsets = list(self.prg_offsets), list(self.chr_offsets)
+        clone.on_bank_switch = None
+        return clone
+
+class Mapper000(Mapper):
+    def __init__(self, num_prg_banks: int, num_chr_banks: int, mirror_mode: int = 0):
+        super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
+        self._update_banks()
+
+    def _update_banks(self):
+        # NROM-128 mirrors its single 16 KB bank into $C000
+        if self.num_prg_banks <= 1:
+            self.prg_offsets = [0x0000, 0x2000, 0x0000, 0x2000]
+
+    def map_cpu_write_addr(self, addr: int, data: int) -> int:
+        return self.map_cpu_read_addr(addr)
 
     def map_ppu_write_addr(self, addr: int, data: int) -> int:
         if addr >= 0x0000 and addr <= 0x1FFF:
@@ -52,36 +80,42 @@ class Mapper000(Mapper):
                 return addr
         return -1
 
+    def affects_ppu(self, addr: int, data: int) -> bool:
+        return False
+
 class Mapper001(Mapper):
-    def __init__(self, num_prg_banks: int, num_chr_banks: int):
-        super().__init__(num_prg_banks, num_chr_banks)
+    def __init__(self, num_prg_banks: int, num_chr_banks: int, mirror_mode: int = 0):
+        super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
         self.shift_reg = 0x00
         self.shift_count = 0
         self.control_reg = 0x1C
         self.chr_bank0_reg = 0
         self.chr_bank1_reg = 0
         self.prg_bank_reg = 0
-        self.mirror_mode = 0 # Horizontal
+        self._update_banks()
 
-    def map_cpu_read_addr(self, addr: int) -> int:
+    def _update_banks(self):
         prg_mode = (self.control_reg >> 2) & 0x03
-        if 0x8000 <= addr <= 0xFFFF:
-            if prg_mode <= 1: # 32K mode
-                bank = (self.prg_bank_reg & 0x0E)
-                return bank * 0x4000 + (addr & 0x7FFF)
-            elif prg_mode == 2: # Fixed $8000, switch $C000
-                if 0x8000 <= addr <= 0xBFFF:
-                    return 0
-                else:
-                    bank = self.prg_bank_reg & 0x0F
-                    return bank * 0x4000 + (addr & 0x3FFF)
-            elif prg_mode == 3: # Switch $8000, fixed $C000
-                if 0x8000 <= addr <= 0xBFFF:
-                    bank = self.prg_bank_reg & 0x0F
-                    return bank * 0x4000 + (addr & 0x3FFF)
-                else:
-                    return (self.num_prg_banks - 1) * 0x4000 + (addr & 0x3FFF)
-        return -1
+        if prg_mode <= 1: # 32K mode
+            lo = (self.prg_bank_reg & 0x0E) * 0x4000
+            hi = lo + 0x4000
+        elif prg_mode == 2: # Fixed $8000, switch $C000
+            lo = 0
+            hi = (self.prg_bank_reg & 0x0F) * 0x4000
+        else: # Switch $8000, fixed $C000
+            lo = (self.prg_bank_reg & 0x0F) * 0x4000
+            hi = (self.num_prg_banks - 1) * 0x4000
+        self.prg_offsets = [lo, lo + 0x2000, hi, hi + 0x2000]
+
+        if self.num_chr_banks == 0: # CHR RAM
+            lo, hi = 0x0000, 0x1000
+        elif (self.control_reg >> 4) & 0x01 == 0: # 8K mode
+            lo = (self.chr_bank0_reg & 0x1E) * 0x1000
+            hi = lo + 0x1000
+        else: # 4K mode
+            lo = self.chr_bank0_reg * 0x1000
+            hi = self.chr_bank1_reg * 0x1000
+        self.chr_offsets = [lo + window * 0x0400 for window in range(4)] + [hi + window * 0x0400 for window in range(4)]
 
     def map_cpu_write_addr(self, addr: int, data: int) -> int:
         if 0x8000 <= addr <= 0xFFFF:
@@ -89,6 +123,7 @@ class Mapper001(Mapper):
                 self.shift_reg = 0x00
                 self.shift_count = 0
                 self.control_reg |= 0x0C
+                self._bank_switch()
             else:
                 self.shift_reg = (self.shift_reg >> 1) | ((data & 0x01) << 4)
                 self.shift_count += 1
@@ -109,24 +144,14 @@ class Mapper001(Mapper):
                     
                     self.shift_reg = 0x00
                     self.shift_count = 0
+                    self._bank_switch()
         return -1
 
-    def map_ppu_read_addr(self, addr: int) -> int:
-        chr_mode = (self.control_reg >> 4) & 0x01
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.num_chr_banks == 0: # CHR RAM
-                return addr
-            if chr_mode == 0: # 8K mode
-                bank = self.chr_bank0_reg & 0x1E
-                return bank * 0x1000 + addr
-            else: # 4K mode
-                if 0x0000 <= addr <= 0x0FFF:
-                    bank = self.chr_bank0_reg
-                    return bank * 0x1000 + (addr & 0x0FFF)
-                else:
-                    bank = self.chr_bank1_reg
-                    return bank * 0x1000 + (addr & 0x0FFF)
-        return -1
+    def affects_ppu(self, addr: int, data: int) -> bool:
+        if addr < 0x8000:
+            return False
+        # Only a reset or the fifth write commits a register, $E000 is PRG only
+        return bool(data & 0x80) or (self.shift_count == 4 and addr < 0xE000)
 
     def map_ppu_write_addr(self, addr: int, data: int) -> int:
         if 0x0000 <= addr <= 0x1FFF:
@@ -135,27 +160,25 @@ class Mapper001(Mapper):
         return -1
 
 class Mapper002(Mapper):
-    def __init__(self, num_prg_banks: int, num_chr_banks: int):
-        super().__init__(num_prg_banks, num_chr_banks)
+    def __init__(self, num_prg_banks: int, num_chr_banks: int, mirror_mode: int = 0):
+        super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
         self.prg_bank_lo = 0
         self.prg_bank_hi = num_prg_banks - 1
+        self._update_banks()
 
-    def map_cpu_read_addr(self, addr: int) -> int:
-        if 0x8000 <= addr <= 0xBFFF:
-            return self.prg_bank_lo * 0x4000 + (addr & 0x3FFF)
-        if 0xC000 <= addr <= 0xFFFF:
-            return self.prg_bank_hi * 0x4000 + (addr & 0x3FFF)
-        return -1
+    def _update_banks(self):
+        lo = self.prg_bank_lo * 0x4000
+        hi = self.prg_bank_hi * 0x4000
+        self.prg_offsets = [lo, lo + 0x2000, hi, hi + 0x2000]
 
     def map_cpu_write_addr(self, addr: int, data: int) -> int:
         if 0x8000 <= addr <= 0xFFFF:
             self.prg_bank_lo = data & 0x0F
+            self._bank_switch()
         return -1
 
-    def map_ppu_read_addr(self, addr: int) -> int:
-        if 0x0000 <= addr <= 0x1FFF:
-            return addr
-        return -1
+    def affects_ppu(self, addr: int, data: int) -> bool:
+        return False
 
     def map_ppu_write_addr(self, addr: int, data: int) -> int:
         if 0x0000 <= addr <= 0x1FFF:
@@ -164,32 +187,28 @@ class Mapper002(Mapper):
         return -1
 
 class Mapper003(Mapper):
-    def __init__(self, num_prg_banks: int, num_chr_banks: int):
-        super().__init__(num_prg_banks, num_chr_banks)
+    def __init__(self, num_prg_banks: int, num_chr_banks: int, mirror_mode: int = 0):
+        super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
         self.chr_bank = 0
+        self._update_banks()
 
-    def map_cpu_read_addr(self, addr: int) -> int:
-        mask = 0x7FFF if self.num_prg_banks > 1 else 0x3FFF
-        if addr >= 0x8000 and addr <= 0xFFFF:
-            return addr & mask
-        return -1
+    def _update_banks(self):
+        if self.num_prg_banks <= 1:
+            self.prg_offsets = [0x0000, 0x2000, 0x0000, 0x2000]
+        self.chr_offsets = [self.chr_bank * 0x2000 + window * 0x0400 for window in range(8)]
 
     def map_cpu_write_addr(self, addr: int, data: int) -> int:
         if 0x8000 <= addr <= 0xFFFF:
             self.chr_bank = data & 0x03
-        return -1
-
-    def map_ppu_read_addr(self, addr: int) -> int:
-        if 0x0000 <= addr <= 0x1FFF:
-            return self.chr_bank * 0x2000 + addr
+            self._bank_switch()
         return -1
 
     def map_ppu_write_addr(self, addr: int, data: int) -> int:
         return -1
 
 class Mapper004(Mapper):
-    def __init__(self, num_prg_banks: int, num_chr_banks: int):
-        super().__init__(num_prg_banks, num_chr_banks)
+    def __init__(self, num_prg_banks: int, num_chr_banks: int, mirror_mode: int = 0):
+        super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
         self.target_reg = 0
         self.prg_bank_mode = 0
         self.chr_invert = 0
@@ -198,21 +217,23 @@ class Mapper004(Mapper):
         self.irq_latch = 0
         self.irq_enabled = False
         self.irq_active = False
-        self.mirror_mode = 0
+        self._update_banks()
 
-    def map_cpu_read_addr(self, addr: int) -> int:
-        if 0x8000 <= addr <= 0x9FFF:
-            bank = self.regs[6] if self.prg_bank_mode == 0 else (self.num_prg_banks * 2 - 2)
-            return bank * 0x2000 + (addr & 0x1FFF)
-        if 0xA000 <= addr <= 0xBFFF:
-            bank = self.regs[7]
-            return bank * 0x2000 + (addr & 0x1FFF)
-        if 0xC000 <= addr <= 0xDFFF:
-            bank = (self.num_prg_banks * 2 - 2) if self.prg_bank_mode == 0 else self.regs[6]
-            return bank * 0x2000 + (addr & 0x1FFF)
-        if 0xE000 <= addr <= 0xFFFF:
-            return (self.num_prg_banks * 2 - 1) * 0x2000 + (addr & 0x1FFF)
-        return -1
+    def _update_banks(self):
+        regs = self.regs
+        second_last = self.num_prg_banks * 2 - 2
+        if self.prg_bank_mode == 0:
+            banks = (regs[6], regs[7], second_last, second_last + 1)
+        else:
+            banks = (second_last, regs[7], regs[6], second_last + 1)
+        self.prg_offsets = [bank * 0x2000 for bank in banks]
+
+        # Two 2 KB banks and four 1 KB banks, swapped when CHR A12 is inverted
+        banks = (regs[0] & 0xFE, regs[0] | 0x01, regs[1] & 0xFE, regs[1] | 0x01,
+                 regs[2], regs[3], regs[4], regs[5])
+        if self.chr_invert:
+            banks = banks[4:] + banks[:4]
+        self.chr_offsets = [bank * 0x0400 for bank in banks]
 
     def map_cpu_write_addr(self, addr: int, data: int) -> int:
         if 0x8000 <= addr <= 0x9FFF:
@@ -222,9 +243,11 @@ class Mapper004(Mapper):
                 self.chr_invert = (data >> 7) & 0x01
             else: # $8001
                 self.regs[self.target_reg] = data
+            self._bank_switch()
         elif 0xA000 <= addr <= 0xBFFF:
             if not (addr & 0x01): # $A000
                 self.mirror_mode = 0 if (data & 0x01) else 1 # 0: HORIZ, 1: VERT
+                self._bank_switch()
         elif 0xC000 <= addr <= 0xDFFF:
             if not (addr & 0x01): # $C000
                 self.irq_latch = data
@@ -238,29 +261,23 @@ class Mapper004(Mapper):
                 self.irq_enabled = True
         return -1
 
-    def map_ppu_read_addr(self, addr: int) -> int:
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.chr_invert == 0:
-                if 0x0000 <= addr <= 0x07FF: return (self.regs[0] & 0xFE) * 0x0400 + (addr & 0x07FF)
-                if 0x0800 <= addr <= 0x0FFF: return (self.regs[1] & 0xFE) * 0x0400 + (addr & 0x07FF)
-                if 0x1000 <= addr <= 0x13FF: return self.regs[2] * 0x0400 + (addr & 0x03FF)
-                if 0x1400 <= addr <= 0x17FF: return self.regs[3] * 0x0400 + (addr & 0x03FF)
-                if 0x1800 <= addr <= 0x1BFF: return self.regs[4] * 0x0400 + (addr & 0x03FF)
-                if 0x1C00 <= addr <= 0x1FFF: return self.regs[5] * 0x0400 + (addr & 0x03FF)
-            else:
-                if 0x0000 <= addr <= 0x03FF: return self.regs[2] * 0x0400 + (addr & 0x03FF)
-                if 0x0400 <= addr <= 0x07FF: return self.regs[3] * 0x0400 + (addr & 0x03FF)
-                if 0x0800 <= addr <= 0x0BFF: return self.regs[4] * 0x0400 + (addr & 0x03FF)
-                if 0x0C00 <= addr <= 0x0FFF: return self.regs[5] * 0x0400 + (addr & 0x03FF)
-                if 0x1000 <= addr <= 0x17FF: return (self.regs[0] & 0xFE) * 0x0400 + (addr & 0x07FF)
-                if 0x1800 <= addr <= 0x1FFF: return (self.regs[1] & 0xFE) * 0x0400 + (addr & 0x07FF)
-        return -1
+    def affects_ppu(self, addr: int, data: int) -> bool:
+        if addr < 0x8000:
+            return False
+        if addr <= 0x9FFF and (addr & 0x01):
+            return self.target_reg < 6 # R6/R7 only switch PRG banks
+        return not (0xA000 <= addr <= 0xBFFF and (addr & 0x01)) # $A001 is PRG-RAM protect
 
     def map_ppu_write_addr(self, addr: int, data: int) -> int:
         if 0x0000 <= addr <= 0x1FFF:
             if self.num_chr_banks == 0: return addr
         return -1
 
+    def clone(self) -> 'Mapper004':
+        clone = super().clone()
+        clone.regs = list(self.regs)
+        return clone
+
     def count_scanline(self):
         if self.irq_counter == 0:
             self.irq_counter = self.irq_latch
@@ -270,3 +287,10 @@ class Mapper004(Mapper):
         if self.irq_counter == 0:
             if self.irq_enabled:
                 self.irq_active = True
+
+    def scanlines_to_irq(self) -> int:
+        if not self.irq_enabled:
+            return -1
+        if self.irq_counter == 0:
+            return self.irq_latch + 1
+        return self.irq_counter
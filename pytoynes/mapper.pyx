@@ -1,18 +1,33 @@
 # cython: language_level=3, boundscheck=False, wraparound=False
+import copy
+
 cdef class Mapper:
     def __init__(self, int num_prg_banks, int num_chr_banks, int mirror_mode=0):
         self.num_prg_banks = num_prg_banks
         self.num_chr_banks = num_chr_banks
         self.mirror_mode = mirror_mode
         self.irq_active = False
+        # Called after any PRG/CHR bank or mirroring register changes
+        self.on_bank_switch = None
+        # Offset into PRG memory of each 8 KB window at $8000-$FFFF and into
+        # CHR memory of each 1 KB window at $0000-$1FFF
+        cdef int window
+        for window in range(4):
+            self.prg_offsets[window] = window * 0x2000
+        for window in range(8):
+            self.chr_offsets[window] = window * 0x0400
 
     cpdef int map_cpu_read_addr(self, int addr):
+        if 0x8000 <= addr <= 0xFFFF:
+            return self.prg_offsets[(addr >> 13) & 0x03] + (addr & 0x1FFF)
         return -1
 
     cpdef int map_cpu_write_addr(self, int addr, int data):
         return -1
 
     cpdef int map_ppu_read_addr(self, int addr):
+        if 0x0000 <= addr <= 0x1FFF:
+            return self.chr_offsets[addr >> 10] + (addr & 0x03FF)
         return -1
 
     cpdef int map_ppu_write_addr(self, int addr, int data):
@@ -21,24 +36,42 @@ cdef class Mapper:
     cpdef void count_scanline(self):
         pass
 
-cdef class Mapper000(Mapper):
-    cdef inline int _map_cpu_addr(self, int addr):
-        cdef int mask
-        if addr >= 0x8000 and addr <= 0xFFFF:
-            mask = 0x7FFF if self.num_prg_banks > 1 else 0x3FFF
-            return addr & mask
+    cpdef int scanlines_to_irq(self):
+        # Number of count_scanline() calls until irq_active gets set, or -1
         return -1
 
-    cpdef int map_cpu_read_addr(self, int addr):
-        return self._map_cpu_addr(addr)
+    cpdef bint affects_ppu(self, int addr, int data):
+        # Whether a CPU write can change CHR banking, mirroring or the scanline IRQ
+        return addr >= 0x8000
 
-    cpdef int map_cpu_write_addr(self, int addr, int data):
-        return self._map_cpu_addr(addr)
+    cdef void _update_banks(self):
+        # Recompute prg_offsets and chr_offsets from the bank registers
+        pass
 
-    cpdef int map_ppu_read_addr(self, int addr):
-        if addr >= 0x0000 and addr <= 0x1FFF:
-            return addr
-        return -1
+    cpdef void _bank_switch(self):
+        self._update_banks()
+        if self.on_bank_switch is not None:
+            self.on_bank_switch()
+
+    cpdef Mapper clone(self):
+        # Same registers and banks, not wired to any bus yet
+        cdef Mapper clone = copy.copy(self)
+        clone.on_bank_switch = None
+        return clone
+
+cdef class Mapper000(Mapper):
+    def __init__(self, int num_prg_banks, int num_chr_banks, int mirror_mode=0):
+        super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
+        self._update_banks()
+
+    cdef void _update_banks(self):
+        # NROM-128 mirrors its single 16 KB bank into $C000
+        if self.num_prg_banks <= 1:
+            self.prg_offsets[2] = 0x0000
+            self.prg_offsets[3] = 0x2000
+
+    cpdef int map_cpu_write_addr(self, int addr, int data):
+        return self.map_cpu_read_addr(addr)
 
     cpdef int map_ppu_write_addr(self, int addr, int data):
         if addr >= 0x0000 and addr <= 0x1FFF:
@@ -47,6 +80,9 @@ cdef class Mapper000(Mapper):
                 return addr
         return -1
 
+    cpdef bint affects_ppu(self, int addr, int data):
+        return False
+
 cdef class Mapper001(Mapper):
     def __init__(self, int num_prg_banks, int num_chr_banks, int mirror_mode=0):
         super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
@@ -56,31 +92,43 @@ cdef class Mapper001(Mapper):
         self.chr_bank0_reg = 0
         self.chr_bank1_reg = 0
         self.prg_bank_reg = 0
+        self._update_banks()
 
-    cpdef int map_cpu_read_addr(self, int addr):
+    cdef void _update_banks(self):
         cdef int prg_mode = (self.control_reg >> 2) & 0x03
-        cdef int bank
+        cdef int lo, hi, window
+
+        if prg_mode <= 1: # 32K mode
+            lo = (self.prg_bank_reg & 0x0E) * 0x4000
+            hi = lo + 0x4000
+        elif prg_mode == 2: # Fixed $8000, switch $C000
+            lo = 0
+            hi = (self.prg_bank_reg & 0x0F) * 0x4000
+        else: # Switch $8000, fixed $C000
+            lo = (self.prg_bank_reg & 0x0F) * 0x4000
+            hi = (self.num_prg_banks - 1) * 0x4000
+        self.prg_offsets[0] = lo
+        self.prg_offsets[1] = lo + 0x2000
+        self.prg_offsets[2] = hi
+        self.prg_offsets[3] = hi + 0x2000
+
+        if self.num_chr_banks == 0: # CHR RAM
+            lo = 0x0000
+            hi = 0x1000
+        elif (self.control_reg >> 4) & 0x01 == 0: # 8K mode
+            lo = (self.chr_bank0_reg & 0x1E) * 0x1000
+            hi = lo + 0x1000
+        else: # 4K mode
+            lo = self.chr_bank0_reg * 0x1000
+            hi = self.chr_bank1_reg * 0x1000
+        for window in range(4):
+            self.chr_offsets[window] = lo + window * 0x0400
+            self.chr_offsets[window + 4] = hi + window * 0x0400
 
+    cpdef int map_cpu_read_addr(self, int addr):
         if 0x6000 <= addr <= 0x7FFF:
             return (addr & 0x1FFF) | 0x10000000
-
-        if 0x8000 <= addr <= 0xFFFF:
-            if prg_mode <= 1: # 32K mode
-                bank = (self.prg_bank_reg & 0x0E)
-                return bank * 0x4000 + (addr & 0x7FFF)
-            elif prg_mode == 2: # Fixed $8000, switch $C000
-                if 0x8000 <= addr <= 0xBFFF:
-                    return addr & 0x3FFF
-                else:
-                    bank = self.prg_bank_reg & 0x0F
-                    return bank * 0x4000 + (addr & 0x3FFF)
-            elif prg_mode == 3: # Switch $8000, fixed $C000
-                if 0x8000 <= addr <= 0xBFFF:
-                    bank = self.prg_bank_reg & 0x0F
-                    return bank * 0x4000 + (addr & 0x3FFF)
-                else:
-                    return (self.num_prg_banks - 1) * 0x4000 + (addr & 0x3FFF)
-        return -1
+        return Mapper.map_cpu_read_addr(self, addr)
 
     cpdef int map_cpu_write_addr(self, int addr, int data):
         if 0x6000 <= addr <= 0x7FFF:
@@ -91,6 +139,7 @@ cdef class Mapper001(Mapper):
                 self.shift_reg = 0x00
                 self.shift_count = 0
                 self.control_reg |= 0x0C
+                self._bank_switch()
             else:
                 self.shift_reg = (self.shift_reg >> 1) | ((data & 0x01) << 4)
                 self.shift_count += 1
@@ -111,27 +160,14 @@ cdef class Mapper001(Mapper):
 
                     self.shift_reg = 0x00
                     self.shift_count = 0
+                    self._bank_switch()
         return -1
 
-    cpdef int map_ppu_read_addr(self, int addr):
-        cdef int chr_mode = (self.control_reg >> 4) & 0x01
-        cdef int bank
-
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.num_chr_banks == 0: # CHR RAM
-                return addr
-
-            if chr_mode == 0: # 8K mode
-                bank = self.chr_bank0_reg & 0x1E
-                return bank * 0x1000 + addr
-            else: # 4K mode
-                if 0x0000 <= addr <= 0x0FFF:
-                    bank = self.chr_bank0_reg
-                    return bank * 0x1000 + (addr & 0x0FFF)
-                else:
-                    bank = self.chr_bank1_reg
-                    return bank * 0x1000 + (addr & 0x0FFF)
-        return -1
+    cpdef bint affects_ppu(self, int addr, int data):
+        if addr < 0x8000:
+            return False
+        # Only a reset or the fifth write commits a register, $E000 is PRG only
+        return (data & 0x80) != 0 or (self.shift_count == 4 and addr < 0xE000)
 
     cpdef int map_ppu_write_addr(self, int addr, int data):
         if 0x0000 <= addr <= 0x1FFF:
@@ -144,23 +180,22 @@ cdef class Mapper002(Mapper):
         super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
         self.prg_bank_lo = 0
         self.prg_bank_hi = num_prg_banks - 1
+        self._update_banks()
 
-    cpdef int map_cpu_read_addr(self, int addr):
-        if 0x8000 <= addr <= 0xBFFF:
-            return self.prg_bank_lo * 0x4000 + (addr & 0x3FFF)
-        if 0xC000 <= addr <= 0xFFFF:
-            return self.prg_bank_hi * 0x4000 + (addr & 0x3FFF)
-        return -1
+    cdef void _update_banks(self):
+        self.prg_offsets[0] = self.prg_bank_lo * 0x4000
+        self.prg_offsets[1] = self.prg_bank_lo * 0x4000 + 0x2000
+        self.prg_offsets[2] = self.prg_bank_hi * 0x4000
+        self.prg_offsets[3] = self.prg_bank_hi * 0x4000 + 0x2000
 
     cpdef int map_cpu_write_addr(self, int addr, int data):
         if 0x8000 <= addr <= 0xFFFF:
             self.prg_bank_lo = data & 0x0F
+            self._bank_switch()
         return -1
 
-    cpdef int map_ppu_read_addr(self, int addr):
-        if 0x0000 <= addr <= 0x1FFF:
-            return addr
-        return -1
+    cpdef bint affects_ppu(self, int addr, int data):
+        return False
 
     cpdef int map_ppu_write_addr(self, int addr, int data):
         if 0x0000 <= addr <= 0x1FFF:
@@ -172,21 +207,20 @@ cdef class Mapper003(Mapper):
     def __init__(self, int num_prg_banks, int num_chr_banks, int mirror_mode=0):
         super().__init__(num_prg_banks, num_chr_banks, mirror_mode)
         self.chr_bank = 0
+        self._update_banks()
 
-    cpdef int map_cpu_read_addr(self, int addr):
-        cdef int mask = 0x7FFF if self.num_prg_banks > 1 else 0x3FFF
-        if addr >= 0x8000 and addr <= 0xFFFF:
-            return addr & mask
-        return -1
+    cdef void _update_banks(self):
+        cdef int window
+        if self.num_prg_banks <= 1:
+            self.prg_offsets[2] = 0x0000
+            self.prg_offsets[3] = 0x2000
+        for window in range(8):
+            self.chr_offsets[window] = self.chr_bank * 0x2000 + window * 0x0400
 
     cpdef int map_cpu_write_addr(self, int addr, int data):
         if 0x8000 <= addr <= 0xFFFF:
             self.chr_bank = data & 0x03
-        return -1
-
-    cpdef int map_ppu_read_addr(self, int addr):
-        if 0x0000 <= addr <= 0x1FFF:
-            return self.chr_bank * 0x2000 + addr
+            self._bank_switch()
         return -1
 
     cpdef int map_ppu_write_addr(self, int addr, int data):
@@ -206,26 +240,39 @@ cdef class Mapper004(Mapper):
         self.irq_enabled = False
         self.irq_active = False
         self.reload_flag = False
+        self._update_banks()
 
-    cpdef int map_cpu_read_addr(self, int addr):
-        cdef int bank
+    cdef void _update_banks(self):
         cdef int prg_banks = self.num_prg_banks * 2
         cdef int prg_mask = prg_banks - 1
-        
+        cdef int chr_mask = self.num_chr_banks * 8 - 1
+        cdef int window, swap
+        cdef int banks[8]
+
+        self.prg_offsets[0] = ((self.regs[6] if self.prg_bank_mode == 0 else (prg_banks - 2)) & prg_mask) * 0x2000
+        self.prg_offsets[1] = (self.regs[7] & prg_mask) * 0x2000
+        self.prg_offsets[2] = (((prg_banks - 2) if self.prg_bank_mode == 0 else self.regs[6]) & prg_mask) * 0x2000
+        self.prg_offsets[3] = (prg_banks - 1) * 0x2000
+
+        if self.num_chr_banks == 0: # CHR RAM
+            for window in range(8):
+                self.chr_offsets[window] = window * 0x0400
+            return
+        # Two 2 KB banks and four 1 KB banks, swapped when CHR A12 is inverted
+        banks[0] = (self.regs[0] & 0xFE) & chr_mask
+        banks[1] = banks[0] + 1
+        banks[2] = (self.regs[1] & 0xFE) & chr_mask
+        banks[3] = banks[2] + 1
+        for window in range(4):
+            banks[window + 4] = self.regs[window + 2] & chr_mask
+        swap = 4 if self.chr_invert else 0
+        for window in range(8):
+            self.chr_offsets[window] = banks[(window + swap) & 0x07] * 0x0400
+
+    cpdef int map_cpu_read_addr(self, int addr):
         if 0x6000 <= addr <= 0x7FFF:
             return (addr & 0x1FFF) | 0x10000000
-        if 0x8000 <= addr <= 0x9FFF:
-            bank = self.regs[6] if self.prg_bank_mode == 0 else (prg_banks - 2)
-            return (bank & prg_mask) * 0x2000 + (addr & 0x1FFF)
-        if 0xA000 <= addr <= 0xBFFF:
-            bank = self.regs[7]
-            return (bank & prg_mask) * 0x2000 + (addr & 0x1FFF)
-        if 0xC000 <= addr <= 0xDFFF:
-            bank = (prg_banks - 2) if self.prg_bank_mode == 0 else self.regs[6]
-            return (bank & prg_mask) * 0x2000 + (addr & 0x1FFF)
-        if 0xE000 <= addr <= 0xFFFF:
-            return (prg_banks - 1) * 0x2000 + (addr & 0x1FFF)
-        return -1
+        return Mapper.map_cpu_read_addr(self, addr)
 
     cpdef int map_cpu_write_addr(self, int addr, int data):
         if 0x6000 <= addr <= 0x7FFF:
@@ -237,10 +284,12 @@ cdef class Mapper004(Mapper):
                 self.chr_invert = (data >> 7) & 0x01
             else: # $8001
                 self.regs[self.target_reg] = data
+            self._bank_switch()
         elif 0xA000 <= addr <= 0xBFFF:
             if not (addr & 0x01): # $A000
                 # Bit 0: 0=Vert, 1=Horiz. Our rom.MirrorMode: HORIZ=0, VERT=1
                 self.mirror_mode = 1 if (data & 0x01 == 0) else 0
+                self._bank_switch()
         elif 0xC000 <= addr <= 0xDFFF:
             if not (addr & 0x01): # $C000
                 self.irq_latch = data
@@ -254,25 +303,12 @@ cdef class Mapper004(Mapper):
                 self.irq_enabled = True
         return -1
 
-    cpdef int map_ppu_read_addr(self, int addr):
-        cdef int mask = self.num_chr_banks * 8 - 1
-        if 0x0000 <= addr <= 0x1FFF:
-            if self.num_chr_banks == 0: return addr
-            if self.chr_invert == 0:
-                if 0x0000 <= addr <= 0x07FF: return ((self.regs[0] & 0xFE) & mask) * 0x0400 + (addr & 0x07FF)
-                if 0x0800 <= addr <= 0x0FFF: return ((self.regs[1] & 0xFE) & mask) * 0x0400 + (addr & 0x07FF)
-                if 0x1000 <= addr <= 0x13FF: return (self.regs[2] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x1400 <= addr <= 0x17FF: return (self.regs[3] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x1800 <= addr <= 0x1BFF: return (self.regs[4] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x1C00 <= addr <= 0x1FFF: return (self.regs[5] & mask) * 0x0400 + (addr & 0x03FF)
-            else:
-                if 0x0000 <= addr <= 0x03FF: return (self.regs[2] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x0400 <= addr <= 0x07FF: return (self.regs[3] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x0800 <= addr <= 0x0BFF: return (self.regs[4] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x0C00 <= addr <= 0x0FFF: return (self.regs[5] & mask) * 0x0400 + (addr & 0x03FF)
-                if 0x1000 <= addr <= 0x17FF: return ((self.regs[0] & 0xFE) & mask) * 0x0400 + (addr & 0x07FF)
-                if 0x1800 <= addr <= 0x1FFF: return ((self.regs[1] & 0xFE) & mask) * 0x0400 + (addr & 0x07FF)
-        return -1
+    cpdef bint affects_ppu(self, int addr, int data):
+        if addr < 0x8000:
+            return False
+        if addr <= 0x9FFF and (addr & 0x01):
+            return self.target_reg < 6 # R6/R7 only switch PRG banks
+        return not (0xA000 <= addr <= 0xBFFF and (addr & 0x01)) # $A001 is PRG-RAM protect
 
     cpdef int map_ppu_write_addr(self, int addr, int data):
         if 0x0000 <= addr <= 0x1FFF:
@@ -288,3 +324,10 @@ cdef class Mapper004(Mapper):
         
         if self.irq_counter == 0 and self.irq_enabled:
             self.irq_active = True
+
+    cpdef int scanlines_to_irq(self):
+        if not self.irq_enabled:
+            return -1
+        if self.irq_counter == 0 or self.reload_flag:
+            return self.irq_latch + 1
+        return self.irq_counter
@@ -1,4 +1,5 @@
 # cython: language_level=3
+from cpython cimport array
 from .bus cimport Bus
 
 cdef class MOS6502:
@@ -9,6 +10,10 @@ cdef class MOS6502:
     cdef public bint jammed, _fetch_from_mem
     cdef public object on_opcode_loaded
     cdef public list opcode_table
+    cdef public array.array pair_counts
+    cdef public bytearray fused
+    cdef public bint fuse_pairs
+    cdef int _pairs_left, _previous_opcode
 
     cpdef int clock(self)
     cpdef void connect(self, Bus bus)
@@ -19,6 +24,8 @@ cdef class MOS6502:
     cpdef int all_status_as_int(self)
     cpdef void restore_all_status_from_int(self, int status_int)
 
+    cdef void _count_pair(self)
+    cdef int _run_fused(self)
     cdef int fetch(self)
     cdef void _push_to_stack(self, int data)
     cdef int _pop_from_stack(self)
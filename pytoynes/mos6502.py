@@ -1,6 +1,26 @@
+import array
 from enum import IntEnum
-from typing import Callable, Optional
+from typing import Callable, List, Optional
 from .bus import Bus
+from .flags import NZ, ADC
+from .translate import translate_block
+
+# Times the code at a PRG-ROM address is interpreted before it gets translated
+TRANSLATE_AFTER = 4
+
+# Instructions whose opcode pairs are counted before the hot ones get fused
+PAIR_COUNT_WINDOW = 1 << 18
+
+# Cycles of the opcodes that can be fused with the instruction after them.
+# They only touch registers and zero page, so they can't move an event.
+_FUSABLE = {0xA9: 2, 0xA5: 3, 0xA2: 2, 0xA6: 3, 0xA0: 2, 0xA4: 3, 0x29: 2, 0x09: 2, 0x49: 2,
+            0xC9: 2, 0xC5: 3, 0xE0: 2, 0xE4: 3, 0xC0: 2, 0xC4: 3, 0x24: 3,
+            0xE8: 2, 0xC8: 2, 0xCA: 2, 0x88: 2}
+# Branches, zero page stores, AND # and STA abs run in the same step as a
+# fused opcode, the last one only when it stores into internal RAM
+_FUSED_SECONDS = (0x10, 0x30, 0x50, 0x70, 0x90, 0xB0, 0xD0, 0xF0, 0x84, 0x85, 0x86, 0x29, 0x8D)
+# Flag tested by a branch, by the top two bits of its opcode
+_BRANCH_FLAGS = (0x80, 0x40, 0x01, 0x02)
 
 class Status(IntEnum):
     C = 1
@@ -30,6 +50,14 @@ class MOS6502:
         self.jammed = False
         self.on_opcode_loaded = None
         self._fetch_from_mem = True
+        # Opcode pairs seen by clock() until fuse_hot_pairs() picks the fusions
+        self.pair_counts = array.array('I', [0]) * 0x10000
+        self._pairs_left = PAIR_COUNT_WINDOW
+        self._previous_opcode = 0
+        self.fused = bytearray(256)
+        # Set by Bus.run_frame while the scheduler drives the CPU, the only
+        # time clock() may run a fused pair
+        self.fuse_pairs = False
         
         # Optimized opcode dispatch table
         self.opcode_table = [None] * 256
@@ -312,10 +340,16 @@ class MOS6502:
         self.bus = bus
 
     def clock(self) -> int:
+        """Run one instruction and return its cycles. While fuse_pairs is set,
+        a fused opcode and the branch or store after it retire together."""
         if self.jammed: return 1
         
         self.opcode = self.bus.read(self.pc)
         if self.on_opcode_loaded: self.on_opcode_loaded()
+        elif self.pair_counts is not None: self._count_pair()
+        elif self.fuse_pairs and self.fused[self.opcode]:
+            cycles = self._run_fused()
+            if cycles: return cycles
         self.pc += 1
         
         entry = self.opcode_table[self.opcode]
@@ -332,6 +366,125 @@ class MOS6502:
         total_cycles = cycles + (extra1 & extra2) + self._extra_cycles
         return total_cycles
 
+    def _count_pair(self):
+        self.pair_counts[(self._previous_opcode << 8) | self.opcode] += 1
+        self._previous_opcode = self.opcode
+        self._pairs_left -= 1
+        if not self._pairs_left:
+            self.fuse_hot_pairs()
+
+    def fuse_hot_pairs(self, min_share: float = 0.001) -> List[int]:
+        """Fuse the opcodes that ran at least `min_share` of the counted
+        instructions and were mostly followed by a branch or a zero page
+        store. Ends the count and returns the fused opcodes."""
+        counts = self.pair_counts
+        total = sum(counts)
+        self.fused = bytearray(256)
+        for opcode in _FUSABLE:
+            row = counts[opcode << 8:(opcode + 1) << 8]
+            runs = sum(row)
+            if runs and runs >= total * min_share and 2 * sum(row[second] for second in _FUSED_SECONDS) >= runs:
+                self.fused[opcode] = 1
+        self.pair_counts = None
+        return [opcode for opcode in range(256) if self.fused[opcode]]
+
+    def _run_fused(self):
+        # Runs a fused opcode and, if it is followed by one, a branch, zero
+        # page store, AND # or STA abs to RAM in one step. Returns 0 if the next
+        # scheduled event could fall between them or the code runs into the
+        # I/O registers.
+        bus, opcode, pc = self.bus, self.opcode, self.pc
+        cycles = _FUSABLE[opcode]
+        if bus.total_cycles + cycles >= bus.scheduler.next_event or 0x1FFC <= pc < 0x4020:
+            return 0
+        if opcode in (0xE8, 0xC8, 0xCA, 0x88):
+            self.pc = pc + 1
+            if opcode == 0xE8: self.x = value = (self.x + 1) & 0xFF
+            elif opcode == 0xC8: self.y = value = (self.y + 1) & 0xFF
+            elif opcode == 0xCA: self.x = value = (self.x - 1) & 0xFF
+            else: self.y = value = (self.y - 1) & 0xFF
+            self.p = (self.p & 0x7D) | NZ[value]
+        else:
+            value = bus.read(pc + 1)
+            self.pc = pc + 2
+            if cycles == 3:
+                value = bus.read(value)
+            if opcode in (0xC9, 0xC5, 0xE0, 0xE4, 0xC0, 0xC4):
+                if opcode in (0xC9, 0xC5): reg = self.a
+                elif opcode in (0xE0, 0xE4): reg = self.x
+                else: reg = self.y
+                self.p = (self.p & 0x7C) | (reg >= value) | NZ[(reg - value) & 0xFF]
+            elif opcode == 0x24:
+                self.p = (self.p & 0x3D) | (0 if self.a & value else 0x02) | (value & 0xC0)
+            else:
+                if opcode in (0xA9, 0xA5): self.a = value
+                elif opcode in (0xA2, 0xA6): self.x = value
+                elif opcode in (0xA0, 0xA4): self.y = value
+                elif opcode == 0x29: self.a = value = self.a & value
+                elif opcode == 0x09: self.a = value = self.a | value
+                else: self.a = value = self.a ^ value
+                self.p = (self.p & 0x7D) | NZ[value]
+
+        pc = self.pc
+        second = bus.read(pc)
+        if second & 0x1F == 0x10:
+            self.opcode = second
+            cycles += 2
+            pc += 2
+            if bool(self.p & _BRANCH_FLAGS[second >> 6]) == bool(second & 0x20):
+                rel = bus.read(pc - 1)
+                target = (pc + (rel | 0xFF00 if rel & 0x80 else rel)) & 0xFFFF
+                cycles += 1 + ((target & 0xFF00) != (pc & 0xFF00))
+                pc = target
+            self.pc = pc
+        elif second in (0x84, 0x85, 0x86):
+            self.opcode = second
+            bus.write(bus.read(pc + 1), self.y if second == 0x84 else self.a if second == 0x85 else self.x)
+            self.pc = pc + 2
+            cycles += 3
+        elif second == 0x29:
+            self.opcode = second
+            self.a = value = self.a & bus.read(pc + 1)
+            self.p = (self.p & 0x7D) | NZ[value]
+            self.pc = pc + 2
+            cycles += 2
+        elif second == 0x8D:
+            addr = bus.read(pc + 1) | (bus.read(pc + 2) << 8)
+            # Stores past internal RAM can have side effects that need their own cycle
+            if addr < 0x2000:
+                self.opcode = second
+                bus.write(addr, self.a)
+                self.pc = pc + 3
+                cycles += 4
+        return cycles
+
+    def run_block(self):
+        """Run the translated block of PRG-ROM code at pc, advancing the bus'
+        total_cycles after every instruction. Stops early once the next
+        scheduled event is due. Anything else runs one instruction through
+        clock()."""
+        bus = self.bus
+        cartridge = bus.cartridge
+        pc = self.pc
+        if 0x8000 <= pc <= 0xFFFF and cartridge is not None and not self.on_opcode_loaded and not self.jammed:
+            # The same PRG offset can be banked into different windows
+            key = (cartridge.mapper.prg_offsets[(pc >> 13) & 0x03] << 16) | pc
+            block = cartridge.blocks.get(key)
+            if block is None:
+                # Code that only runs a few times is cheaper to interpret
+                visits = cartridge.block_visits.get(key, 0) + 1
+                if visits < TRANSLATE_AFTER:
+                    cartridge.block_visits[key] = visits
+                    cycles = self.clock()
+                    bus.total_cycles += cycles
+                    return
+                block = cartridge.blocks[key] = translate_block(self, pc)
+            block(self, bus)
+        else:
+            # Not `+= self.clock()`: an OAM DMA adds its stall while the instruction runs
+            cycles = self.clock()
+            bus.total_cycles += cycles
+
     def fetch(self):
         if self._fetch_from_mem:
             self.fetched = self.bus.read(self.abs_addr)
@@ -408,23 +561,16 @@ class MOS6502:
 
     def _comp_adc(self):
         self.fetch()
-        added = self.a + self.fetched + (1 if (self.p & Status.C) else 0)
-        self._set_status(Status.C, added > 255)
-        self._set_status(Status.Z, (added & 0x00FF) == 0)
-        self._set_status(Status.V, ((~self.a ^ self.fetched) & (self.a ^ added) & 0x0080) > 0)
-        self._set_status(Status.N, added & 0x80)
-        self.a = added & 0x00FF
+        r = ADC[((self.p & 0x01) << 16) | (self.a << 8) | self.fetched]
+        self.p = (self.p & 0x3C) | (r & 0xFF)
+        self.a = r >> 8
         return 1
 
     def _comp_sbc(self):
         self.fetch()
-        value = self.fetched ^ 0x00FF
-        added = self.a + value + (1 if (self.p & Status.C) else 0)
-        self._set_status(Status.C, added > 255)
-        self._set_status(Status.Z, (added & 0x00FF) == 0)
-        self._set_status(Status.V, ((~self.a ^ value) & (self.a ^ added) & 0x0080) > 0)
-        self._set_status(Status.N, added & 0x80)
-        self.a = added & 0x00FF
+        r = ADC[((self.p & 0x01) << 16) | (self.a << 8) | (self.fetched ^ 0xFF)]
+        self.p = (self.p & 0x3C) | (r & 0xFF)
+        self.a = r >> 8
         return 1
 
     def _comp_dcp(self):
@@ -460,16 +606,13 @@ class MOS6502:
     def _comp_and(self):
         self.fetch()
         self.a &= self.fetched
-        self._set_status(Status.Z, self.a == 0)
-        self._set_status(Status.N, self.a & 0x80)
+        self.p = (self.p & 0x7D) | NZ[self.a]
         return 1
 
     def _comp_asl(self):
         self.fetch()
         new_val = self.fetched << 1
-        self._set_status(Status.C, (new_val & 0xFF00) > 0)
-        self._set_status(Status.Z, (new_val & 0x00FF) == 0)
-        self._set_status(Status.N, (new_val & 0x80) > 0)
+        self.p = (self.p & 0x7C) | (new_val >> 8) | NZ[new_val & 0xFF]
         if not self._fetch_from_mem:
             self.a = new_val & 0x00FF
         else:
@@ -482,10 +625,7 @@ class MOS6502:
 
     def _comp_bit(self):
         self.fetch()
-        new_val = self.a & self.fetched
-        self._set_status(Status.Z, (new_val & 0x00FF) == 0)
-        self._set_status(Status.N, self.fetched & (1 << 7))
-        self._set_status(Status.V, self.fetched & (1 << 6))
+        self.p = (self.p & 0x3D) | (0 if self.a & self.fetched else 0x02) | (self.fetched & 0xC0)
         return 0
 
     def _comp_bmi(self): return self._branch_if(bool(self.p & Status.N))
@@ -509,86 +649,62 @@ class MOS6502:
 
     def _comp_clc(self): self._set_status(Status.C, False); return 0
     def _comp_cld(self): self._set_status(Status.D, False); return 0
-    def _comp_cli(self): self._set_status(Status.I, False); return 0
+    def _comp_cli(self): self._set_status(Status.I, False); self.bus.poll_irq(); return 0
     def _comp_clv(self): self._set_status(Status.V, False); return 0
 
     def _comp_cmp(self):
         self.fetch()
-        val = self.a - self.fetched
-        p = self.p & ~(Status.C | Status.Z | Status.N)
-        if self.a >= self.fetched: p |= Status.C
-        if (val & 0xFF) == 0: p |= Status.Z
-        if val & 0x80: p |= Status.N
-        self.p = p
+        self.p = (self.p & 0x7C) | (self.a >= self.fetched) | NZ[(self.a - self.fetched) & 0xFF]
         return 1
 
     def _comp_cpx(self):
         self.fetch()
-        val = self.x - self.fetched
-        p = self.p & ~(Status.C | Status.Z | Status.N)
-        if self.x >= self.fetched: p |= Status.C
-        if (val & 0xFF) == 0: p |= Status.Z
-        if val & 0x80: p |= Status.N
-        self.p = p
+        self.p = (self.p & 0x7C) | (self.x >= self.fetched) | NZ[(self.x - self.fetched) & 0xFF]
         return 0
 
     def _comp_cpy(self):
         self.fetch()
-        val = self.y - self.fetched
-        p = self.p & ~(Status.C | Status.Z | Status.N)
-        if self.y >= self.fetched: p |= Status.C
-        if (val & 0xFF) == 0: p |= Status.Z
-        if val & 0x80: p |= Status.N
-        self.p = p
+        self.p = (self.p & 0x7C) | (self.y >= self.fetched) | NZ[(self.y - self.fetched) & 0xFF]
         return 0
 
     def _comp_dec(self):
         self.fetch()
-        val = self.fetched - 1
-        self._set_status(Status.Z, (val & 0x00FF) == 0)
-        self._set_status(Status.N, (val & 0x0080) > 0)
-        self.bus.write(self.abs_addr, val & 0x00FF)
+        val = (self.fetched - 1) & 0xFF
+        self.p = (self.p & 0x7D) | NZ[val]
+        self.bus.write(self.abs_addr, val)
         return 0
 
     def _comp_dex(self):
-        self.x -= 1
-        self.x &= 0xFF
-        self._set_status(Status.Z, (self.x & 0x00FF) == 0)
-        self._set_status(Status.N, (self.x & 0x0080) > 0)
+        self.x = (self.x - 1) & 0xFF
+        self.p = (self.p & 0x7D) | NZ[self.x]
         return 0
 
     def _comp_dey(self):
-        self.y -= 1
-        self.y &= 0xFF
-        self._set_status(Status.Z, (self.y & 0x00FF) == 0)
-        self._set_status(Status.N, (self.y & 0x0080) > 0)
+        self.y = (self.y - 1) & 0xFF
+        self.p = (self.p & 0x7D) | NZ[self.y]
         return 0
 
     def _comp_eor(self):
         self.fetch()
         self.a = self.a ^ self.fetched
-        self._set_status(Status.Z, (self.a & 0x00FF) == 0)
-        self._set_status(Status.N, (self.a & 0x0080) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.a]
         return 1
 
     def _comp_inc(self):
         self.fetch()
         val = ((self.fetched + 1) & 0x00FF)
-        self._set_status(Status.Z, (val & 0x00FF) == 0)
-        self._set_status(Status.N, (val & 0x0080) > 0)
+        self.p = (self.p & 0x7D) | NZ[val]
         self.bus.write(self.abs_addr, val)
         return 0
 
     def _comp_inx(self):
         self.x = (self.x + 1) & 0xFF
-        self._set_status(Status.Z, self.x == 0)
-        self._set_status(Status.N, (self.x & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.x]
         return 0
 
     def _comp_iny(self):
         self.y = (self.y + 1) & 0xFF
-        self._set_status(Status.Z, self.y == 0)
-        self._set_status(Status.N, (self.y & 0x0080) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.y]
         return 0
 
     def _comp_jmp(self): self.pc = self.abs_addr; return 0
@@ -602,38 +718,26 @@ class MOS6502:
     def _comp_lda(self):
         self.fetch()
         self.a = self.fetched
-        p = self.p & ~(Status.Z | Status.N)
-        if self.a == 0: p |= Status.Z
-        if self.a & 0x80: p |= Status.N
-        self.p = p
+        self.p = (self.p & 0x7D) | NZ[self.fetched]
         return 1
 
     def _comp_ldx(self):
         self.fetch()
         self.x = self.fetched
-        p = self.p & ~(Status.Z | Status.N)
-        if self.x == 0: p |= Status.Z
-        if self.x & 0x80: p |= Status.N
-        self.p = p
+        self.p = (self.p & 0x7D) | NZ[self.fetched]
         return 1
 
     def _comp_ldy(self):
         self.fetch()
         self.y = self.fetched
-        p = self.p & ~(Status.Z | Status.N)
-        if self.y == 0: p |= Status.Z
-        if self.y & 0x80: p |= Status.N
-        self.p = p
+        self.p = (self.p & 0x7D) | NZ[self.fetched]
         return 1
 
     def _comp_lsr(self):
         self.fetch()
-        carry_flag = (self.fetched & 0x01) > 0
         new_val = self.fetched >> 1
-        self._set_status(Status.C, carry_flag)
-        self._set_status(Status.Z, (new_val & 0x00FF) == 0)
-        self._set_status(Status.N, (new_val & 0x80) > 0)
-        if not self._fetch_from_mem: self.a = (new_val & 0xFF)
+        self.p = (self.p & 0x7C) | (self.fetched & 0x01) | NZ[new_val]
+        if not self._fetch_from_mem: self.a = new_val
         else: self.bus.write(self.abs_addr, new_val)
         return 0
 
@@ -643,8 +747,7 @@ class MOS6502:
     def _comp_ora(self):
         self.fetch()
         self.a |= self.fetched
-        self._set_status(Status.Z, (self.a & 0xFF) == 0)
-        self._set_status(Status.N, (self.a & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.a]
         return 1
 
     def _comp_pha(self): self._push_to_stack(self.a); return 0
@@ -659,8 +762,7 @@ class MOS6502:
 
     def _comp_pla(self):
         self.a = self._pop_from_stack()
-        self._set_status(Status.Z, (self.a & 0xFF) == 0)
-        self._set_status(Status.N, (self.a & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.a]
         return 0
 
     def _comp_plp(self):
@@ -669,27 +771,21 @@ class MOS6502:
         self.restore_all_status_from_int(status_int)
         self._set_status(Status.U, True)
         self._set_status(Status.B, current_b)
+        self.bus.poll_irq()
         return 0
 
     def _comp_rol(self):
         self.fetch()
-        old_carry_flag = (1 if (self.p & Status.C) else 0)
-        new_val = (self.fetched << 1) | (old_carry_flag)
-        self._set_status(Status.C, (new_val & 0xFF00) > 0)
-        self._set_status(Status.Z, (new_val & 0xFF) == 0)
-        self._set_status(Status.N, (new_val & 0x80) > 0)
+        new_val = (self.fetched << 1) | (self.p & 0x01)
+        self.p = (self.p & 0x7C) | (new_val >> 8) | NZ[new_val & 0xFF]
         if not self._fetch_from_mem: self.a = (new_val & 0xFF)
         else: self.bus.write(self.abs_addr, (new_val & 0xFF))
         return 0
 
     def _comp_ror(self):
         self.fetch()
-        old_carry_flag = (1 if (self.p & Status.C) else 0)
-        old_val = self.fetched
-        new_val = ((self.fetched >> 1) & 0xFF) | (int(old_carry_flag) << 7)
-        self._set_status(Status.C, (old_val & 0x01) > 0)
-        self._set_status(Status.Z, (new_val & 0xFF) == 0)
-        self._set_status(Status.N, (new_val & 0x80) > 0)
+        new_val = (self.fetched >> 1) | ((self.p & 0x01) << 7)
+        self.p = (self.p & 0x7C) | (self.fetched & 0x01) | NZ[new_val]
         if not self._fetch_from_mem: self.a = new_val
         else: self.bus.write(self.abs_addr, new_val)
         return 0
@@ -702,6 +798,7 @@ class MOS6502:
         lo = self._pop_from_stack()
         hi = self._pop_from_stack()
         self.pc = (hi << 8) | lo
+        self.bus.poll_irq()
         return 0
 
     def _comp_rts(self):
@@ -721,33 +818,29 @@ class MOS6502:
 
     def _comp_tax(self):
         self.x = self.a
-        self._set_status(Status.Z, (self.x & 0xFF) == 0)
-        self._set_status(Status.N, (self.x & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.x]
         return 0
 
     def _comp_tay(self):
         self.y = self.a
-        self._set_status(Status.Z, (self.y & 0xFF) == 0)
-        self._set_status(Status.N, (self.y & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.y]
         return 0
 
     def _comp_tsx(self):
         self.x = self.stkp
-        self._set_status(Status.Z, self.x == 0)
-        self._set_status(Status.N, (self.x & 0x80) > 0)
+        # The stack pointer isn't wrapped, so it can fall outside the NZ table
+        self.p = (self.p & 0x7D) | (0x02 if self.x == 0 else 0) | (self.x & 0x80)
         return 0
 
     def _comp_txa(self):
         self.a = self.x
-        self._set_status(Status.Z, self.a == 0)
-        self._set_status(Status.N, (self.a & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.a]
         return 0
 
     def _comp_txs(self): self.stkp = self.x; return 0
     def _comp_tya(self):
         self.a = self.y
-        self._set_status(Status.Z, self.a == 0)
-        self._set_status(Status.N, (self.a & 0x80) > 0)
+        self.p = (self.p & 0x7D) | NZ[self.a]
         return 0
 
     def _comp_lax(self): self._comp_lda(); return self._comp_ldx()
@@ -0,0 +1,133 @@
+"""Input movies: a start state and the buttons held on every frame.
+
+The file is a fixed header, the snapshot the movie starts from (empty for
+power on) and then one byte per controller per frame, in frame order. As the
+emulator is deterministic, playing the inputs back from the same state
+reproduces the session exactly, as fast as the emulator runs.
+"""
+import hashlib
+import struct
+from typing import Optional, Tuple
+from .emulator import Emulator
+
+_MAGIC = b'PTNM'
+_VERSION = 1
+# Magic, version, controllers, ROM hash, start state size, frames
+_HEADER = struct.Struct('<4sHB32sII')
+
+
+def rom_hash(emulator: Emulator) -> bytes:
+    # SHA-256 of the PRG-ROM followed by the CHR-ROM
+    rom = emulator.bus.cartridge.rom
+    if rom is None:
+        raise ValueError('movies need a cartridge loaded from a ROM file')
+    digest = hashlib.sha256(rom.prg_rom_data)
+    digest.update(rom.chr_rom_data)
+    return digest.digest()
+
+
+class Movie:
+    def __init__(self, rom_hash: bytes, start_state: Optional[bytes] = None, num_controllers: int = 2):
+        self.rom_hash = rom_hash
+        # Snapshot of the console the movie starts from, None for power on.
+        # Snapshots only load into the build (pure Python or compiled) that made them.
+        self.start_state = start_state
+        self.num_controllers = num_controllers
+        self.inputs = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.inputs) // self.num_controllers
+
+    def frame(self, index: int) -> Tuple[int, ...]:
+        # Button masks of every controller during frame `index`
+        start = index * self.num_controllers
+        return tuple(self.inputs[start:start + self.num_controllers])
+
+    def save(self, path: str):
+        start_state = self.start_state or b''
+        with open(path, 'wb') as f:
+            f.write(_HEADER.pack(_MAGIC, _VERSION, self.num_controllers, self.rom_hash,
+                                 len(start_state), len(self)))
+            f.write(start_state)
+            f.write(self.inputs[:len(self) * self.num_controllers])
+
+    @classmethod
+    def load(cls, path: str) -> 'Movie':
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < _HEADER.size:
+            raise ValueError(f'{path} is not a movie')
+        magic, version, num_controllers, rom_hash, state_size, frames = _HEADER.unpack_from(data)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f'{path} is not a version {_VERSION} movie')
+        start = _HEADER.size + state_size
+        if len(data) != start + frames * num_controllers:
+            raise ValueError(f'{path} is truncated')
+        movie = cls(rom_hash, data[_HEADER.size:start] or None, num_controllers)
+        movie.inputs[:] = data[start:]
+        return movie
+
+
+class MovieRecorder:
+    """Records the controllers of an emulator into a Movie.
+
+    The movie starts from the current state of the emulator, or from power on
+    with from_power_on=True, in which case the emulator must be freshly
+    loaded. Call record() once per frame, just before it runs.
+    """
+
+    def __init__(self, emulator: Emulator, from_power_on: bool = False):
+        self.emulator = emulator
+        start_state = None if from_power_on else bytes(emulator.snapshot())
+        self.movie = Movie(rom_hash(emulator), start_state, len(emulator.bus.controllers))
+
+    def record(self):
+        # The inputs held during the frame about to run
+        self.movie.inputs += bytes(controller.state & 0xFF for controller in self.emulator.bus.controllers)
+
+    def step_frame(self):
+        self.record()
+        self.emulator.step_frame()
+
+
+class MoviePlayer:
+    """Feeds the inputs of a Movie to an emulator, frame by frame.
+
+    The emulator is moved to the start state of the movie, a power on movie
+    needs a freshly loaded one. Nothing waits for real time, so run() plays
+    as fast as the emulator can go.
+    """
+
+    def __init__(self, movie: Movie, emulator: Emulator):
+        if movie.rom_hash != rom_hash(emulator):
+            raise ValueError('the movie was recorded on another ROM')
+        if movie.start_state is not None:
+            if len(movie.start_state) != emulator.state_size:
+                raise ValueError('the movie starts from a state of another emulator build')
+            emulator.restore(movie.start_state)
+        self.movie = movie
+        self.emulator = emulator
+        self.position = 0
+
+    def __len__(self) -> int:
+        return len(self.movie)
+
+    @property
+    def done(self) -> bool:
+        return self.position >= len(self.movie)
+
+    def step(self) -> bool:
+        # Run the next frame of the movie, False once it is over
+        if self.done:
+            return False
+        self.emulator.step_frame(self.movie.frame(self.position))
+        self.position += 1
+        return True
+
+    def run(self, frames: Optional[int] = None) -> int:
+        # Play up to `frames` frames, all the rest by default, and return how many ran
+        remaining = len(self.movie) - self.position
+        frames = remaining if frames is None else min(frames, remaining)
+        for _ in range(frames):
+            self.step()
+        return frames
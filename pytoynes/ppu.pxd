@@ -10,9 +10,11 @@ cdef class PPU:
     cdef public int scanline, cycle, frame_count
     cdef public long long total_cycles
     cdef public bint nmi, is_odd_frame, sprite_zero_hit_possible
-    cdef public int mirror_mode
+    cdef int _mirror_mode
 
-    cdef public unsigned char[:] vram, palette_vram, oam_vram
+    cdef unsigned char[:] _vram
+    cdef public unsigned char[:] palette_vram, oam_vram
+    cdef unsigned char* _nt_pages[4]
     cdef public object pixels  # numpy array
     cdef unsigned char[:, :] pixels_view
 
@@ -27,15 +29,26 @@ cdef class PPU:
     cdef public unsigned char[:] sprite_attribs, sprite_x_counters
 
     cdef public Cartridge cartridge
+    cdef list _pending_writes
 
     cpdef int cpu_read(self, int addr)
     cpdef void cpu_write(self, int addr, int data)
     cpdef int ppu_read(self, int addr)
     cpdef void ppu_write(self, int addr, int data)
     cpdef void run_to(self, long long target_total_cycles)
+    cdef void _step_to(self, long long target_total_cycles)
+    cpdef void defer_write(self, int addr, int data, long long ppu_cycle)
+    cdef void _replay_write(self, int reg, int data, int w)
+    cpdef long long status_stable_until(self)
+    cdef long long _scanline_start_cycle(self, int lines)
+    cpdef long long next_nmi_cycle(self)
+    cpdef long long next_irq_cycle(self)
     cpdef void clock(self)
     cpdef void connect_cartridge(self, Cartridge cartridge)
+    cpdef void map_nametables(self)
 
+    cdef void _render_scanline_fast(self)
+    cdef void _compose_scanline(self, unsigned char* bg_pixels, unsigned char* bg_palettes)
     cpdef void _render_pixel(self)
     cpdef void _update_shifters(self)
     cdef void _load_shifters(self)
@@ -49,4 +62,3 @@ cdef class PPU:
     cdef void _fetch_pt_hi(self)
     cdef void _evaluate_sprites(self)
     cdef void _fetch_sprite_data(self)
-    cdef inline int _map_nt_addr(self, int addr)
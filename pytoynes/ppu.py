@@ -4,30 +4,35 @@ from .cartridge import Cartridge
 from .rom import MirrorMode
 from typing import Optional
 
-_TILE_DECODE = [None] * 65536
-for _lo in range(256):
-    for _hi in range(256):
-        _TILE_DECODE[_lo | (_hi << 8)] = bytes(
-            ((_hi >> (7 - _p)) & 1) << 1 | ((_lo >> (7 - _p)) & 1) for _p in range(8)
-        )
+# Pixel values of a tile row for every (hi << 8) | lo pair of bitplane bytes
+_PLANE_BITS = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1)
+_TILE_DECODE = _PLANE_BITS[np.arange(65536) & 0xFF] | (_PLANE_BITS[np.arange(65536) >> 8] << 1)
+
+_TILE_STEPS = np.arange(32)
+
+# Palette RAM index for each (palette << 2) | pixel; pixel 0 is the backdrop
+_PALETTE_INDEX = np.array([addr if addr & 0x03 else 0 for addr in range(32)])
+
+# VRAM offset of the four nametables at $2000/$2400/$2800/$2C00 per mirroring
+# mode; anything else is treated as vertical
+_NT_OFFSETS = {
+    MirrorMode.HORIZONTAL: (0x0000, 0x0000, 0x0400, 0x0400),
+    MirrorMode.VERTICAL: (0x0000, 0x0400, 0x0000, 0x0400),
+    MirrorMode.ONESCREEN_LO: (0x0000, 0x0000, 0x0000, 0x0000),
+    MirrorMode.ONESCREEN_HI: (0x0400, 0x0400, 0x0400, 0x0400),
+}
 
 class PPU:
     def __init__(self):
         self.cartridge: Optional[Cartridge] = None
-        self.mirror_mode = 0 # Default HORIZONTAL
+        self._mirror_mode = 0 # Default HORIZONTAL
         
-        self.vram = array.array('B', bytearray(2048))
+        self._vram = array.array('B', bytearray(2048))
+        self.map_nametables()
         self.palette_vram = array.array('B', bytearray(32))
         self.oam_vram = array.array('B', bytearray(256))
         
         self.pixels = np.zeros((240, 256), dtype=np.uint8)
-        
-        self._bg_pixels = np.zeros(256, dtype=np.uint8)
-        self._bg_palettes = np.zeros(256, dtype=np.uint8)
-        self._fg_pixels = np.zeros(256, dtype=np.uint8)
-        self._fg_palettes = np.zeros(256, dtype=np.uint8)
-        self._fg_priorities = np.zeros(256, dtype=np.uint8)
-        self._sprite0_possible = np.zeros(256, dtype=np.uint8)
 
         self.ppu_ctrl = 0
         self.ppu_mask = 0
@@ -63,6 +68,9 @@ class PPU:
         self.sprite_zero_hit_possible = False
         self.is_odd_frame = False
 
+        # (ppu_cycle, reg, data, w) register writes waiting for run_to()
+        self._pending_writes = []
+
     def clock(self):
         scanline = self.scanline
         cycle = self.cycle
@@ -125,122 +133,249 @@ class PPU:
                     self.total_cycles += 1
 
     def run_to(self, target_total_cycles: int):
+        pending = self._pending_writes
+        while pending and pending[0][0] <= target_total_cycles:
+            ppu_cycle, reg, data, w = pending.pop(0)
+            self._step_to(ppu_cycle)
+            self._replay_write(reg, data, w)
+        self._step_to(target_total_cycles)
+
+    def _step_to(self, target_total_cycles: int):
+        # Registers cannot change in between, so whole scanlines are stepped in
+        # bulk. Only lines with a write or a catch-up point inside them go dot
+        # by dot, and the last dot of a line always goes through clock() to
+        # cross the boundary.
         while self.total_cycles < target_total_cycles:
-            self.clock()
+            remaining = target_total_cycles - self.total_cycles
+            dots = 340 - self.cycle
+            if self.scanline >= 240:
+                # Post-render and vblank lines only count dots
+                if dots >= remaining:
+                    self.cycle += remaining
+                    self.total_cycles += remaining
+                    return
+                self.cycle = 340
+                self.total_cycles += dots
+                self.clock()
+            elif self.cycle <= 1 and dots < remaining:
+                self._render_scanline_fast()
+                self.cycle = 340
+                self.total_cycles += dots
+                self.clock()
+            else:
+                self.clock()
 
-    def _render_scanline_fast(self):
-        ppu_mask = self.ppu_mask
+    def _scanline_start_cycle(self, lines: int) -> int:
+        # total_cycles at which the `lines`-th upcoming scanline starts. The
+        # odd-frame skip bumps total_cycles by one, so lines stay 341 apart.
+        return self.total_cycles + (341 - self.cycle) + 341 * (lines - 1)
+
+    def defer_write(self, addr: int, data: int, ppu_cycle: int):
+        # Ctrl, mask and scroll writes only matter to rendering, so they are
+        # stamped with the dot they happen on and replayed there by run_to().
+        # The w latch belongs to the CPU side and toggles straight away.
+        reg = addr & 0x0007
+        if ppu_cycle <= self.total_cycles and not self._pending_writes:
+            self.cpu_write(addr, data)
+            return
+        self._pending_writes.append((ppu_cycle, reg, data, self.w))
+        if reg == 0x05 or reg == 0x06:
+            self.w ^= 1
+
+    def _replay_write(self, reg: int, data: int, w: int):
+        cpu_w = self.w
+        self.w = w
+        self.cpu_write(0x2000 | reg, data)
+        self.w = cpu_w
+
+    def status_stable_until(self) -> int:
+        # Earliest total_cycles at which ppu_status may change by itself, so a
+        # $2002 read before that point does not need the PPU to catch up
         scanline = self.scanline
-        vram = self.vram
-        map_nt = self._map_nt_addr
-        bg_pixels = self._bg_pixels
-        bg_palettes = self._bg_palettes
-        tile_decode = _TILE_DECODE
+        lines = 241 - scanline if scanline < 241 else 261 - scanline
+        if scanline <= 239:
+            if not (self.ppu_status & 0x40):
+                # Sprite 0 is evaluated on line y and drawn on the lines after
+                y = self.oam_vram[0]
+                if self.sprite_zero_hit_possible or y <= scanline <= y + 17:
+                    return self.total_cycles
+                if scanline < y:
+                    lines = min(lines, y + 1 - scanline)
+            if not (self.ppu_status & 0x20):
+                # Overflow needs nine sprites in range of the same line
+                y9 = sorted(self.oam_vram[0::4])[8]
+                if scanline >= y9:
+                    return self.total_cycles
+                lines = min(lines, y9 - scanline)
+        return self._scanline_start_cycle(lines)
+
+    def next_nmi_cycle(self) -> int:
+        if not (self.ppu_ctrl & 0x80) and not any(
+                reg == 0x00 and data & 0x80 for _, reg, data, _ in self._pending_writes):
+            return -1
+        lines = 241 - self.scanline
+        if lines <= 0:
+            lines += 262
+        return self._scanline_start_cycle(lines)
+
+    def next_irq_cycle(self) -> int:
+        if self.cartridge is None:
+            return -1
+        lines = self.cartridge.mapper.scanlines_to_irq()
+        if lines < 0:
+            return -1
+        return self._scanline_start_cycle(lines)
 
-        bg_pixels.fill(0)
-        bg_palettes.fill(0)
+    def _render_scanline_fast(self):
+        # Same result as calling clock() for dots 0-339 of a pre-render or
+        # visible scanline. The 32 tiles fetched on dots 1-256 are gathered
+        # and their rows copied out of the cartridge's decoded tile cache.
+        scanline = self.scanline
+        ppu_mask = self.ppu_mask
+        bg_enabled = ppu_mask & 0x08
+        v = self.v
+        tile_lo = self.bg_shifter_tile_lo
+        tile_hi = self.bg_shifter_tile_hi
+        attrib_lo = self.bg_shifter_attrib_lo
+        attrib_hi = self.bg_shifter_attrib_hi
 
-        if ppu_mask & 0x08:
-            v = (self.v & ~0x041F) | (self.t & 0x041F)
-            fine_x = self.fine_x
-            table = (self.ppu_ctrl >> 4) & 0x01
-            fine_y = (v >> 12) & 0x07
-            left_clip = not (ppu_mask & 0x02)
-
-            for t in range(33):
-                tile_id = vram[map_nt(0x2000 | (v & 0x0FFF))]
-                attr = vram[map_nt(0x23C0 | (v & 0x0C00) | ((v >> 4) & 0x38) | ((v >> 2) & 0x07))]
-                if (v >> 6) & 0x01: attr >>= 4
-                if (v >> 1) & 0x01: attr >>= 2
-                pal_idx = attr & 0x03
-
-                pt_addr = (table << 12) | (tile_id << 4) | fine_y
-                lsb = self.ppu_read(pt_addr)
-                msb = self.ppu_read(pt_addr + 8)
-
-                base_x = t * 8 - fine_x
-                for p in range(8):
-                    pixel_x = base_x + p
-                    if 0 <= pixel_x < 256:
-                        if not (left_clip and pixel_x < 8):
-                            bit_pos = 7 - p
-                            px = (((msb >> bit_pos) & 1) << 1) | ((lsb >> bit_pos) & 1)
-                            if px:
-                                bg_pixels[pixel_x] = px
-                                bg_palettes[pixel_x] = pal_idx
-
-                if (v & 0x001F) == 31: v = (v & ~0x001F) ^ 0x0400
-                else: v += 1
-
-        fg_pixels = self._fg_pixels
-        fg_palettes = self._fg_palettes
-        fg_priorities = self._fg_priorities
-        sprite0_possible = self._sprite0_possible
-        fg_pixels.fill(0)
-        fg_palettes.fill(0)
-        fg_priorities.fill(0)
-        sprite0_possible.fill(0)
+        # Dots 1-256: v as seen by each of the 32 fetches
+        if ppu_mask & 0x18:
+            coarse_x = (v & 0x001F) + _TILE_STEPS
+            vs = (v & ~0x041F) | (coarse_x & 0x1F) | ((v & 0x0400) ^ ((coarse_x & 0x20) << 5))
+            # 32 coarse X increments wrap into the other nametable
+            self.v = v ^ 0x0400
+        else:
+            vs = np.full(32, v, dtype=np.int64)
+        nt_bases = np.array(self._nt_offsets)[(vs >> 10) & 0x03]
+        vram = np.frombuffer(self._vram, dtype=np.uint8)
+        tile_ids = vram[nt_bases + (vs & 0x03FF)]
+        attribs = vram[nt_bases + (0x03C0 | ((vs >> 4) & 0x38) | ((vs >> 2) & 0x07))]
+        attribs = (attribs >> (((vs >> 4) & 0x04) | (vs & 0x02))) & 0x03
+        table = (self.ppu_ctrl >> 4) & 0x01
+        fine_y = (v >> 12) & 0x07
+        cartridge = self.cartridge
+        # The shifters end up holding the raw bytes of the last two tiles
+        pt_addr = table * 0x1000 + fine_y
+        lsb_30, lsb_31, msb_30, msb_31 = [
+            cartridge.ppu_read(pt_addr + int(tile_ids[i]) * 16 + plane)
+            for plane in (0, 8) for i in (30, 31)]
+        last_attrib = int(attribs[31])
+
+        if bg_enabled:
+            tile_bases = np.array(cartridge.chr_tile_bases()[table * 4:table * 4 + 4])
+            tiles = cartridge.tiles[tile_bases[tile_ids >> 6] + (tile_ids & 0x3F), fine_y]
+            # The two tiles already in the shifters come out first
+            head = np.unpackbits(np.array([tile_lo >> 8, tile_lo & 0xFF, tile_hi >> 8, tile_hi & 0xFF,
+                                           attrib_lo >> 8, attrib_lo & 0xFF, attrib_hi >> 8, attrib_hi & 0xFF],
+                                          dtype=np.uint8)).reshape(4, 16)
+            bg_pixels = np.concatenate((head[0] | (head[1] << 1), tiles.ravel()))
+            bg_palettes = np.concatenate((head[2] | (head[3] << 1), np.repeat(attribs.astype(np.uint8), 8)))
+            bg_pixels = bg_pixels[self.fine_x:self.fine_x + 256]
+            bg_palettes = bg_palettes[self.fine_x:self.fine_x + 256]
+            prev_attrib = int(attribs[30])
+            tile_lo = (lsb_30 << 8) | lsb_31
+            tile_hi = (msb_30 << 8) | msb_31
+            attrib_lo = (0xFF00 if (prev_attrib & 0x01) else 0x00) | (0xFF if (last_attrib & 0x01) else 0x00)
+            attrib_hi = (0xFF00 if (prev_attrib & 0x02) else 0x00) | (0xFF if (last_attrib & 0x02) else 0x00)
+        else:
+            bg_pixels = np.zeros(256, dtype=np.uint8)
+            bg_palettes = np.zeros(256, dtype=np.uint8)
+            tile_lo = (tile_lo & 0xFF00) | lsb_31
+            tile_hi = (tile_hi & 0xFF00) | msb_31
+            attrib_lo = (attrib_lo & 0xFF00) | (0xFF if (last_attrib & 0x01) else 0x00)
+            attrib_hi = (attrib_hi & 0xFF00) | (0xFF if (last_attrib & 0x02) else 0x00)
+        self.bg_next_tile_id = int(tile_ids[31])
+        self.bg_next_tile_attrib = last_attrib
+        self.bg_next_tile_lsb = lsb_31
+        self.bg_next_tile_msb = msb_31
+
+        if scanline >= 0:
+            if not (ppu_mask & 0x02):
+                bg_pixels[0:8] = 0
+            self._compose_scanline(bg_pixels, bg_palettes)
 
         if ppu_mask & 0x10:
-            self._evaluate_sprites()
-            self._fetch_sprite_data()
-            left_clip_spr = not (ppu_mask & 0x04)
+            # Every active sprite has been counted down and shifted by dot 256
+            for i in range(self.sprite_count):
+                shift = 256 - self.sprite_x_counters[i]
+                if shift < 8:
+                    self.sprite_shifter_pattern_lo[i] = (self.sprite_shifter_pattern_lo[i] << shift) & 0xFF
+                    self.sprite_shifter_pattern_hi[i] = (self.sprite_shifter_pattern_hi[i] << shift) & 0xFF
+                else:
+                    self.sprite_shifter_pattern_lo[i] = 0
+                    self.sprite_shifter_pattern_hi[i] = 0
+                self.sprite_x_counters[i] = 0
+
+        self._increment_scroll_y()
+        self._evaluate_sprites()
+        self._reset_scroll_x()
+        if scanline == -1:
+            self._reset_scroll_y()
+
+        # Dots 321-336: prefetch the first two tiles of the next line
+        for _ in range(2):
+            if bg_enabled:
+                tile_lo = (tile_lo << 8) & 0xFFFF
+                tile_hi = (tile_hi << 8) & 0xFFFF
+                attrib_lo = (attrib_lo << 8) & 0xFFFF
+                attrib_hi = (attrib_hi << 8) & 0xFFFF
+            self._fetch_nt(); self._fetch_at(); self._fetch_pt_lo(); self._fetch_pt_hi()
+            tile_lo = (tile_lo & 0xFF00) | self.bg_next_tile_lsb
+            tile_hi = (tile_hi & 0xFF00) | self.bg_next_tile_msb
+            attrib_lo = (attrib_lo & 0xFF00) | (0xFF if (self.bg_next_tile_attrib & 0x01) else 0x00)
+            attrib_hi = (attrib_hi & 0xFF00) | (0xFF if (self.bg_next_tile_attrib & 0x02) else 0x00)
+            self._increment_scroll_x()
 
+        self.bg_shifter_tile_lo = tile_lo
+        self.bg_shifter_tile_hi = tile_hi
+        self.bg_shifter_attrib_lo = attrib_lo
+        self.bg_shifter_attrib_hi = attrib_hi
+
+    def _compose_scanline(self, bg_pixels, bg_palettes):
+        # Mixes the line's sprites over the background exactly like _render_pixel
+        ppu_mask = self.ppu_mask
+        fg_pixels = np.zeros(256, dtype=np.uint8)
+        fg_palettes = np.zeros(256, dtype=np.uint8)
+        fg_priorities = np.zeros(256, dtype=bool)
+        sprite0_pixels = np.zeros(256, dtype=bool)
+        has_sprites = False
+
+        if ppu_mask & 0x10:
+            first_x = 0 if (ppu_mask & 0x04) else 8
+            # Lower OAM indices are drawn last so they win
             for i in range(self.sprite_count - 1, -1, -1):
-                attr = self.sprite_attribs[i]
                 x = self.sprite_x_counters[i]
-                lsb = self.sprite_shifter_pattern_lo[i]
-                msb = self.sprite_shifter_pattern_hi[i]
-                pal = (attr & 0x03) + 0x04
-                priority = (attr & 0x20) == 0
-                is_sprite0 = i == 0 and self.sprite_zero_hit_possible
-
-                for p in range(8):
-                    pixel_x = x + p + 1
-                    if pixel_x < 256:
-                        if not (left_clip_spr and pixel_x < 8):
-                            bit_pos = 7 - p
-                            px = (((msb >> bit_pos) & 1) << 1) | ((lsb >> bit_pos) & 1)
-                            if px:
-                                fg_pixels[pixel_x] = px
-                                fg_palettes[pixel_x] = pal
-                                fg_priorities[pixel_x] = 1 if priority else 0
-                                if is_sprite0:
-                                    sprite0_possible[pixel_x] = 1
-
-        bg_opaque = bg_pixels > 0
-        fg_opaque = fg_pixels > 0
-        
-        if (ppu_mask & 0x18) == 0x18 and self.sprite_zero_hit_possible:
-            hit_mask = bg_opaque & fg_opaque & (sprite0_possible > 0)
-            if hit_mask[:255].any(): self.ppu_status |= 0x40
-
-        final_pixel = np.zeros(256, dtype=np.uint8)
-        final_palette = np.zeros(256, dtype=np.uint8)
-        final_pixel[bg_opaque] = bg_pixels[bg_opaque]
-        final_palette[bg_opaque] = bg_palettes[bg_opaque]
-        
-        fg_overwrites = fg_opaque & (~bg_opaque | (fg_priorities > 0))
-        final_pixel[fg_overwrites] = fg_pixels[fg_overwrites]
-        final_palette[fg_overwrites] = fg_palettes[fg_overwrites]
-
-        out_pixels = np.full(256, self.palette_vram[0], dtype=np.uint8)
-        mask = final_pixel > 0
-        if mask.any():
-            pal_indices = (final_palette[mask].astype(np.uint16) << 2) + final_pixel[mask]
-            mirror_mask = (pal_indices & 0x13) == 0x10
-            pal_indices[mirror_mask] &= 0xFFEF
-            pal_vram_np = np.frombuffer(self.palette_vram, dtype=np.uint8)
-            out_pixels[mask] = pal_vram_np[pal_indices & 0x1F]
-
-        if ppu_mask & 0x01: out_pixels &= 0x30
-        self.pixels[scanline] = out_pixels
-
-        if ppu_mask & 0x18:
-            self._increment_scroll_y()
-            self._reset_scroll_x()
-            self._increment_scroll_x()
-            self._increment_scroll_x()
+                start = max(x, first_x)
+                end = min(x + 8, 256)
+                if start >= end:
+                    continue
+                row = _TILE_DECODE[self.sprite_shifter_pattern_lo[i] | (self.sprite_shifter_pattern_hi[i] << 8)]
+                row = row[start - x:end - x]
+                opaque = np.flatnonzero(row) + start
+                if not len(opaque):
+                    continue
+                attr = self.sprite_attribs[i]
+                fg_pixels[opaque] = row[opaque - start]
+                fg_palettes[opaque] = (attr & 0x03) + 0x04
+                fg_priorities[opaque] = (attr & 0x20) == 0
+                sprite0_pixels[opaque] = i == 0 and self.sprite_zero_hit_possible
+                has_sprites = True
+
+        colors = np.frombuffer(self.palette_vram, dtype=np.uint8)[_PALETTE_INDEX]
+        if ppu_mask & 0x01:
+            colors &= 0x30
+
+        if has_sprites:
+            bg_opaque = bg_pixels != 0
+            fg_opaque = fg_pixels != 0
+            if (ppu_mask & 0x18) == 0x18:
+                if np.any((bg_opaque & fg_opaque & sprite0_pixels)[:255]):
+                    self.ppu_status |= 0x40
+            fg_shown = fg_opaque & (~bg_opaque | fg_priorities)
+            bg_pixels = np.where(fg_shown, fg_pixels, bg_pixels)
+            bg_palettes = np.where(fg_shown, fg_palettes, bg_palettes)
+        self.pixels[self.scanline] = colors[(bg_palettes << 2) | bg_pixels]
 
     def _render_pixel(self):
         ppu_mask = self.ppu_mask
@@ -431,19 +566,45 @@ class PPU:
             self.v = (self.v + (32 if (self.ppu_ctrl & 0x04) else 1)) & 0x7FFF
 
     def get_pattern_pixel(self, table: int, tile_idx: int, x: int, y: int) -> int:
-        base_addr = table * 0x1000 + tile_idx * 16
-        low_byte = self.ppu_read(base_addr + y)
-        high_byte = self.ppu_read(base_addr + y + 8)
-        bit_pos = 7 - x
-        return (((high_byte >> bit_pos) & 0x01) << 1) | ((low_byte >> bit_pos) & 0x01)
+        tile = self.cartridge.chr_tile_bases()[table * 4 + (tile_idx >> 6)] + (tile_idx & 0x3F)
+        return int(self.cartridge.tiles[tile, y, x])
 
     def connect_cartridge(self, cartridge: Cartridge):
         self.cartridge = cartridge
+        self.map_nametables()
+
+    @property
+    def vram(self):
+        return self._vram
+
+    @vram.setter
+    def vram(self, vram):
+        self._vram = vram
+        self.map_nametables()
+
+    @property
+    def mirror_mode(self):
+        return self._mirror_mode
+
+    @mirror_mode.setter
+    def mirror_mode(self, mirror_mode):
+        self._mirror_mode = mirror_mode
+        self.map_nametables()
+
+    def map_nametables(self):
+        """Point the four nametables at their VRAM pages. Has to be called
+        whenever the cartridge's mirroring changes."""
+        mode = self._mirror_mode
+        if self.cartridge is not None and self.cartridge.mapper is not None:
+            mode = self.cartridge.mapper.mirror_mode
+        self._nt_offsets = _NT_OFFSETS.get(mode, _NT_OFFSETS[MirrorMode.VERTICAL])
+        vram = memoryview(self._vram)
+        self._nt_pages = [vram[offset:offset + 0x0400] for offset in self._nt_offsets]
 
     def ppu_read(self, addr: int) -> int:
         addr &= 0x3FFF
         if addr <= 0x1FFF: return self.cartridge.ppu_read(addr)
-        elif addr <= 0x3EFF: return self.vram[self._map_nt_addr(addr)]
+        elif addr <= 0x3EFF: return self._nt_pages[(addr >> 10) & 0x03][addr & 0x03FF]
         else:
             addr &= 0x001F
             if (addr & 0x13) == 0x10: addr &= ~0x10
@@ -452,27 +613,8 @@ class PPU:
     def ppu_write(self, addr: int, data: int):
         addr &= 0x3FFF
         if addr <= 0x1FFF: self.cartridge.ppu_write(addr, data)
-        elif addr <= 0x3EFF: self.vram[self._map_nt_addr(addr)] = data & 0xFF
+        elif addr <= 0x3EFF: self._nt_pages[(addr >> 10) & 0x03][addr & 0x03FF] = data & 0xFF
         else:
             addr &= 0x001F
             if (addr & 0x13) == 0x10: addr &= ~0x10
             self.palette_vram[addr] = data & 0x3F
-
-    def _map_nt_addr(self, addr: int) -> int:
-        mode = self.mirror_mode
-        if self.cartridge is not None and self.cartridge.mapper is not None:
-             mode = self.cartridge.mapper.mirror_mode
-             
-        addr &= 0x0FFF
-        if mode == 1: # VERTICAL
-            return addr & 0x07FF
-        elif mode == 0: # HORIZONTAL
-            if addr < 0x0400: return addr
-            if addr < 0x0800: return addr - 0x0400
-            if addr < 0x0C00: return addr - 0x0400
-            return addr - 0x0800
-        elif mode == 2: # ONESCREEN_LO
-            return addr & 0x03FF
-        elif mode == 3: # ONESCREEN_HI
-            return 0x0400 | (addr & 0x03FF)
-        return addr & 0x07FF
@@ -15,9 +15,10 @@ _init_bit_reverse()
 cdef class PPU:
     def __init__(self):
         self.cartridge = None
-        self.mirror_mode = 0
+        self._mirror_mode = 0
 
-        self.vram = array.array('B', bytearray(2048))
+        self._vram = array.array('B', bytearray(2048))
+        self.map_nametables()
         self.palette_vram = array.array('B', bytearray(32))
         self.oam_vram = array.array('B', bytearray(256))
 
@@ -59,6 +60,9 @@ cdef class PPU:
         self.sprite_zero_hit_possible = False
         self.is_odd_frame = False
 
+        # (ppu_cycle, reg, data, w) register writes waiting for run_to()
+        self._pending_writes = []
+
     cpdef void clock(self):
         cdef int scanline = self.scanline
         cdef int cycle = self.cycle
@@ -121,8 +125,273 @@ cdef class PPU:
                     self.total_cycles += 1
 
     cpdef void run_to(self, long long target_total_cycles):
+        cdef long long ppu_cycle
+        cdef int reg, data, w
+        while self._pending_writes and self._pending_writes[0][0] <= target_total_cycles:
+            ppu_cycle, reg, data, w = self._pending_writes.pop(0)
+            self._step_to(ppu_cycle)
+            self._replay_write(reg, data, w)
+        self._step_to(target_total_cycles)
+
+    cdef void _step_to(self, long long target_total_cycles):
+        # Registers cannot change in between, so whole scanlines are stepped in
+        # bulk. Only lines with a write or a catch-up point inside them go dot
+        # by dot, and the last dot of a line always goes through clock() to
+        # cross the boundary.
+        cdef long long remaining
+        cdef int dots
         while self.total_cycles < target_total_cycles:
-            self.clock()
+            remaining = target_total_cycles - self.total_cycles
+            dots = 340 - self.cycle
+            if self.scanline >= 240:
+                # Post-render and vblank lines only count dots
+                if dots >= remaining:
+                    self.cycle += <int>remaining
+                    self.total_cycles += remaining
+                    return
+                self.cycle = 340
+                self.total_cycles += dots
+                self.clock()
+            elif self.cycle <= 1 and dots < remaining:
+                self._render_scanline_fast()
+                self.cycle = 340
+                self.total_cycles += dots
+                self.clock()
+            else:
+                self.clock()
+
+    cdef long long _scanline_start_cycle(self, int lines):
+        # total_cycles at which the `lines`-th upcoming scanline starts. The
+        # odd-frame skip bumps total_cycles by one, so lines stay 341 apart.
+        return self.total_cycles + (341 - self.cycle) + 341 * (lines - 1)
+
+    cpdef void defer_write(self, int addr, int data, long long ppu_cycle):
+        # Ctrl, mask and scroll writes only matter to rendering, so they are
+        # stamped with the dot they happen on and replayed there by run_to().
+        # The w latch belongs to the CPU side and toggles straight away.
+        cdef int reg = addr & 0x0007
+        if ppu_cycle <= self.total_cycles and not self._pending_writes:
+            self.cpu_write(addr, data)
+            return
+        self._pending_writes.append((ppu_cycle, reg, data, self.w))
+        if reg == 0x05 or reg == 0x06:
+            self.w ^= 1
+
+    cdef void _replay_write(self, int reg, int data, int w):
+        cdef int cpu_w = self.w
+        self.w = w
+        self.cpu_write(0x2000 | reg, data)
+        self.w = cpu_w
+
+    cpdef long long status_stable_until(self):
+        # Earliest total_cycles at which ppu_status may change by itself, so a
+        # $2002 read before that point does not need the PPU to catch up
+        cdef int scanline = self.scanline
+        cdef int lines = 241 - scanline if scanline < 241 else 261 - scanline
+        cdef int y, i, seen
+        cdef int y_count[256]
+        if scanline <= 239:
+            if not (self.ppu_status & 0x40):
+                # Sprite 0 is evaluated on line y and drawn on the lines after
+                y = self.oam_vram[0]
+                if self.sprite_zero_hit_possible or y <= scanline <= y + 17:
+                    return self.total_cycles
+                if scanline < y:
+                    lines = min(lines, y + 1 - scanline)
+            if not (self.ppu_status & 0x20):
+                # Overflow needs nine sprites in range of the same line
+                for y in range(256): y_count[y] = 0
+                for i in range(64): y_count[self.oam_vram[i * 4]] += 1
+                seen = 0
+                for y in range(256):
+                    seen += y_count[y]
+                    if seen >= 9: break
+                if scanline >= y:
+                    return self.total_cycles
+                lines = min(lines, y - scanline)
+        return self._scanline_start_cycle(lines)
+
+    cpdef long long next_nmi_cycle(self):
+        cdef int lines
+        cdef tuple write
+        cdef bint enabled = (self.ppu_ctrl & 0x80) != 0
+        for write in self._pending_writes:
+            if write[1] == 0x00 and (write[2] & 0x80): enabled = True
+        if not enabled:
+            return -1
+        lines = 241 - self.scanline
+        if lines <= 0:
+            lines += 262
+        return self._scanline_start_cycle(lines)
+
+    cpdef long long next_irq_cycle(self):
+        cdef int lines
+        if self.cartridge is None:
+            return -1
+        lines = self.cartridge.mapper.scanlines_to_irq()
+        if lines < 0:
+            return -1
+        return self._scanline_start_cycle(lines)
+
+    cdef void _render_scanline_fast(self):
+        # Same result as calling clock() for dots 0-339 of a pre-render or
+        # visible scanline, but working a tile (8 dots) at a time with tile
+        # rows copied out of the cartridge's decoded tile cache.
+        cdef int scanline = self.scanline
+        cdef int ppu_mask = self.ppu_mask
+        cdef bint bg_enabled = (ppu_mask & 0x08) != 0
+        cdef int fine_x = self.fine_x
+        cdef int fine_y = (self.v >> 12) & 0x07
+        cdef int table = (self.ppu_ctrl >> 4) & 0x01
+        cdef int tile_lo = self.bg_shifter_tile_lo
+        cdef int tile_hi = self.bg_shifter_tile_hi
+        cdef int attrib_lo = self.bg_shifter_attrib_lo
+        cdef int attrib_hi = self.bg_shifter_attrib_hi
+        cdef unsigned char[:, :, ::1] tiles = self.cartridge.tile_view
+        cdef list bases = self.cartridge.chr_tile_bases()
+        cdef int tile_bases[4]
+        cdef unsigned char line_pixels[272]
+        cdef unsigned char line_palettes[272]
+        cdef unsigned char bg_pixels[256]
+        cdef unsigned char bg_palettes[256]
+        cdef int x, p, i, k, shift, tile, palette, lsb_prev = 0, msb_prev = 0, attrib_prev = 0
+
+        for i in range(4):
+            tile_bases[i] = bases[table * 4 + i]
+        # The two tiles already in the shifters come out first
+        for p in range(16):
+            line_pixels[p] = (((tile_hi >> (15 - p)) & 0x01) << 1) | ((tile_lo >> (15 - p)) & 0x01)
+            line_palettes[p] = (((attrib_hi >> (15 - p)) & 0x01) << 1) | ((attrib_lo >> (15 - p)) & 0x01)
+
+        # Dots 1-256: fetch the next 32 tiles; only the last two reach the shifters
+        for k in range(32):
+            if k == 31:
+                lsb_prev = self.bg_next_tile_lsb
+                msb_prev = self.bg_next_tile_msb
+                attrib_prev = self.bg_next_tile_attrib
+            self._fetch_nt(); self._fetch_at()
+            if k >= 30:
+                self._fetch_pt_lo(); self._fetch_pt_hi()
+            if bg_enabled:
+                tile = tile_bases[self.bg_next_tile_id >> 6] + (self.bg_next_tile_id & 0x3F)
+                palette = self.bg_next_tile_attrib
+                for p in range(8):
+                    line_pixels[16 + k * 8 + p] = tiles[tile, fine_y, p]
+                    line_palettes[16 + k * 8 + p] = palette
+            self._increment_scroll_x()
+
+        if bg_enabled:
+            for x in range(256):
+                bg_pixels[x] = line_pixels[x + fine_x]
+                bg_palettes[x] = line_palettes[x + fine_x]
+            tile_lo = (lsb_prev << 8) | self.bg_next_tile_lsb
+            tile_hi = (msb_prev << 8) | self.bg_next_tile_msb
+            attrib_lo = (0xFF00 if (attrib_prev & 0x01) else 0x00) | (0xFF if (self.bg_next_tile_attrib & 0x01) else 0x00)
+            attrib_hi = (0xFF00 if (attrib_prev & 0x02) else 0x00) | (0xFF if (self.bg_next_tile_attrib & 0x02) else 0x00)
+        else:
+            for x in range(256):
+                bg_pixels[x] = 0
+                bg_palettes[x] = 0
+            tile_lo = (tile_lo & 0xFF00) | self.bg_next_tile_lsb
+            tile_hi = (tile_hi & 0xFF00) | self.bg_next_tile_msb
+            attrib_lo = (attrib_lo & 0xFF00) | (0xFF if (self.bg_next_tile_attrib & 0x01) else 0x00)
+            attrib_hi = (attrib_hi & 0xFF00) | (0xFF if (self.bg_next_tile_attrib & 0x02) else 0x00)
+
+        if scanline >= 0:
+            if not (ppu_mask & 0x02):
+                for x in range(8): bg_pixels[x] = 0
+            self._compose_scanline(bg_pixels, bg_palettes)
+
+        if ppu_mask & 0x10:
+            # Every active sprite has been counted down and shifted by dot 256
+            for i in range(self.sprite_count):
+                shift = 256 - self.sprite_x_counters[i]
+                if shift < 8:
+                    self.sprite_shifter_pattern_lo[i] = (self.sprite_shifter_pattern_lo[i] << shift) & 0xFF
+                    self.sprite_shifter_pattern_hi[i] = (self.sprite_shifter_pattern_hi[i] << shift) & 0xFF
+                else:
+                    self.sprite_shifter_pattern_lo[i] = 0
+                    self.sprite_shifter_pattern_hi[i] = 0
+                self.sprite_x_counters[i] = 0
+
+        self._increment_scroll_y()
+        self._evaluate_sprites()
+        self._reset_scroll_x()
+        if scanline == -1:
+            self._reset_scroll_y()
+
+        # Dots 321-336: prefetch the first two tiles of the next line
+        for i in range(2):
+            if bg_enabled:
+                tile_lo = (tile_lo << 8) & 0xFFFF
+                tile_hi = (tile_hi << 8) & 0xFFFF
+                attrib_lo = (attrib_lo << 8) & 0xFFFF
+                attrib_hi = (attrib_hi << 8) & 0xFFFF
+            self._fetch_nt(); self._fetch_at(); self._fetch_pt_lo(); self._fetch_pt_hi()
+            tile_lo = (tile_lo & 0xFF00) | self.bg_next_tile_lsb
+            tile_hi = (tile_hi & 0xFF00) | self.bg_next_tile_msb
+            attrib_lo = (attrib_lo & 0xFF00) | (0xFF if (self.bg_next_tile_attrib & 0x01) else 0x00)
+            attrib_hi = (attrib_hi & 0xFF00) | (0xFF if (self.bg_next_tile_attrib & 0x02) else 0x00)
+            self._increment_scroll_x()
+
+        self.bg_shifter_tile_lo = tile_lo
+        self.bg_shifter_tile_hi = tile_hi
+        self.bg_shifter_attrib_lo = attrib_lo
+        self.bg_shifter_attrib_hi = attrib_hi
+
+    cdef void _compose_scanline(self, unsigned char* bg_pixels, unsigned char* bg_palettes):
+        # Mixes the line's sprites over the background exactly like _render_pixel
+        cdef int ppu_mask = self.ppu_mask
+        cdef unsigned char fg_pixels[256]
+        cdef unsigned char fg_palettes[256]
+        cdef unsigned char fg_priorities[256]
+        cdef unsigned char sprite0_pixels[256]
+        cdef unsigned char colors[32]
+        cdef int first_x = 0 if (ppu_mask & 0x04) else 8
+        cdef bint hit_enabled = (ppu_mask & 0x18) == 0x18
+        cdef int i, p, x, lo, hi, attr, sprite_palette, priority, is_sprite0
+        cdef int pixel, palette, fg_pixel, pal_addr
+
+        for x in range(256):
+            fg_pixels[x] = 0
+        if ppu_mask & 0x10:
+            # Lower OAM indices are drawn last so they win
+            for i in range(self.sprite_count - 1, -1, -1):
+                lo = self.sprite_shifter_pattern_lo[i]
+                hi = self.sprite_shifter_pattern_hi[i]
+                attr = self.sprite_attribs[i]
+                sprite_palette = (attr & 0x03) + 0x04
+                priority = 1 if (attr & 0x20) == 0 else 0
+                is_sprite0 = 1 if (i == 0 and self.sprite_zero_hit_possible) else 0
+                for p in range(8):
+                    x = self.sprite_x_counters[i] + p
+                    pixel = (((hi >> (7 - p)) & 0x01) << 1) | ((lo >> (7 - p)) & 0x01)
+                    if first_x <= x < 256 and pixel:
+                        fg_pixels[x] = pixel
+                        fg_palettes[x] = sprite_palette
+                        fg_priorities[x] = priority
+                        sprite0_pixels[x] = is_sprite0
+
+        for pal_addr in range(32):
+            if pal_addr & 0x03:
+                colors[pal_addr] = self.palette_vram[(pal_addr & ~0x10) if (pal_addr & 0x13) == 0x10 else pal_addr]
+            else:
+                colors[pal_addr] = self.palette_vram[0]
+            if ppu_mask & 0x01: colors[pal_addr] &= 0x30
+
+        for x in range(256):
+            pixel = bg_pixels[x]
+            palette = bg_palettes[x]
+            fg_pixel = fg_pixels[x]
+            if fg_pixel:
+                if pixel == 0 or fg_priorities[x]:
+                    if pixel and sprite0_pixels[x] and hit_enabled and x < 255:
+                        self.ppu_status |= 0x40
+                    pixel = fg_pixel
+                    palette = fg_palettes[x]
+                elif sprite0_pixels[x] and hit_enabled and x < 255:
+                    self.ppu_status |= 0x40
+            self.pixels_view[self.scanline, x] = colors[(palette << 2) | pixel]
 
     cpdef void _render_pixel(self):
         cdef int ppu_mask = self.ppu_mask
@@ -356,7 +625,7 @@ cdef class PPU:
             if res != -1: return res # Fall through if -1
         
         if addr <= 0x1FFF: return 0
-        elif addr <= 0x3EFF: return self.vram[self._map_nt_addr(addr)]
+        elif addr <= 0x3EFF: return self._nt_pages[(addr >> 10) & 0x03][addr & 0x03FF]
         else:
             addr &= 0x001F
             if (addr & 0x13) == 0x10: addr &= ~0x10
@@ -368,7 +637,7 @@ cdef class PPU:
             if self.cartridge.ppu_write(addr, data) != -1: return # Fall through if -1
 
         if addr <= 0x1FFF: return
-        elif addr <= 0x3EFF: self.vram[self._map_nt_addr(addr)] = data & 0xFF
+        elif addr <= 0x3EFF: self._nt_pages[(addr >> 10) & 0x03][addr & 0x03FF] = data & 0xFF
         else:
             addr &= 0x001F
             if (addr & 0x13) == 0x10: addr &= ~0x10
@@ -377,20 +646,36 @@ cdef class PPU:
     cpdef void connect_cartridge(self, Cartridge cartridge):
         self.cartridge = cartridge
         if cartridge is not None and cartridge.rom is not None:
-            self.mirror_mode = cartridge.rom.mirroring
-
-    cdef inline int _map_nt_addr(self, int addr):
-        cdef int mode = self.mirror_mode
+            self._mirror_mode = cartridge.rom.mirroring
+        self.map_nametables()
+
+    property vram:
+        def __get__(self):
+            return self._vram
+        def __set__(self, val):
+            self._vram = val
+            self.map_nametables()
+
+    property mirror_mode:
+        def __get__(self):
+            return self._mirror_mode
+        def __set__(self, int val):
+            self._mirror_mode = val
+            self.map_nametables()
+
+    cpdef void map_nametables(self):
+        # Point the four nametables at their VRAM pages. Has to be called
+        # whenever the cartridge's mirroring changes.
+        cdef int mode = self._mirror_mode
+        cdef int nt
         if self.cartridge is not None and self.cartridge.mapper is not None:
-             mode = self.cartridge.mapper.mirror_mode
-             
-        addr &= 0x0FFF
-        if mode == 1: # VERTICAL: A B A B
-            return addr & 0x07FF
-        elif mode == 0: # HORIZONTAL: A A B B
-            return (addr & 0x03FF) | ((addr & 0x0800) >> 1)
-        elif mode == 2: # ONESCREEN_LO
-            return addr & 0x03FF
-        elif mode == 3: # ONESCREEN_HI
-            return (addr & 0x03FF) | 0x0400
-        return addr & 0x07FF
+            mode = self.cartridge.mapper.mirror_mode
+        for nt in range(4):
+            if mode == 0: # HORIZONTAL: A A B B
+                self._nt_pages[nt] = &self._vram[(nt >> 1) * 0x0400]
+            elif mode == 2: # ONESCREEN_LO
+                self._nt_pages[nt] = &self._vram[0x0000]
+            elif mode == 3: # ONESCREEN_HI
+                self._nt_pages[nt] = &self._vram[0x0400]
+            else: # VERTICAL: A B A B
+                self._nt_pages[nt] = &self._vram[(nt & 0x01) * 0x0400]
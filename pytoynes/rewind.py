@@ -0,0 +1,104 @@
+import zlib
+from collections import deque
+from typing import List, Optional
+import numpy as np
+from .emulator import Emulator
+
+
+class _Segment:
+    # Deltas of up to segment_frames consecutive frames in one zlib stream,
+    # flushed after every frame so each one can be told apart when decoding
+    def __init__(self, level: int):
+        self.chunks: List[bytes] = []
+        self.size = 0
+        self.compressor = zlib.compressobj(level)
+        self.decoded: Optional[List[bytes]] = None
+
+
+class Rewind:
+    """Per-frame save states of an Emulator, to step back through.
+
+    Only the newest state is kept whole. Each older one is stored as its XOR
+    against the state after it: a bitmask of the bytes that changed followed
+    by their values. Frames are grouped into segments compressed as a single
+    zlib stream, so the bytes that change every frame are shared between
+    them. The oldest segments are dropped to stay within memory_budget bytes.
+    """
+
+    def __init__(self, emulator: Emulator, memory_budget: int = 32 << 20,
+                 segment_frames: int = 64, level: int = 6):
+        self.emulator = emulator
+        self.memory_budget = memory_budget
+        self.segment_frames = segment_frames
+        self.level = level
+        self._segments = deque()
+        self.memory_used = 0
+        self._has_state = False
+        self._size = emulator.state_size
+        self._buffers = [bytearray(self._size), bytearray(self._size)]
+        self._delta = np.zeros(self._size, dtype=np.uint8)
+        self._mask_size = (self._size + 7) // 8
+
+    def __len__(self) -> int:
+        return sum(len(segment.chunks) for segment in self._segments) + self._has_state
+
+    def clear(self):
+        self._segments.clear()
+        self.memory_used = 0
+        self._has_state = False
+
+    def push(self):
+        # Call once per frame to record the current state
+        newest, previous = self._buffers
+        self.emulator.snapshot(previous)
+        self._buffers = [previous, newest]
+        if not self._has_state:
+            self._has_state = True
+            return
+
+        delta = self._delta
+        np.bitwise_xor(np.frombuffer(newest, dtype=np.uint8), np.frombuffer(previous, dtype=np.uint8), out=delta)
+        changed = delta != 0
+        segment = self._segments[-1] if self._segments else None
+        if segment is None or segment.compressor is None or len(segment.chunks) == self.segment_frames:
+            segment = _Segment(self.level)
+            self._segments.append(segment)
+        compressor = segment.compressor
+        chunk = (compressor.compress(np.packbits(changed)) + compressor.compress(delta[changed])
+                 + compressor.flush(zlib.Z_SYNC_FLUSH))
+        segment.chunks.append(chunk)
+        segment.size += len(chunk)
+        self.memory_used += len(chunk)
+        while self.memory_used > self.memory_budget and len(self._segments) > 1:
+            self.memory_used -= self._segments.popleft().size
+
+    def pop(self) -> bool:
+        # Forget the newest recorded state and restore the one before it, which
+        # stays recorded so the next push() follows on from it. False once
+        # there is no earlier state.
+        if not self._segments:
+            return False
+        segment = self._segments[-1]
+        if segment.decoded is None:
+            # Nothing more can be appended to the stream once frames are taken off
+            segment.compressor = None
+            decompressor = zlib.decompressobj()
+            segment.decoded = [decompressor.decompress(chunk) for chunk in segment.chunks]
+            # Held until popped, so counted like the chunks
+            decoded_size = sum(len(payload) for payload in segment.decoded)
+            segment.size += decoded_size
+            self.memory_used += decoded_size
+        payload = segment.decoded.pop()
+        chunk = segment.chunks.pop()
+        segment.size -= len(chunk) + len(payload)
+        self.memory_used -= len(chunk) + len(payload)
+        if not segment.chunks:
+            self._segments.pop()
+
+        payload = np.frombuffer(payload, dtype=np.uint8)
+        changed = np.flatnonzero(np.unpackbits(payload[:self._mask_size], count=self._size))
+        newest = self._buffers[0]
+        state = np.frombuffer(newest, dtype=np.uint8)
+        state[changed] ^= payload[self._mask_size:]
+        self.emulator.restore(newest)
+        return True
@@ -1,3 +1,4 @@
+import mmap
 from enum import IntEnum
 
 class MirrorMode(IntEnum):
@@ -16,7 +17,10 @@ class Rom:
         self.path = path
 
         with open(self.path, 'rb') as f:
-            rom_data = f.read()
+            # Mapped read-only, so every process loading the same file shares
+            # the pages of PRG/CHR-ROM
+            rom_data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            rom_view = memoryview(rom_data)
             if rom_data[0:3] != b'NES' or rom_data[3] != 0x1A:
                 raise ValueError("Invalid iNES header")
 
@@ -76,8 +80,8 @@ class Rom:
                 self.trainer = rom_data[cursor:cursor+512]
                 cursor += 512
 
-            self.prg_rom_data = rom_data[cursor:cursor+self.num_prg_banks*16384]
+            self.prg_rom_data = rom_view[cursor:cursor+self.num_prg_banks*16384]
             cursor += self.num_prg_banks*16384
 
-            self.chr_rom_data = rom_data[cursor:cursor+self.num_chr_banks*8192]
+            self.chr_rom_data = rom_view[cursor:cursor+self.num_chr_banks*8192]
             cursor += self.num_chr_banks*8192
@@ -0,0 +1,173 @@
+"""Snapshots of the whole console in a flat binary buffer.
+
+The layout is fixed once per console: the scalar registers of every chip are
+packed with a single struct, followed by straight copies of each memory block.
+The code moving the registers in and out is generated for the layout, the
+same way translate.py builds CPU blocks, so a snapshot costs one call instead
+of a getattr/setattr round per field.
+"""
+import struct
+from typing import Callable, List, Tuple
+import numpy as np
+from .scheduler import NUM_EVENTS
+
+_CPU_FIELDS = ('a', 'x', 'y', 'p', 'stkp', 'pc', 'cycle', 'fetched', 'abs_addr', 'rel_addr', 'opcode',
+               'jammed', '_fetch_from_mem', '_extra_cycles')
+
+_PPU_FIELDS = (
+    'ppu_ctrl', 'ppu_mask', 'ppu_status', 'oam_addr', 'oam_data', 'v', 't', 'fine_x', 'w',
+    'ppu_data_buffer', 'scanline', 'cycle', 'total_cycles', 'frame_count',
+    'nmi', 'is_odd_frame', 'sprite_zero_hit_possible', 'sprite_count',
+    'bg_next_tile_id', 'bg_next_tile_attrib', 'bg_next_tile_lsb', 'bg_next_tile_msb',
+    'bg_shifter_tile_lo', 'bg_shifter_tile_hi', 'bg_shifter_attrib_lo', 'bg_shifter_attrib_hi',
+)
+
+_PPU_MEMORY = ('vram', 'palette_vram', 'oam_vram', 'secondary_oam', 'sprite_shifter_pattern_lo',
+               'sprite_shifter_pattern_hi', 'sprite_attribs', 'sprite_x_counters')
+
+# The output buffers (audio_buffer, pulse1_samples and their pointers) are left out
+_APU_FIELDS = (
+    'pulse1_enabled', 'pulse2_enabled', 'triangle_enabled', 'noise_enabled', 'dmc_enabled',
+    'pulse1_duty_mode', 'pulse1_duty_step', 'pulse1_timer_reload', 'pulse1_timer_value',
+    'pulse1_lc_value', 'pulse1_lc_halt',
+    'pulse2_duty_mode', 'pulse2_duty_step', 'pulse2_timer_reload', 'pulse2_timer_value',
+    'pulse2_lc_value', 'pulse2_lc_halt',
+    'tri_timer_reload', 'tri_timer_value', 'tri_lc_value', 'tri_lc_halt', 'tri_linear_reload',
+    'tri_linear_value', 'tri_linear_reload_flag', 'tri_step',
+    'p1_sweep_enabled', 'p1_sweep_period', 'p1_sweep_negate', 'p1_sweep_shift', 'p1_sweep_reload',
+    'p1_sweep_divider',
+    'p2_sweep_enabled', 'p2_sweep_period', 'p2_sweep_negate', 'p2_sweep_shift', 'p2_sweep_reload',
+    'p2_sweep_divider',
+    'noise_timer_reload', 'noise_timer_value', 'noise_shift_reg', 'noise_mode', 'noise_lc_value',
+    'noise_lc_halt', 'noise_env_loop', 'noise_env_const', 'noise_env_vol_period', 'noise_env_start',
+    'noise_env_divider', 'noise_env_decay',
+    'pulse1_env_loop', 'pulse1_env_const', 'pulse1_env_vol_period', 'pulse1_env_start',
+    'pulse1_env_divider', 'pulse1_env_decay',
+    'pulse2_env_loop', 'pulse2_env_const', 'pulse2_env_vol_period', 'pulse2_env_start',
+    'pulse2_env_divider', 'pulse2_env_decay',
+    'frame_counter_mode', 'frame_counter_step', 'frame_counter_cycles', 'frame_irq_active',
+    'frame_irq_inhibit',
+    'dmc_irq_enabled', 'dmc_loop', 'dmc_rate_index', 'dmc_direct_load', 'dmc_sample_addr',
+    'dmc_sample_len', 'dmc_current_addr', 'dmc_bytes_remaining', 'dmc_sample_buffer',
+    'dmc_buffer_full', 'dmc_shift_reg', 'dmc_bits_remaining', 'dmc_timer_value', 'dmc_timer_reload',
+    'dmc_irq_active', 'dmc_silence_flag',
+    'clock_divider', 'total_cycles', 'cycle_acc',
+)
+
+# Fractional in the pure Python APU
+_FLOAT_FIELDS = {'cycle_acc'}
+
+_MAPPER_FIELDS = {
+    'Mapper000': (),
+    'Mapper001': ('shift_reg', 'shift_count', 'control_reg', 'chr_bank0_reg', 'chr_bank1_reg',
+                  'prg_bank_reg'),
+    'Mapper002': ('prg_bank_lo', 'prg_bank_hi'),
+    'Mapper003': ('chr_bank',),
+    'Mapper004': ('target_reg', 'prg_bank_mode', 'chr_invert', 'irq_counter', 'irq_latch',
+                  'irq_enabled', 'reload_flag'),
+}
+
+_CONTROLLER_FIELDS = ('state', 'snapshot', 'strobe')
+
+
+def _number(value: float):
+    # The compiled APU keeps cycle_acc as an int
+    return int(value) if value.is_integer() else value
+
+
+class StateLayout:
+    """Where each piece of a console's state lives in a snapshot buffer."""
+
+    def __init__(self, cpu, bus):
+        self.cpu, self.bus = cpu, bus
+        ppu, apu, cartridge = bus.ppu, bus.apu, bus.cartridge
+        mapper = cartridge.mapper
+
+        # (getter expression, setter statement, struct format) of every scalar
+        scalars: List[Tuple[str, str, str]] = []
+
+        def add(obj_name, obj, names):
+            for name in names:
+                # Some registers only exist in one of the two builds
+                if hasattr(obj, name):
+                    if name in _FLOAT_FIELDS:
+                        scalars.append((f'{obj_name}.{name}', f'{obj_name}.{name} = _number({{}})', 'd'))
+                    else:
+                        scalars.append((f'{obj_name}.{name}', f'{obj_name}.{name} = {{}}', 'q'))
+
+        add('cpu', cpu, _CPU_FIELDS)
+        add('bus', bus, ('total_cycles',))
+        add('ppu', ppu, _PPU_FIELDS)
+        add('apu', apu, _APU_FIELDS)
+        mapper_start = len(scalars)
+        add('mapper', mapper, ('mirror_mode',) + _MAPPER_FIELDS.get(type(mapper).__name__, ()))
+        if hasattr(mapper, 'regs'):
+            count = len(mapper.regs)
+            scalars += [(f'mapper.regs[{i}]', '', 'q') for i in range(count)]
+            scalars[-1] = (scalars[-1][0], f'mapper.regs = list(values[{{index}} - {count - 1}:{{index}} + 1])', 'q')
+        self._mapper_fields = slice(mapper_start, len(scalars))
+        add('mapper', mapper, ('irq_active',))
+        for i in range(len(bus.controllers)):
+            add(f'controllers[{i}]', bus.controllers[i], _CONTROLLER_FIELDS)
+        scalars += [(f'scheduler.timestamp({event})', f'scheduler.schedule({event}, {{}})', 'q')
+                    for event in range(NUM_EVENTS)]
+
+        self._struct = struct.Struct('<' + ''.join(fmt for _, _, fmt in scalars))
+        self._get, self._set = _compile(scalars)
+        self._get_banking = _compile(scalars[self._mapper_fields])[0]
+
+        # CHR-ROM never changes, CHR-RAM is saved along with its decoded tiles
+        blocks = [bus.ram] + [getattr(ppu, name) for name in _PPU_MEMORY] + [cartridge.prg_ram]
+        if mapper.num_chr_banks == 0:
+            blocks += [cartridge.chr_memory, cartridge.tiles]
+        self._blocks = [np.asarray(block).reshape(-1) for block in blocks]
+        self._ranges = []
+        offset = self._struct.size
+        for block in self._blocks:
+            self._ranges.append((offset, offset + block.nbytes))
+            offset += block.nbytes
+        self.size = offset
+
+    def _sync(self):
+        # Bring the lazily clocked chips up to the CPU, leaving no deferred
+        # PPU register writes behind
+        bus = self.bus
+        bus.ppu.run_to(bus.total_cycles * 3)
+        if bus.total_cycles > bus.apu.total_cycles:
+            bus.apu.clock_n(bus.total_cycles - bus.apu.total_cycles)
+
+    def _args(self):
+        bus = self.bus
+        return self.cpu, bus, bus.ppu, bus.apu, bus.cartridge.mapper, bus.scheduler, bus.controllers
+
+    def save(self, buffer):
+        self._sync()
+        self._struct.pack_into(buffer, 0, *self._get(*self._args()))
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        for block, (start, end) in zip(self._blocks, self._ranges):
+            data[start:end] = block
+
+    def load(self, buffer):
+        self._sync()
+        args = self._args()
+        values = self._struct.unpack_from(buffer, 0)
+        banking = self._get_banking(*args)
+        self._set(*args, values)
+        data = np.frombuffer(buffer, dtype=np.uint8)
+        for block, (start, end) in zip(self._blocks, self._ranges):
+            block[:] = data[start:end]
+        # Banks, CPU pages and nametables follow from the mapper registers
+        if values[self._mapper_fields] != banking:
+            self.bus.cartridge.mapper._bank_switch()
+
+
+def _compile(scalars: List[Tuple[str, str, str]]) -> Tuple[Callable, Callable]:
+    params = 'cpu, bus, ppu, apu, mapper, scheduler, controllers'
+    lines = [f'def get({params}):', '    return (']
+    lines += [f'        {getter},' for getter, _, _ in scalars]
+    lines += ['    )', f'def set({params}, values):']
+    lines += [f'    {setter.format(f"values[{index}]", index=index)}'
+              for index, (_, setter, _) in enumerate(scalars) if setter]
+    namespace = {'_number': _number}
+    exec('\n'.join(lines), namespace)
+    return namespace['get'], namespace['set']
@@ -0,0 +1,21 @@
+# cython: language_level=3
+
+# Event slots, all timestamps are absolute CPU cycles (Bus.total_cycles)
+cpdef enum:
+    EVENT_FRAME_END = 0
+    EVENT_NMI = 1
+    EVENT_MAPPER_IRQ = 2
+    EVENT_FRAME_COUNTER = 3
+    EVENT_DMC = 4
+    EVENT_IRQ_POLL = 5
+    NUM_EVENTS = 6
+
+cdef class Scheduler:
+    cdef long long timestamps[NUM_EVENTS]
+    cdef public long long next_event
+
+    cpdef void schedule(self, int event, long long timestamp)
+    cpdef void schedule_before(self, int event, long long timestamp)
+    cpdef void cancel(self, int event)
+    cpdef bint is_due(self, int event, long long now)
+    cpdef long long timestamp(self, int event)
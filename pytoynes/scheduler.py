@@ -0,0 +1,34 @@
+# Event slots, all timestamps are absolute CPU cycles (Bus.total_cycles)
+EVENT_FRAME_END = 0
+EVENT_NMI = 1
+EVENT_MAPPER_IRQ = 2
+EVENT_FRAME_COUNTER = 3
+EVENT_DMC = 4
+EVENT_IRQ_POLL = 5
+NUM_EVENTS = 6
+
+NEVER = 1 << 62
+
+class Scheduler:
+    def __init__(self):
+        self.timestamps = [NEVER] * NUM_EVENTS
+        # Earliest pending timestamp; the CPU runs freely until it is reached
+        self.next_event = NEVER
+
+    def schedule(self, event: int, timestamp: int):
+        self.timestamps[event] = timestamp
+        self.next_event = min(self.timestamps)
+
+    def schedule_before(self, event: int, timestamp: int):
+        # Only ever moves the event earlier
+        if timestamp < self.timestamps[event]:
+            self.schedule(event, timestamp)
+
+    def cancel(self, event: int):
+        self.schedule(event, NEVER)
+
+    def is_due(self, event: int, now: int) -> bool:
+        return self.timestamps[event] <= now
+
+    def timestamp(self, event: int) -> int:
+        return self.timestamps[event]
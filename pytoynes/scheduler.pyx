@@ -0,0 +1,34 @@
+# cython: language_level=3, boundscheck=False, wraparound=False
+
+cdef long long _NEVER = 1 << 62
+NEVER = _NEVER
+
+cdef class Scheduler:
+    def __init__(self):
+        cdef int i
+        for i in range(NUM_EVENTS):
+            self.timestamps[i] = _NEVER
+        # Earliest pending timestamp; the CPU runs freely until it is reached
+        self.next_event = _NEVER
+
+    cpdef void schedule(self, int event, long long timestamp):
+        cdef int i
+        self.timestamps[event] = timestamp
+        self.next_event = self.timestamps[0]
+        for i in range(1, NUM_EVENTS):
+            if self.timestamps[i] < self.next_event:
+                self.next_event = self.timestamps[i]
+
+    cpdef void schedule_before(self, int event, long long timestamp):
+        # Only ever moves the event earlier
+        if timestamp < self.timestamps[event]:
+            self.schedule(event, timestamp)
+
+    cpdef void cancel(self, int event):
+        self.schedule(event, _NEVER)
+
+    cpdef bint is_due(self, int event, long long now):
+        return self.timestamps[event] <= now
+
+    cpdef long long timestamp(self, int event):
+        return self.timestamps[event]
@@ -0,0 +1,275 @@
+"""Translation of straight-line 6502 code into Python functions.
+
+A block starts at a PRG-ROM address and runs up to the next branch, jump or
+return. Each instruction is specialized to its operands and the registers
+live in locals while the block runs. `Bus.total_cycles` is still advanced
+after every instruction, and the block hands control back as soon as the
+next scheduled event is due, so I/O and interrupts see the same timing as
+with `MOS6502.clock`.
+"""
+import re
+from typing import Callable, List
+from .flags import NZ, ADC
+
+# Longest run of instructions translated into one block
+MAX_BLOCK_LENGTH = 32
+
+_OPERAND_SIZES = {
+    'imp': 0, 'imm': 1, 'zp0': 1, 'zpx': 1, 'zpy': 1, 'rel': 1, 'izx': 1, 'izy': 1,
+    'abs': 2, 'abx': 2, 'aby': 2, 'ind': 2,
+}
+
+# Instructions whose page crossing costs an extra cycle (their _comp_ returns 1)
+_PAGE_PENALTY = {'adc', 'sbc', 'and', 'cmp', 'eor', 'lda', 'ldx', 'ldy', 'ora', 'nop', 'lax'}
+
+_BRANCHES = {
+    'bcc': 'not p & 0x01', 'bcs': 'p & 0x01', 'bne': 'not p & 0x02', 'beq': 'p & 0x02',
+    'bvc': 'not p & 0x40', 'bvs': 'p & 0x40', 'bpl': 'not p & 0x80', 'bmi': 'p & 0x80',
+}
+
+_ASSIGNED = re.compile(r'\b([axyps])\s*[-+&|^]?=(?!=)')
+_STATE = {'a': 'cpu.a', 'x': 'cpu.x', 'y': 'cpu.y', 'p': 'cpu.p', 's': 'cpu.stkp'}
+
+
+def _load(reg):
+    return lambda v, w: [f'{reg} = {v}', f'p = (p & 0x7D) | NZ[{reg}]']
+
+def _store(val):
+    return lambda v, w: [w(f'{val} & 0xFF')]
+
+def _logic(op):
+    return lambda v, w: [f'a {op}= {v}', 'p = (p & 0x7D) | NZ[a]']
+
+def _compare(reg):
+    return lambda v, w: [f'v = {v}', f'p = (p & 0x7C) | ({reg} >= v) | NZ[({reg} - v) & 0xFF]']
+
+def _step(reg, delta):
+    return lambda v, w: [f'{reg} = ({reg} {delta}) & 0xFF', f'p = (p & 0x7D) | NZ[{reg}]']
+
+def _transfer(dst, src):
+    return lambda v, w: [f'{dst} = {src}', f'p = (p & 0x7D) | NZ[{dst}]']
+
+def _flags(expr):
+    return lambda v, w: [expr]
+
+def _add(v, w):
+    return [f'r = ADC[((p & 0x01) << 16) | (a << 8) | {v}]', 'p = (p & 0x3C) | (r & 0xFF)', 'a = r >> 8']
+
+def _sub(v, w):
+    return _add(f'({v} ^ 0xFF)', w)
+
+def _then(first, second):
+    # The illegal read-modify-write opcodes fetch their operand again for the second half
+    return lambda v, w: first(v, w) + second(v, w)
+
+_OPS = {
+    'lda': _load('a'), 'ldx': _load('x'), 'ldy': _load('y'),
+    'lax': lambda v, w: _load('a')(v, w) + _load('x')(v, w),
+    'sta': _store('a'), 'stx': _store('x'), 'sty': _store('y'), 'sax': _store('x & a'),
+    'adc': _add, 'sbc': _sub,
+    'and': _logic('&'), 'ora': _logic('|'), 'eor': _logic('^'),
+    'cmp': _compare('a'), 'cpx': _compare('x'), 'cpy': _compare('y'),
+    'bit': lambda v, w: [f'v = {v}', 'p = (p & 0x3D) | (0 if a & v else 0x02) | (v & 0xC0)'],
+    'inc': lambda v, w: [f'r = ({v} + 1) & 0xFF', 'p = (p & 0x7D) | NZ[r]', w('r')],
+    'dec': lambda v, w: [f'r = ({v} - 1) & 0xFF', 'p = (p & 0x7D) | NZ[r]', w('r')],
+    'asl': lambda v, w: [f'r = {v} << 1', 'p = (p & 0x7C) | (r > 0xFF) | NZ[r & 0xFF]', w('r & 0xFF')],
+    'lsr': lambda v, w: [f'v = {v}', 'r = v >> 1', 'p = (p & 0x7C) | (v & 0x01) | NZ[r]', w('r')],
+    'rol': lambda v, w: [f'r = ({v} << 1) | (p & 0x01)', 'p = (p & 0x7C) | (r > 0xFF) | NZ[r & 0xFF]',
+                         w('r & 0xFF')],
+    'ror': lambda v, w: [f'v = {v}', 'r = (v >> 1) | ((p & 0x01) << 7)', 'p = (p & 0x7C) | (v & 0x01) | NZ[r]',
+                         w('r')],
+    'inx': _step('x', '+ 1'), 'iny': _step('y', '+ 1'), 'dex': _step('x', '- 1'), 'dey': _step('y', '- 1'),
+    'tax': _transfer('x', 'a'), 'tay': _transfer('y', 'a'), 'txa': _transfer('a', 'x'), 'tya': _transfer('a', 'y'),
+    'tsx': lambda v, w: ['x = s', 'p = (p & 0x7D) | (0x02 if x == 0 else 0) | (x & 0x80)'],
+    'txs': _flags('s = x'),
+    'clc': _flags('p &= 0xFE'), 'sec': _flags('p |= 0x01'), 'cld': _flags('p &= 0xF7'),
+    'sed': _flags('p |= 0x08'), 'clv': _flags('p &= 0xBF'), 'sei': _flags('p |= 0x04'),
+    # A pending IRQ may have just been unmasked
+    'cli': lambda v, w: ['p &= 0xFB', 'bus.poll_irq()'],
+    'plp': lambda v, w: ['s += 1', 'p = (read(0x100 + s) & 0xEF) | 0x20 | (p & 0x10)', 'bus.poll_irq()'],
+    'pha': lambda v, w: ['write(0x100 + s, a)', 's -= 1'],
+    'php': lambda v, w: ['write(0x100 + s, p | 0x30)', 's -= 1', 'p = (p | 0x20) & 0xEF'],
+    'pla': lambda v, w: ['s += 1', 'a = read(0x100 + s)', 'p = (p & 0x7D) | NZ[a]'],
+    'nop': lambda v, w: [],
+}
+_OPS.update({
+    'slo': _then(_OPS['asl'], _OPS['ora']), 'rla': _then(_OPS['rol'], _OPS['and']),
+    'sre': _then(_OPS['lsr'], _OPS['eor']), 'rra': _then(_OPS['ror'], _OPS['adc']),
+    'dcp': _then(_OPS['dec'], _OPS['cmp']), 'isc': _then(_OPS['inc'], _OPS['sbc']),
+})
+
+
+def _interpret(cpu, bus):
+    cycles = cpu.clock()
+    bus.total_cycles += cycles
+
+
+def _operand_access(mode: str, operand: int):
+    """Return (setup lines, read expression, write statement builder,
+    condition under which a write reaches the cartridge, page crossing
+    expression) for an addressing mode."""
+    if mode == 'imp':
+        return [], 'a', lambda val: f'a = {val}', None, None
+    if mode == 'imm':
+        return [], f'0x{operand:02X}', None, None, None
+    if mode == 'zp0':
+        target = f'ram[0x{operand:02X}]'
+        return [], target, lambda val: f'{target} = {val}', None, None
+    if mode in ('zpx', 'zpy'):
+        return ([f'ad = (0x{operand:02X} + {mode[2]}) & 0xFF'], 'ram[ad]',
+                lambda val: f'ram[ad] = {val}', None, None)
+    if mode == 'abs':
+        if operand < 0x2000:
+            target = f'ram[0x{operand & 0x07FF:04X}]'
+            return [], target, lambda val: f'{target} = {val}', None, None
+        return ([], f'read(0x{operand:04X})', lambda val: f'write(0x{operand:04X}, {val})',
+                'True' if operand >= 0x4020 else None, None)
+    if mode in ('abx', 'aby'):
+        setup = [f'ad = (0x{operand:04X} + {mode[2]}) & 0xFFFF']
+        cross = f'((ad & 0xFF00) != 0x{operand & 0xFF00:04X})'
+        if operand + 0xFF < 0x2000:
+            return setup, 'ram[ad & 0x07FF]', lambda val: f'ram[ad & 0x07FF] = {val}', None, cross
+        return (setup, 'read(ad)', lambda val: f'write(ad, {val})',
+                'ad >= 0x4020' if operand + 0xFF >= 0x4020 else None, cross)
+    if mode == 'izx':
+        setup = [f'ad = (ram[(0x{operand:02X} + x + 1) & 0xFF] << 8) | ram[(0x{operand:02X} + x) & 0xFF]']
+        return setup, 'read(ad)', lambda val: f'write(ad, {val})', 'ad >= 0x4020', None
+    if mode == 'izy':
+        setup = [f'b = ram[0x{(operand + 1) & 0xFF:02X}] << 8',
+                 f'ad = ((b | ram[0x{operand:02X}]) + y) & 0xFFFF']
+        return setup, 'read(ad)', lambda val: f'write(ad, {val})', 'ad >= 0x4020', '((ad & 0xFF00) != b)'
+    raise ValueError(mode)
+
+
+def _control_flow(op: str, mode: str, operand: int, next_pc: int, cycles: int) -> List[str]:
+    """Lines for an instruction that ends a block; they set `pc` and charge
+    the instruction's cycles."""
+    if op in _BRANCHES:
+        rel = operand | 0xFF00 if operand & 0x80 else operand
+        target = (next_pc + rel) & 0xFFFF
+        taken = cycles + 1 + ((target & 0xFF00) != (next_pc & 0xFF00))
+        return [f'if {_BRANCHES[op]}:',
+                f'    pc = 0x{target:04X}', f'    bus.total_cycles += {taken}',
+                'else:',
+                f'    pc = 0x{next_pc:04X}', f'    bus.total_cycles += {cycles}']
+    lines = []
+    if op == 'jmp' and mode == 'ind':
+        ptr_hi = operand & 0xFF00 if operand & 0xFF == 0xFF else operand + 1
+        lines.append(f'pc = (read(0x{ptr_hi:04X}) << 8) | read(0x{operand:04X})')
+    elif op == 'jmp':
+        lines.append(f'pc = 0x{operand:04X}')
+    elif op == 'jsr':
+        ret = next_pc - 1
+        lines += [f'write(0x100 + s, 0x{ret >> 8:02X})', 's -= 1',
+                  f'write(0x100 + s, 0x{ret & 0xFF:02X})', 's -= 1',
+                  f'pc = 0x{operand:04X}']
+    elif op == 'rts':
+        lines += ['s += 1', 'lo = read(0x100 + s)', 's += 1',
+                  'pc = ((read(0x100 + s) << 8) | lo) + 1']
+    elif op == 'rti':
+        lines += ['s += 1', 'p = (read(0x100 + s) & 0xEF) | 0x20', 's += 1', 'lo = read(0x100 + s)',
+                  's += 1', 'pc = (read(0x100 + s) << 8) | lo', 'bus.poll_irq()']
+    lines.append(f'bus.total_cycles += {cycles}')
+    return lines
+
+
+def _write_back(dirty, pc: str) -> str:
+    return '; '.join([f'{_STATE[reg]} = {reg}' for reg in 'axyps' if reg in dirty] + [f'cpu.pc = {pc}'])
+
+
+def translate_block(cpu, pc: int) -> Callable:
+    """Build a function(cpu, bus) that runs the block of code at `pc`. If
+    the first instruction can't be translated the function falls back to
+    a single `cpu.clock()`."""
+    read = cpu.bus.read
+    start, window = pc, pc >> 13
+    dirty = set()
+    # (lines, cycles or None if the lines charge them, pc after, extra exit condition, registers to write back)
+    instructions = []
+    # A block that only reads RAM or $2002 and jumps back to its start is an idle loop
+    idle, reads_status = True, False
+    while len(instructions) < MAX_BLOCK_LENGTH:
+        entry = cpu.opcode_table[read(pc)]
+        if entry is None:
+            break
+        _, comp, addr, cycles = entry
+        op, mode = comp.__name__[6:], addr.__name__[6:]
+        size = 1 + _OPERAND_SIZES[mode]
+        if (pc + size - 1) >> 13 != window:
+            break
+        operand = read(pc + 1) | (read(pc + 2) << 8) if size == 3 else read(pc + 1) if size == 2 else 0
+        next_pc = pc + size
+
+        if op in _BRANCHES or op in ('jmp', 'jsr', 'rts', 'rti'):
+            lines = _control_flow(op, mode, operand, next_pc, cycles)
+            dirty.update(_ASSIGNED.findall('\n'.join(lines)))
+            if op in _BRANCHES:
+                rel = operand | 0xFF00 if operand & 0x80 else operand
+                idle = idle and (next_pc + rel) & 0xFFFF == start
+            else:
+                idle = idle and op == 'jmp' and mode == 'abs' and operand == start
+            instructions.append((lines, None, 'pc', None, set(dirty)))
+            break
+        if op not in _OPS:
+            break
+
+        setup, value, write, reaches_cartridge, cross = _operand_access(mode, operand)
+        writes = []
+        def recording_write(val, write=write):
+            writes.append(val)
+            return write(val)
+        lines = setup + _OPS[op](value, recording_write)
+        source = '\n'.join(lines)
+        dirty.update(_ASSIGNED.findall(source))
+        if writes or 'write(' in source or 'bus.' in source:
+            idle = False
+        elif 'read(' in source:
+            if mode == 'abs' and 0x2000 <= operand <= 0x3FFF and operand & 0x07 == 0x02:
+                reads_status = True
+            else:
+                idle = False
+        if cross and op in _PAGE_PENALTY:
+            cycles = f'{cycles} + {cross}'
+        if not writes:
+            reaches_cartridge = None
+        instructions.append((lines, cycles, f'0x{next_pc:04X}', reaches_cartridge, set(dirty)))
+        pc = next_pc
+        if reaches_cartridge == 'True':
+            # The write may switch banks under the rest of the block
+            break
+
+    if not instructions:
+        return _interpret
+    body = []
+    last = len(instructions) - 1
+    for index, (lines, cycles, exit_pc, reaches_cartridge, dirty) in enumerate(instructions):
+        body += lines
+        if cycles is None:
+            if idle and index == last:
+                # Starting over with the same registers repeats the same iteration
+                same = ''.join(f' and {reg} == {_STATE[reg]}' for reg in 'axyps' if reg in dirty)
+                body += [f'if pc == 0x{start:04X}{same}:',
+                         f'    bus.skip_idle_loop(bus.total_cycles - t, {reads_status})']
+            body.append(_write_back(dirty, exit_pc))
+        elif index == last:
+            body += [f'bus.total_cycles += {cycles}', _write_back(dirty, exit_pc)]
+        else:
+            check = 'c >= sched.next_event'
+            if reaches_cartridge:
+                check += f' or {reaches_cartridge}'
+            body += [f'bus.total_cycles = c = bus.total_cycles + {cycles}',
+                     f'if {check}:',
+                     f'    {_write_back(dirty, exit_pc)}',
+                     '    return']
+
+    source = '\n'.join(body)
+    prologue = [f'{name} = bus.{attr}' for name, attr in
+                (('sched', 'scheduler'), ('ram', 'ram'), ('read', 'read'), ('write', 'write'),
+                 ('t', 'total_cycles'))
+                if re.search(rf'\b{name}\b', source)]
+    prologue += [f'{reg} = {_STATE[reg]}' for reg in 'axyps' if re.search(rf'\b{reg}\b', source)]
+    name = f'block_{start:04X}'
+    lines = [f'def {name}(cpu, bus):'] + ['    ' + line for line in prologue + body]
+    namespace = {'NZ': NZ, 'ADC': ADC}
+    exec('\n'.join(lines), namespace)
+    return namespace[name]
@@ -79,25 +79,12 @@ def draw_pattern_table(bus: Bus, table_idx: int, rect: pygame.Rect, dst_surf: py
         [255, 255, 255]
     ], dtype=np.uint8)
     
-    # Create 128x128 array for the pattern table
-    pixels = np.zeros((128, 128), dtype=np.uint8)
-    
-    for tile_y in range(16):
-        for tile_x in range(16):
-            tile_idx = tile_y * 16 + tile_x
-            base_addr = table_idx * 0x1000 + tile_idx * 16
-            
-            # Fetch 8x8 tile data
-            for py in range(8):
-                low_byte = ppu.ppu_read(base_addr + py)
-                high_byte = ppu.ppu_read(base_addr + py + 8)
-                
-                # Vectorized bit extraction for 8 pixels at once?
-                # For now just keep the loop but optimized
-                for px in range(8):
-                    bit_pos = 7 - px
-                    pixel_val = (((high_byte >> bit_pos) & 0x01) << 1) | ((low_byte >> bit_pos) & 0x01)
-                    pixels[tile_y * 8 + py, tile_x * 8 + px] = pixel_val
+    # Gather the table's 256 decoded tiles into a 16x16 grid of 8x8 tiles
+    cartridge = ppu.cartridge
+    tile_bases = np.array(cartridge.chr_tile_bases()[table_idx * 4:table_idx * 4 + 4])
+    tile_ids = np.arange(256)
+    tiles = cartridge.tiles[tile_bases[tile_ids >> 6] + (tile_ids & 0x3F)]
+    pixels = tiles.reshape(16, 16, 8, 8).transpose(0, 2, 1, 3).reshape(128, 128)
     
     # Map pixel values to RGB colors
     rgb_array = colors[pixels]
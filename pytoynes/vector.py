@@ -0,0 +1,208 @@
+import multiprocessing
+import os
+from multiprocessing import shared_memory
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from .emulator import Emulator, Inputs
+
+# Per console shape and type of every buffer shared with the worker processes
+_SHARED_BUFFERS = {
+    'observations': ((240, 256), np.uint8),
+    'ram': ((2048,), np.uint8),
+    'audio': ((2048,), np.float32),
+    'audio_length': ((), np.int32),
+    'actions': ((2,), np.uint8),
+}
+
+# Commands sent to the workers, each one answered with a single byte once done
+_STEP, _RESET, _QUIT = b's', b'r', b'q'
+
+
+class VectorEmulator:
+    """Steps several consoles running the same ROM in lockstep.
+
+    Observations are written into one preallocated (N, 240, 256) array that
+    step() returns every time, RAM is exposed as views of each console's own
+    memory. Nothing is allocated per frame.
+    """
+
+    def __init__(self, rom: str, num_envs: int, frame_skip: int = 1, max_pool: bool = False,
+                 observations: Optional[np.ndarray] = None):
+        if frame_skip < 1:
+            raise ValueError(f'frame_skip must be at least 1, got {frame_skip}')
+        self.emulators = [Emulator(rom) for _ in range(num_envs)]
+        self.frame_skip = frame_skip
+        # Each observation is the maximum over all the skipped frames
+        self.max_pool = max_pool
+        if observations is None:
+            observations = np.zeros((num_envs, 240, 256), dtype=np.uint8)
+        self.observations = observations
+        self._observation_views = list(self.observations)
+        self.ram: List[np.ndarray] = [np.asarray(e.bus.ram) for e in self.emulators]
+
+    def __len__(self) -> int:
+        return len(self.emulators)
+
+    def reset(self) -> np.ndarray:
+        for emulator in self.emulators:
+            emulator.reset()
+        self.observations.fill(0)
+        return self.observations
+
+    def step(self, actions: Optional[Sequence[Inputs]] = None) -> np.ndarray:
+        # One entry per console, as accepted by Emulator.set_inputs()
+        last = self.frame_skip - 1
+        for i, emulator in enumerate(self.emulators):
+            if actions is not None:
+                emulator.set_inputs(actions[i])
+            observation = self._observation_views[i]
+            for skip in range(self.frame_skip):
+                emulator.step_frame()
+                if self.max_pool and skip:
+                    np.maximum(observation, emulator.frame, out=observation)
+                elif self.max_pool or skip == last:
+                    np.copyto(observation, emulator.frame)
+        return self.observations
+
+
+def _shared_arrays(blocks: Dict[str, shared_memory.SharedMemory], num_envs: int) -> Dict[str, np.ndarray]:
+    return {key: np.ndarray((num_envs,) + shape, dtype=dtype, buffer=blocks[key].buf)
+            for key, (shape, dtype) in _SHARED_BUFFERS.items()}
+
+
+def _worker(connection, rom, start, stop, num_envs, frame_skip, max_pool, names):
+    blocks = {key: shared_memory.SharedMemory(name=name) for key, name in names.items()}
+    arrays = _shared_arrays(blocks, num_envs)
+    envs = VectorEmulator(rom, stop - start, frame_skip, max_pool, arrays['observations'][start:stop])
+    ram, audio = list(arrays['ram'][start:stop]), list(arrays['audio'][start:stop])
+    audio_length, actions = arrays['audio_length'][start:stop], arrays['actions'][start:stop]
+    connection.send_bytes(b'.')
+
+    while True:
+        command = connection.recv_bytes()
+        if command == _STEP:
+            envs.step(actions)
+            for i, emulator in enumerate(envs.emulators):
+                np.copyto(ram[i], envs.ram[i])
+                samples = emulator.audio
+                audio[i][:len(samples)] = samples
+                audio_length[i] = len(samples)
+        elif command == _RESET:
+            envs.reset()
+        else:
+            break
+        connection.send_bytes(b'.')
+
+    del envs, ram, audio, audio_length, actions, arrays
+    for block in blocks.values():
+        block.close()
+    connection.send_bytes(b'.')
+
+
+class ProcessVectorEmulator:
+    """VectorEmulator spread over worker processes.
+
+    Every worker owns a contiguous range of consoles and writes their frames,
+    RAM and audio straight into shared memory. Inputs go the other way through
+    a shared array, so a step only sends one byte to each worker and the
+    results are read in place. The arrays are invalid after close().
+    """
+
+    def __init__(self, rom: str, num_envs: int, num_workers: Optional[int] = None,
+                 frame_skip: int = 1, max_pool: bool = False, context=None):
+        if frame_skip < 1:
+            raise ValueError(f'frame_skip must be at least 1, got {frame_skip}')
+        num_workers = min(num_envs, num_workers or os.cpu_count() or 1)
+        context = context or multiprocessing.get_context()
+        self._blocks: Dict[str, shared_memory.SharedMemory] = {}
+        self._connections, self._workers = [], []
+        try:
+            for key, (shape, dtype) in _SHARED_BUFFERS.items():
+                self._blocks[key] = shared_memory.SharedMemory(
+                    create=True, size=num_envs * int(np.prod(shape, dtype=np.int64)) * np.dtype(dtype).itemsize)
+            arrays = _shared_arrays(self._blocks, num_envs)
+            self.observations = arrays['observations']
+            self.ram = arrays['ram']
+            # Samples of the last frame of each console, audio_length of them are valid
+            self.audio = arrays['audio']
+            self.audio_length = arrays['audio_length']
+            self._actions = arrays['actions']
+            self._actions.fill(0)
+            del arrays
+
+            names = {key: block.name for key, block in self._blocks.items()}
+            bounds = [num_envs * i // num_workers for i in range(num_workers + 1)]
+            for start, stop in zip(bounds, bounds[1:]):
+                connection, child = context.Pipe()
+                worker = context.Process(target=_worker, daemon=True,
+                                         args=(child, rom, start, stop, num_envs, frame_skip, max_pool, names))
+                worker.start()
+                child.close()
+                self._connections.append(connection)
+                self._workers.append(worker)
+            for index, connection in enumerate(self._connections):
+                try:
+                    connection.recv_bytes()
+                except EOFError:
+                    raise ChildProcessError(
+                        f'worker {index} (consoles {bounds[index]} to {bounds[index + 1] - 1}) '
+                        f'exited while loading {rom!r}') from None
+        except BaseException:
+            # Nothing may outlive a console that failed to start
+            for worker in self._workers:
+                worker.terminate()
+            for worker in self._workers:
+                worker.join()
+            self._release()
+            raise
+
+    def __len__(self) -> int:
+        return len(self.observations)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _command(self, command: bytes):
+        # All workers run at once, then wait for every one of them
+        for connection in self._connections:
+            connection.send_bytes(command)
+        for connection in self._connections:
+            connection.recv_bytes()
+
+    def reset(self) -> np.ndarray:
+        self._command(_RESET)
+        return self.observations
+
+    def step(self, actions: Optional[Sequence[Inputs]] = None) -> np.ndarray:
+        # Button masks for the first controllers, or (N, 2) masks for both.
+        # None keeps the previous inputs.
+        if actions is not None:
+            actions = np.asarray(actions)
+            if actions.ndim == 1:
+                self._actions[:, 0] = actions
+            else:
+                self._actions[:] = actions
+        self._command(_STEP)
+        return self.observations
+
+    def close(self):
+        if not self._workers:
+            return
+        self._command(_QUIT)
+        for worker in self._workers:
+            worker.join()
+        self._release()
+
+    def _release(self):
+        for connection in self._connections:
+            connection.close()
+        self._connections, self._workers = [], []
+        # The views have to go before the blocks they point into can be closed
+        self.observations = self.ram = self.audio = self.audio_length = self._actions = None
+        for block in self._blocks.values():
+            block.close()
+            block.unlink()
+        self._blocks = {}
@@ -10,6 +10,7 @@ setup(
         "pytoynes/apu.pyx",
         "pytoynes/mapper.pyx",
         "pytoynes/cartridge.pyx",
+        "pytoynes/scheduler.pyx",
     ], compiler_directives={
         'boundscheck': False,
         'wraparound': False,
@@ -0,0 +1,6 @@
+def console_state(emulator):
+    # What tests compare to decide two consoles are in the same state
+    cpu, bus = emulator.cpu, emulator.bus
+    return (cpu.a, cpu.x, cpu.y, cpu.p, cpu.stkp, cpu.pc, bus.total_cycles, bytes(bus.ram),
+            bytes(bus.ppu.vram), bytes(bus.cartridge.prg_ram), bytes(bus.ppu.pixels),
+            emulator.frame_count)
@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+from helpers import console_state
+from pytoynes import BootCache, Emulator
+from pytoynes.controller import BUTTON_RIGHT, BUTTON_START
+
+class TestBootCache(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.directory = self._directory.name
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def test_restores_boot(self):
+        cache = BootCache(self.directory)
+        inputs = [0] * 30 + [BUTTON_START] * 4
+        booted = Emulator('./super_mario.nes')
+        self.assertFalse(cache.boot(booted, 40, inputs))
+        restored = Emulator('./super_mario.nes')
+        self.assertTrue(cache.boot(restored, 40, inputs))
+        # The picture is only drawn again by the next frame
+        self.assertEqual(restored.snapshot(), booted.snapshot())
+        self.assertEqual(restored.frame_count, 40)
+
+        booted.run_frames(10, BUTTON_RIGHT)
+        restored.run_frames(10, BUTTON_RIGHT)
+        self.assertEqual(console_state(restored), console_state(booted))
+
+        # Another checkpoint or ROM is another entry
+        emulator = Emulator('./super_mario.nes')
+        self.assertFalse(cache.boot(emulator, 40))
+        emulator = Emulator('./pytoynes/assets/nestest.nes')
+        self.assertFalse(cache.boot(emulator, 40, inputs))
+        self.assertEqual(len(os.listdir(self.directory)), 3)
+
+    def test_evicts_least_recently_used(self):
+        emulator = Emulator('./super_mario.nes')
+        cache = BootCache(self.directory, max_bytes=2 * emulator.state_size)
+        for frames in (1, 2):
+            cache.boot(Emulator('./super_mario.nes'), frames)
+        os.utime(cache._path(cache.key(emulator, 1)), ns=(0, 0))
+        self.assertTrue(cache.boot(Emulator('./super_mario.nes'), 2))
+        cache.boot(Emulator('./super_mario.nes'), 3)
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         sorted(cache.key(emulator, frames) + '.state' for frames in (2, 3)))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+from pytoynes.bus import Bus
+from pytoynes.cartridge import Cartridge
+from pytoynes.mapper import Mapper001, Mapper002
+
+class TestBusPages(unittest.TestCase):
+    def test_ram_mirroring(self):
+        bus = Bus()
+        bus.write(0x0801, 0x42)
+        self.assertEqual(bus.read(0x0001), 0x42)
+        self.assertEqual(bus.read(0x1801), 0x42)
+        self.assertEqual(bus.ram[0x0001], 0x42)
+
+    def test_bank_switch_remaps_pages(self):
+        cart = Cartridge()
+        cart.mapper = Mapper002(4, 0)
+        cart.prg_memory = bytearray(4 * 0x4000)
+        for bank in range(4):
+            cart.prg_memory[bank * 0x4000] = bank
+
+        bus = Bus()
+        bus.cartridge = cart
+        self.assertEqual(bus.read(0x8000), 0)
+        self.assertEqual(bus.read(0xC000), 3)
+
+        # UNROM bank select; the ROM itself must not be modified
+        bus.write(0x8000, 2)
+        self.assertEqual(bus.read(0x8000), 2)
+        self.assertEqual(cart.prg_memory[0x0000], 0)
+
+    def test_mapper_mirroring_remaps_nametables(self):
+        cart = Cartridge()
+        cart.mapper = Mapper001(2, 0)
+        bus = Bus()
+        bus.cartridge = cart
+
+        def write_control(val):
+            for i in range(5):
+                bus.write(0x8000, (val >> i) & 0x01)
+
+        write_control(0x0E) # vertical
+        bus.ppu.ppu_write(0x2000, 0xAA)
+        self.assertEqual(bus.ppu.ppu_read(0x2800), 0xAA)
+        self.assertNotEqual(bus.ppu.ppu_read(0x2400), 0xAA)
+
+        write_control(0x0F) # horizontal
+        self.assertEqual(bus.ppu.ppu_read(0x2400), 0xAA)
+        self.assertNotEqual(bus.ppu.ppu_read(0x2800), 0xAA)
+
+if __name__ == '__main__':
+    unittest.main()
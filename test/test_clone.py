@@ -0,0 +1,66 @@
+import unittest
+from helpers import console_state
+from pytoynes import Emulator
+from pytoynes.controller import BUTTON_A, BUTTON_RIGHT, BUTTON_START
+
+class TestClone(unittest.TestCase):
+    def _assert_branches(self, rom_path, frames):
+        inputs = [BUTTON_START if i % 8 < 2 else BUTTON_RIGHT | BUTTON_A for i in range(frames)]
+        emulator = Emulator(rom_path)
+        emulator.run_frames(frames)
+        clone = emulator.clone()
+        self.assertIs(clone.bus.cartridge.rom, emulator.bus.cartridge.rom)
+        self.assertEqual(console_state(clone), console_state(emulator))
+
+        for i in range(frames):
+            emulator.step_frame(inputs[i])
+            clone.step_frame(inputs[i])
+        self.assertEqual(console_state(clone), console_state(emulator))
+
+        # Reusing a clone, which then runs on without touching the original
+        expected = console_state(emulator)
+        self.assertIs(emulator.clone(into=clone), clone)
+        clone.run_frames(frames, BUTTON_RIGHT)
+        self.assertEqual(console_state(emulator), expected)
+        self.assertNotEqual(console_state(clone), expected)
+
+    def test_nrom(self):
+        self._assert_branches('./super_mario.nes', 8)
+
+    def test_mmc1_chr_ram(self):
+        self._assert_branches('./Zelda no Densetsu 1 - The Hyrule Fantasy (Japan).nes', 8)
+
+    def test_not_shared(self):
+        # PRG-RAM, written PRG memory and the mapper registers belong to each clone
+        emulator = Emulator('./Zelda no Densetsu 1 - The Hyrule Fantasy (Japan).nes')
+        clone = emulator.clone()
+        clone.bus.cartridge.prg_ram[0] ^= 0xFF
+        self.assertNotEqual(clone.bus.cartridge.prg_ram[0], emulator.bus.cartridge.prg_ram[0])
+        self.assertIsNot(clone.bus.cartridge.mapper, emulator.bus.cartridge.mapper)
+
+        # NROM writes land in a private copy of PRG memory, which the clone copies
+        emulator = Emulator('./pytoynes/assets/nestest.nes')
+        bus = emulator.bus
+        value = bus.read(0xC000) ^ 0xFF
+        bus.write(0xC000, value)
+        clone = emulator.clone()
+        if hasattr(bus.cartridge, 'blocks'):
+            # Translated blocks of the pure Python build
+            self.assertIsNot(clone.bus.cartridge.blocks, bus.cartridge.blocks)
+        self.assertEqual(clone.bus.read(0xC000), value)
+        original = bus.read(0xC001)
+        bus.write(0xC001, original ^ 0xFF)
+        self.assertEqual(clone.bus.read(0xC001), original)
+        clone.bus.write(0xC000, value ^ 0xFF)
+        self.assertEqual(bus.read(0xC000), value)
+
+    def test_mmc3(self):
+        self._assert_branches("./Kirby's Adventure (USA).nes", 8)
+
+    def test_other_cartridge(self):
+        emulator = Emulator('./super_mario.nes')
+        with self.assertRaises(ValueError):
+            emulator.clone(into=Emulator('./super_mario.nes'))
+
+if __name__ == '__main__':
+    unittest.main()
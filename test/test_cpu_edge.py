@@ -1,6 +1,7 @@
 import unittest
 from pytoynes.mos6502 import MOS6502, Status
 from pytoynes.bus import Bus
+from pytoynes.scheduler import EVENT_IRQ_POLL
 
 from pytoynes.cartridge import Cartridge
 
@@ -34,6 +35,82 @@ class TestCPUEdge(unittest.TestCase):
         self.assertEqual(self.cpu.a, 0x7F)
         self.assertTrue(self.cpu.p & Status.V)
 
+    def test_adc_sbc_all_inputs(self):
+        # The result and flags come from a lookup table, check every entry
+        for opcode, operand_of in ((0x69, lambda m: m), (0xE9, lambda m: m ^ 0xFF)):
+            self.bus.ram[0x0000] = opcode
+            for carry in (0, 1):
+                for a in range(256):
+                    for m in range(256):
+                        self.cpu.a, self.cpu.p, self.cpu.pc = a, Status.U | carry, 0x0000
+                        self.bus.ram[0x0001] = m
+                        self.cpu.clock()
+                        r = a + operand_of(m) + carry
+                        overflow = bool(~(a ^ operand_of(m)) & (a ^ r) & 0x80)
+                        self.assertEqual(self.cpu.a, r & 0xFF)
+                        self.assertEqual(self.cpu.p & Status.C, r > 0xFF)
+                        self.assertEqual(bool(self.cpu.p & Status.Z), r & 0xFF == 0)
+                        self.assertEqual(bool(self.cpu.p & Status.V), overflow)
+                        self.assertEqual(self.cpu.p & Status.N, r & 0x80)
+
+    def test_hot_pairs_get_fused(self):
+        # LDX #$03, DEX, BNE $0002
+        for addr, data in enumerate([0xA2, 0x03, 0xCA, 0xD0, 0xFD]):
+            self.bus.ram[addr] = data
+        self.cpu.pc = 0x0000
+        for _ in range(7):
+            self.cpu.clock()
+        self.assertEqual(self.cpu.pair_counts[0xCAD0], 3)
+        self.assertEqual(self.cpu.fuse_hot_pairs(), [0xCA])
+        self.assertIsNone(self.cpu.pair_counts)
+
+        # Only while run_frame drives the CPU
+        self.cpu.pc = 0x0000
+        self.assertEqual(self.cpu.clock(), 2)
+        self.assertEqual(self.cpu.clock(), 2)
+        self.assertEqual((self.cpu.pc, self.cpu.x), (0x0003, 0x02))
+
+        self.cpu.fuse_pairs = True
+        self.cpu.pc = 0x0000
+        self.assertEqual(self.cpu.clock(), 2)
+        # DEX and the taken BNE run as one step
+        self.assertEqual(self.cpu.clock(), 5)
+        self.assertEqual((self.cpu.pc, self.cpu.x), (0x0002, 0x02))
+
+        # Not when the next event falls between the two
+        self.bus.scheduler.schedule(EVENT_IRQ_POLL, self.bus.total_cycles + 2)
+        self.assertEqual(self.cpu.clock(), 2)
+        self.assertEqual((self.cpu.pc, self.cpu.x), (0x0003, 0x01))
+
+    def test_named_pairs_get_fused(self):
+        program = [
+            0xA9, 0x00, 0x8D, 0x01, 0x03,  # LDA #$00, STA $0301
+            0xA5, 0x20, 0x29, 0x0F,        # LDA $20, AND #$0F
+            0xC8, 0xC0, 0x04, 0xD0, 0xF7,  # INY, CPY #$04, BNE $0005
+            0xCA, 0xD0, 0xFD,              # DEX, BNE $000E
+            0xA9, 0x01, 0x8D, 0x00, 0x60,  # LDA #$01, STA $6000
+        ]
+        def run():
+            for addr, data in enumerate(program):
+                self.bus.ram[addr] = data
+            self.bus.ram[0x20] = 0x3C
+            self.cpu.pc, self.cpu.x, self.cpu.y = 0x0000, 0x03, 0x00
+            steps = []
+            while self.cpu.pc < len(program):
+                steps.append((self.cpu.pc, self.cpu.clock()))
+            return steps, (self.cpu.a, self.cpu.x, self.cpu.y, self.cpu.p, self.bus.ram[0x0301])
+
+        steps, expected = run()
+        self.assertEqual(self.cpu.fuse_hot_pairs(min_share=0), [0xA5, 0xA9, 0xC0, 0xCA])
+        self.cpu.fuse_pairs = True
+        fused_steps, state = run()
+        self.assertEqual(state, expected)
+        # LDA/STA abs, LDA zp/AND #, INY, then CPY/BNE taken
+        self.assertEqual(fused_steps[:4], [(0x0000, 6), (0x0005, 5), (0x0009, 2), (0x000A, 5)])
+        # DEX/BNE, and LDA/STA only when it stores into internal RAM
+        self.assertEqual(fused_steps[-4:], [(0x000E, 5), (0x000E, 4), (0x0011, 2), (0x0013, 4)])
+        self.assertEqual(sum(cycles for _, cycles in fused_steps), sum(cycles for _, cycles in steps))
+
     def test_brk_flags(self):
         self.cpu.p = Status.U | Status.I
         self.bus.ram[0x0000] = 0x00 # BRK
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+import unittest
+import numpy as np
+from pytoynes import Emulator
+from pytoynes.controller import BUTTON_A, BUTTON_START
+
+class TestEmulator(unittest.TestCase):
+    def test_runs_headless(self):
+        emulator = Emulator('./super_mario.nes')
+        emulator.run_frames(3)
+        self.assertEqual(emulator.frame_count, 3)
+        self.assertEqual(emulator.frame.shape, (240, 256))
+        self.assertIs(emulator.frame, emulator.bus.ppu.pixels)
+
+        # Only the samples of the last frame, still backed by the APU buffer
+        audio = emulator.audio
+        self.assertEqual(audio.dtype, np.float32)
+        self.assertTrue(700 < len(audio) < 800)
+        audio[0] = 1.5
+        self.assertEqual(emulator.bus.apu.audio_buffer[0], 1.5)
+
+    def test_inputs(self):
+        emulator = Emulator('./super_mario.nes')
+        emulator.step_frame(BUTTON_START)
+        self.assertEqual(emulator.bus.controllers[0].state, BUTTON_START)
+        emulator.step_frame()
+        self.assertEqual(emulator.bus.controllers[0].state, BUTTON_START)
+        emulator.step_frame((0, BUTTON_A))
+        self.assertEqual([c.state for c in emulator.bus.controllers], [0, BUTTON_A])
+
+    def test_load_starts_a_new_console(self):
+        emulator = Emulator('./super_mario.nes')
+        emulator.run_frames(2)
+        emulator.load('./pytoynes/assets/nestest.nes')
+        self.assertEqual(emulator.frame_count, 0)
+        self.assertEqual(emulator.cpu.pc, emulator.bus.read(0xFFFC) | emulator.bus.read(0xFFFD) << 8)
+
+    def test_no_rom(self):
+        emulator = Emulator()
+        self.assertIsNone(emulator.bus)
+        for call in (emulator.step_frame, emulator.snapshot, emulator.clone, lambda: emulator.state_size):
+            with self.assertRaises(RuntimeError):
+                call()
+        emulator.load('./super_mario.nes')
+        emulator.step_frame()
+        self.assertEqual(emulator.frame_count, 1)
+
+    def test_no_pygame(self):
+        code = 'import sys, pytoynes; pytoynes.Emulator(); print("pygame" in sys.modules)'
+        out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.split()[-1], 'False')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import contextlib
+import hashlib
+import os
+import tempfile
+import unittest
+from pytoynes import Emulator, ForkExplorer
+from pytoynes.controller import BUTTON_A, BUTTON_LEFT, BUTTON_RIGHT, BUTTON_START
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork()')
+class TestForkExplorer(unittest.TestCase):
+    def test_branches(self):
+        emulator = Emulator('./super_mario.nes')
+        emulator.run_frames(40)
+        emulator.run_frames(4, BUTTON_START)
+        emulator.run_frames(120)
+        ram = bytes(emulator.bus.ram)
+        branches = [[BUTTON_RIGHT] * 30, [BUTTON_LEFT] * 30, [BUTTON_RIGHT | BUTTON_A] * 30]
+        # Fewer workers than branches, so some have to wait for a free slot
+        results = ForkExplorer(emulator, max_workers=2).run(branches, addresses=(0x0086, 0x0001))
+        self.assertEqual(len(results), len(branches))
+        self.assertEqual(bytes(emulator.bus.ram), ram)
+
+        for branch, result in zip(branches, results):
+            expected = emulator.clone()
+            expected.run_frames(len(branch), branch[0])
+            self.assertEqual(result.frame_count, expected.frame_count)
+            self.assertEqual(result.ram_hash, hashlib.blake2b(expected.bus.ram, digest_size=16).digest())
+            self.assertEqual(result.watched, bytes([expected.bus.ram[0x86], expected.bus.ram[0x01]]))
+        self.assertNotEqual(results[0].ram_hash, results[1].ram_hash)
+
+    def test_failed_branch(self):
+        emulator = Emulator('./super_mario.nes')
+        with tempfile.TemporaryFile('w+') as stderr, contextlib.redirect_stderr(stderr):
+            with self.assertRaises(ChildProcessError):
+                ForkExplorer(emulator).run([[0], [object()]])
+            # The child reports why it failed
+            stderr.seek(0)
+            self.assertIn('Traceback', stderr.read())
+
+if __name__ == '__main__':
+    unittest.main()
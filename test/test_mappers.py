@@ -106,5 +106,50 @@ class TestMappers(unittest.TestCase):
         # CHR ROM should be read-only
         self.assertEqual(mapper.map_ppu_write_addr(0x0000, 0x55), -1)
 
+    def test_bank_tables(self):
+        # The header's mirroring is kept until the mapper changes it
+        self.assertEqual(Mapper004(16, 16, 1).mirror_mode, 1)
+
+        # MMC1 PRG mode 2: $8000 fixed to the first bank, $C000 switchable
+        mmc1 = Mapper001(16, 16)
+        for addr, val in ((0x8000, 0x08), (0xE000, 3)):
+            for i in range(5):
+                mmc1.map_cpu_write_addr(addr, (val >> i) & 0x01)
+        self.assertEqual(mmc1.map_cpu_read_addr(0x9234), 0x1234)
+        self.assertEqual(mmc1.map_cpu_read_addr(0xD234), 3 * 16384 + 0x1234)
+
+        # MMC3 CHR A12 inversion swaps the 2 KB and 1 KB halves
+        mmc3 = Mapper004(16, 16)
+        mmc3.map_cpu_write_addr(0x8000, 0x80 | 0x01)
+        mmc3.map_cpu_write_addr(0x8001, 6)
+        mmc3.map_cpu_write_addr(0x8000, 0x80 | 0x05)
+        mmc3.map_cpu_write_addr(0x8001, 9)
+        self.assertEqual(mmc3.map_ppu_read_addr(0x1C10), 7 * 1024 + 0x0010)
+        self.assertEqual(mmc3.map_ppu_read_addr(0x0C10), 9 * 1024 + 0x0010)
+
+    def test_affects_ppu(self):
+        # UNROM only switches PRG, the PPU never needs to catch up
+        self.assertFalse(Mapper002(8, 0).affects_ppu(0x8000, 3))
+
+        # MMC1 commits on the fifth write, $E000 selects a PRG bank
+        mmc1 = Mapper001(16, 16)
+        for i in range(4):
+            self.assertFalse(mmc1.affects_ppu(0xA000, 0))
+            mmc1.map_cpu_write_addr(0xA000, 0)
+        self.assertTrue(mmc1.affects_ppu(0xA000, 0))
+        self.assertFalse(mmc1.affects_ppu(0xE000, 0))
+        self.assertTrue(mmc1.affects_ppu(0xE000, 0x80))
+
+        # MMC3 R6/R7 and $A001 are PRG only, everything else is visible
+        mmc3 = Mapper004(16, 16)
+        mmc3.map_cpu_write_addr(0x8000, 0x06)
+        self.assertFalse(mmc3.affects_ppu(0x8001, 10))
+        mmc3.map_cpu_write_addr(0x8000, 0x02)
+        self.assertTrue(mmc3.affects_ppu(0x8001, 10))
+        self.assertTrue(mmc3.affects_ppu(0xA000, 1))
+        self.assertFalse(mmc3.affects_ppu(0xA001, 0x80))
+        self.assertTrue(mmc3.affects_ppu(0xC000, 5))
+        self.assertFalse(mmc3.affects_ppu(0x6000, 0))
+
 if __name__ == '__main__':
     unittest.main()
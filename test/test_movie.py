@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+from helpers import console_state
+from pytoynes import Emulator
+from pytoynes.controller import BUTTON_A, BUTTON_RIGHT, BUTTON_START
+from pytoynes.movie import Movie, MoviePlayer, MovieRecorder
+
+class TestMovie(unittest.TestCase):
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self._directory.name, 'test.movie')
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _record(self, emulator, recorder, frames):
+        for i in range(frames):
+            emulator.set_inputs(BUTTON_START if 30 <= i < 34 else BUTTON_RIGHT | (BUTTON_A if i % 16 < 4 else 0))
+            recorder.step_frame()
+
+    def test_power_on(self):
+        emulator = Emulator('./super_mario.nes')
+        recorder = MovieRecorder(emulator, from_power_on=True)
+        self._record(emulator, recorder, 60)
+        recorder.movie.save(self.path)
+        self.assertEqual(os.path.getsize(self.path), 47 + 60 * 2)
+
+        movie = Movie.load(self.path)
+        self.assertEqual(len(movie), 60)
+        self.assertIsNone(movie.start_state)
+        self.assertEqual(movie.frame(31), (BUTTON_START, 0))
+        replay = Emulator('./super_mario.nes')
+        player = MoviePlayer(movie, replay)
+        self.assertEqual(player.run(), 60)
+        self.assertTrue(player.done)
+        self.assertFalse(player.step())
+        self.assertEqual(console_state(replay), console_state(emulator))
+
+    def test_start_state(self):
+        emulator = Emulator('./super_mario.nes')
+        emulator.run_frames(20)
+        recorder = MovieRecorder(emulator)
+        self._record(emulator, recorder, 40)
+        recorder.movie.save(self.path)
+
+        replay = Emulator('./super_mario.nes')
+        player = MoviePlayer(Movie.load(self.path), replay)
+        self.assertEqual(player.run(10), 10)
+        self.assertEqual(player.run(), 30)
+        self.assertEqual(console_state(replay), console_state(emulator))
+
+    def test_errors(self):
+        emulator = Emulator('./super_mario.nes')
+        recorder = MovieRecorder(emulator, from_power_on=True)
+        recorder.step_frame()
+        recorder.movie.save(self.path)
+        with self.assertRaises(ValueError):
+            MoviePlayer(Movie.load(self.path), Emulator('./pytoynes/assets/nestest.nes'))
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 1)
+        with self.assertRaises(ValueError):
+            Movie.load(self.path)
+
+if __name__ == '__main__':
+    unittest.main()
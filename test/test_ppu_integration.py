@@ -50,5 +50,55 @@ class TestPPUIntegration(unittest.TestCase):
         print(f"DEBUG: PPU non-zero pixels after 60 frames: {non_zero_count}")
         self.assertGreater(non_zero_count, 1000, "PPU produced a black or nearly black screen.")
 
+    def _make_rendering_ppu(self):
+        cart = Cartridge('./pytoynes/assets/nestest.nes')
+        ppu = PPU()
+        ppu.connect_cartridge(cart)
+        for i in range(2048): ppu.vram[i] = (i * 7) & 0xFF
+        for i in range(32): ppu.palette_vram[i] = (i * 5) & 0x3F
+        for i in range(64):
+            for j, value in enumerate(((i * 13) % 200, i, i & 0xE3, (i * 37) & 0xFF)):
+                ppu.oam_vram[i * 4 + j] = value
+        ppu.ppu_mask = 0x1E
+        ppu.ppu_ctrl = 0x10
+        ppu.fine_x = 3
+        ppu.scanline = -1
+        return ppu
+
+    def _assert_same_ppu(self, a, b):
+        np.testing.assert_array_equal(np.array(a.pixels), np.array(b.pixels))
+        for name in ('v', 't', 'w', 'fine_x', 'ppu_ctrl', 'ppu_status', 'scanline', 'cycle', 'total_cycles',
+                     'sprite_count', 'bg_shifter_tile_lo', 'bg_shifter_tile_hi',
+                     'bg_shifter_attrib_lo', 'bg_shifter_attrib_hi'):
+            self.assertEqual(getattr(a, name), getattr(b, name), name)
+
+    def test_scanline_stepping_matches_dots(self):
+        """Verify that bulk scanline stepping in run_to matches clocking every dot."""
+        stepped = self._make_rendering_ppu()
+        bulk = self._make_rendering_ppu()
+        target = 89342 + 1000
+        while stepped.total_cycles < target:
+            stepped.clock()
+        bulk.run_to(target)
+        self._assert_same_ppu(bulk, stepped)
+
+    def test_deferred_writes_replay_at_their_dot(self):
+        """Verify that deferred scroll and ctrl writes land on the same dot as immediate ones."""
+        writes = [(341 * 40 + 100, 0x2005, 0x35), (341 * 40 + 100, 0x2005, 0x10),
+                  (341 * 90 + 290, 0x2006, 0x24), (341 * 90 + 293, 0x2006, 0x60),
+                  (341 * 150 + 20, 0x2000, 0x01), (341 * 200 + 5, 0x2001, 0x0E)]
+        immediate = self._make_rendering_ppu()
+        deferred = self._make_rendering_ppu()
+        for ppu_cycle, addr, data in writes:
+            immediate.run_to(ppu_cycle)
+            immediate.cpu_write(addr, data)
+            deferred.defer_write(addr, data, ppu_cycle)
+        self.assertEqual(deferred.total_cycles, 0)
+        self.assertEqual(deferred.w, immediate.w)
+
+        immediate.run_to(89342)
+        deferred.run_to(89342)
+        self._assert_same_ppu(deferred, immediate)
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+from pytoynes import Emulator, Rewind
+
+class TestRewind(unittest.TestCase):
+    def test_steps_back_through_every_frame(self):
+        emulator = Emulator('./super_mario.nes')
+        rewind = Rewind(emulator, segment_frames=4)
+        states = []
+        for _ in range(10):
+            emulator.step_frame()
+            rewind.push()
+            states.append(bytes(emulator.snapshot()))
+        self.assertEqual(len(rewind), 10)
+
+        # Back to the state before the newest each time
+        for state in reversed(states[5:-1]):
+            self.assertTrue(rewind.pop())
+            self.assertEqual(bytes(emulator.snapshot()), state)
+        self.assertEqual(len(rewind), 6)
+
+        # Recording again after rewinding follows on from the restored state
+        emulator.step_frame()
+        rewind.push()
+        self.assertEqual(len(rewind), 7)
+        for state in reversed(states[:6]):
+            self.assertTrue(rewind.pop())
+            self.assertEqual(bytes(emulator.snapshot()), state)
+        self.assertFalse(rewind.pop())
+        self.assertEqual(len(rewind), 1)
+        self.assertEqual(rewind.memory_used, 0)
+
+    def test_memory_budget_drops_oldest_frames(self):
+        emulator = Emulator('./super_mario.nes')
+        rewind = Rewind(emulator, memory_budget=1, segment_frames=2)
+        for _ in range(7):
+            emulator.step_frame()
+            rewind.push()
+        # The newest segment of two deltas and the whole newest state are left
+        self.assertEqual(len(rewind), 3)
+        while rewind.pop():
+            pass
+        self.assertEqual(emulator.frame_count, 5)
+        self.assertEqual(rewind.memory_used, 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,7 +5,8 @@ import unittest
 from pytoynes.rom import Rom
 from pytoynes.mos6502 import MOS6502
 from pytoynes.bus import Bus
-from pytoynes.cartridge import Cartridge
+from pytoynes.cartridge import Cartridge, decode_tiles
+from pytoynes.mapper import Mapper000
 
 def load_ref_ans_status(path: str):
     status = []
@@ -30,6 +31,22 @@ class UnitestRom(unittest.TestCase):
         self.assertIsNotNone(cartridge.rom.prg_rom_data)
         self.assertIsNotNone(cartridge.rom.chr_rom_data)
 
+    def test_rom_is_shared(self):
+        p = str(pathlib.Path('./pytoynes/assets/nestest.nes').absolute())
+        cartridge, other = Cartridge(p), Cartridge(p)
+        self.assertTrue(memoryview(cartridge.rom.prg_rom_data).readonly)
+        self.assertTrue(memoryview(cartridge.rom.chr_rom_data).readonly)
+        self.assertEqual(bytes(cartridge.prg_memory), bytes(other.prg_memory))
+
+        # Writes to NROM's PRG space land in a private copy
+        bus = Bus()
+        bus.cartridge = cartridge
+        value = bus.read(0xC000) ^ 0xFF
+        bus.write(0xC000, value)
+        self.assertEqual(bus.read(0xC000), value)
+        self.assertEqual(other.cpu_read(0xC000), value ^ 0xFF)
+        self.assertEqual(bytes(other.rom.prg_rom_data), bytes(other.prg_memory))
+
     def test_ppu_access(self):
         p = pathlib.Path('./pytoynes/assets/nestest.nes').absolute()
         cartridge = Cartridge(str(p))
@@ -47,6 +64,22 @@ class UnitestRom(unittest.TestCase):
         cartridge.ppu_write(0x0000, original_data ^ 0xFF)
         self.assertEqual(cartridge.ppu_read(0x0000), original_data)
 
+    def test_tile_cache(self):
+        p = pathlib.Path('./pytoynes/assets/nestest.nes').absolute()
+        cartridge = Cartridge(str(p))
+        self.assertEqual(cartridge.tiles.shape, (512, 8, 8))
+        lo, hi = cartridge.ppu_read(0x1234), cartridge.ppu_read(0x123C)
+        self.assertEqual(list(cartridge.tiles[0x123, 4]),
+                         [((hi >> (7 - x)) & 1) << 1 | ((lo >> (7 - x)) & 1) for x in range(8)])
+
+        # CHR-RAM writes are decoded as they happen
+        cartridge = Cartridge()
+        cartridge.mapper = Mapper000(1, 0)
+        cartridge.ppu_write(0x0013, 0xF0)
+        cartridge.ppu_write(0x001B, 0x3C)
+        self.assertEqual(list(cartridge.tiles[1, 3]), [1, 1, 3, 3, 2, 2, 0, 0])
+        self.assertTrue((cartridge.tiles == decode_tiles(cartridge.chr_memory)).all())
+
     def test_bus_ppu_mapping(self):
         bus = Bus()
         # Test PPUCTRL (0x2000)
@@ -121,6 +154,25 @@ class UnitestRom(unittest.TestCase):
         for i in range(256):
             self.assertEqual(bus.ppu.oam_vram[i], i)
 
+    def test_oam_dma_wraps_and_stalls(self):
+        bus = Bus()
+        bus.cartridge = Cartridge()
+        for i in range(256):
+            bus.ram[0x0300 + i] = i
+        bus.ppu.oam_addr = 0x10
+
+        bus.write(0x4014, 0x03)
+        # The copy starts at oam_addr and wraps around
+        self.assertEqual(bus.ppu.oam_vram[0x10], 0x00)
+        self.assertEqual(bus.ppu.oam_vram[0xFF], 0xEF)
+        self.assertEqual(bus.ppu.oam_vram[0x00], 0xF0)
+        self.assertEqual(bus.ppu.oam_addr, 0x10)
+        self.assertEqual(bus.total_cycles, 513)
+
+        # One more cycle when the DMA starts on an odd cycle
+        bus.write(0x4014, 0x03)
+        self.assertEqual(bus.total_cycles, 1027)
+
     def test_nametable_mirroring(self):
         from pytoynes.rom import MirrorMode
         bus = Bus()
@@ -0,0 +1,36 @@
+import unittest
+from helpers import console_state
+from pytoynes import Emulator
+from pytoynes.controller import BUTTON_A, BUTTON_RIGHT, BUTTON_START
+
+class TestSaveState(unittest.TestCase):
+    def _assert_replays(self, rom_path, frames):
+        inputs = [BUTTON_START if i % 8 < 2 else BUTTON_RIGHT | BUTTON_A for i in range(frames)]
+        emulator = Emulator(rom_path)
+        emulator.run_frames(frames)
+        buffer = emulator.snapshot()
+        self.assertEqual(len(buffer), emulator.state_size)
+        for i in range(frames):
+            emulator.step_frame(inputs[i])
+        expected = console_state(emulator)
+
+        # Into the same console, reusing the buffer, and into a fresh one
+        for target in (emulator, Emulator(rom_path)):
+            target.restore(buffer)
+            self.assertIs(target.snapshot(buffer), buffer)
+            for i in range(frames):
+                target.step_frame(inputs[i])
+            self.assertEqual(console_state(target), expected)
+
+    def test_nrom(self):
+        self._assert_replays('./super_mario.nes', 8)
+
+    def test_mmc1_chr_ram(self):
+        # Mapper registers, PRG-RAM and CHR-RAM all take part
+        self._assert_replays('./Zelda no Densetsu 1 - The Hyrule Fantasy (Japan).nes', 8)
+
+    def test_mmc3(self):
+        self._assert_replays("./Kirby's Adventure (USA).nes", 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+from pytoynes.scheduler import Scheduler, NEVER, EVENT_NMI, EVENT_DMC, EVENT_FRAME_END
+
+class TestScheduler(unittest.TestCase):
+    def test_next_event_tracks_earliest(self):
+        sched = Scheduler()
+        self.assertEqual(sched.next_event, NEVER)
+        sched.schedule(EVENT_FRAME_END, 29781)
+        sched.schedule(EVENT_NMI, 27394)
+        self.assertEqual(sched.next_event, 27394)
+        self.assertTrue(sched.is_due(EVENT_NMI, 27394))
+        self.assertFalse(sched.is_due(EVENT_FRAME_END, 27394))
+
+        sched.cancel(EVENT_NMI)
+        self.assertEqual(sched.next_event, 29781)
+        sched.schedule(EVENT_DMC, 100)
+        self.assertEqual(sched.next_event, 100)
+
+if __name__ == '__main__':
+    unittest.main()
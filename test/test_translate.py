@@ -0,0 +1,101 @@
+import unittest
+from pytoynes import mos6502
+from pytoynes.mos6502 import MOS6502
+from pytoynes.bus import Bus
+from pytoynes.cartridge import Cartridge
+from pytoynes.scheduler import EVENT_IRQ_POLL
+
+@unittest.skipUnless(hasattr(MOS6502, 'run_block'), 'the compiled CPU core does not translate blocks')
+class TestTranslate(unittest.TestCase):
+    def _make(self, cartridge, interpret=False):
+        cpu = MOS6502()
+        bus = Bus()
+        cpu.connect(bus)
+        bus.cartridge = cartridge
+        cpu.reset()
+        if interpret:
+            # An opcode hook keeps the CPU on clock()
+            cpu.on_opcode_loaded = lambda: None
+        return cpu, bus
+
+    def _assert_same_run(self, rom_path, frames, pc=None):
+        results = []
+        for interpret in (True, False):
+            cpu, bus = self._make(Cartridge(rom_path), interpret)
+            if pc is not None:
+                cpu.pc = pc
+            for _ in range(frames):
+                bus.run_frame(cpu)
+            results.append((cpu.a, cpu.x, cpu.y, cpu.p, cpu.stkp, cpu.pc, bus.total_cycles,
+                            bytes(bus.ram), bytes(bus.ppu.pixels)))
+        self.assertEqual(results[0], results[1])
+
+    def test_blocks_match_interpreter(self):
+        translate_after = mos6502.TRANSLATE_AFTER
+        mos6502.TRANSLATE_AFTER = 1
+        try:
+            # nestest's automated mode covers the official and illegal opcodes
+            self._assert_same_run('./pytoynes/assets/nestest.nes', 2, pc=0xC000)
+        finally:
+            mos6502.TRANSLATE_AFTER = translate_after
+        self._assert_same_run('./super_mario.nes', 20)
+
+    def _make_program(self, program):
+        cartridge = Cartridge()
+        cartridge.prg_memory[0x0000:len(program)] = bytes(program)
+        cpu, bus = self._make(cartridge)
+        cpu.pc = 0x8000
+        return cpu, bus
+
+    def test_block_stops_at_event(self):
+        # LDA #$01, LDX #$02, LDY #$03, JMP $8000
+        cpu, bus = self._make_program([0xA9, 0x01, 0xA2, 0x02, 0xA0, 0x03, 0x4C, 0x00, 0x80])
+        for _ in range(mos6502.TRANSLATE_AFTER):
+            cpu.pc = 0x8000
+            cpu.run_block()
+        self.assertEqual(len(cpu.bus.cartridge.blocks), 1)
+
+        cpu.pc, cpu.a, cpu.x, cpu.y = 0x8000, 0, 0, 0
+        bus.total_cycles = 100
+        bus.scheduler.schedule(EVENT_IRQ_POLL, 103)
+        cpu.run_block()
+        self.assertEqual((cpu.pc, cpu.a, cpu.x, cpu.y), (0x8004, 0x01, 0x02, 0x00))
+        self.assertEqual(bus.total_cycles, 104)
+
+    def test_idle_loop_skips_to_event(self):
+        # LDA $00, BEQ $8000 spins until an interrupt changes RAM
+        cpu, bus = self._make_program([0xA5, 0x00, 0xF0, 0xFC])
+        while not bus.cartridge.blocks:
+            cpu.run_block()
+
+        cpu.pc, cpu.a, cpu.p = 0x8000, 0x00, 0x26
+        bus.total_cycles = 100
+        bus.scheduler.schedule(EVENT_IRQ_POLL, 1000)
+        cpu.run_block()
+        # Every 6-cycle iteration that ends before the event is charged at once
+        self.assertEqual((cpu.pc, bus.total_cycles), (0x8000, 994))
+        cpu.run_block()
+        self.assertEqual((cpu.pc, bus.total_cycles), (0x8000, 1000))
+
+        # A changing register means the loop makes progress and isn't skipped
+        cpu.a = 0x01
+        bus.scheduler.schedule(EVENT_IRQ_POLL, 2000)
+        cpu.run_block()
+        self.assertEqual((cpu.pc, bus.total_cycles), (0x8000, 1006))
+
+    def test_prg_write_drops_blocks(self):
+        # LDA #$01, STA $00, JMP $8000
+        cpu, bus = self._make_program([0xA9, 0x01, 0x85, 0x00, 0x4C, 0x00, 0x80])
+        while not bus.cartridge.blocks:
+            cpu.run_block()
+        self.assertEqual(bus.ram[0x00], 0x01)
+
+        # NROM without PRG-RAM lets the CPU write to its PRG memory
+        bus.write(0x8001, 0x02)
+        self.assertFalse(bus.cartridge.blocks)
+        for _ in range(3):
+            cpu.run_block()
+        self.assertEqual(bus.ram[0x00], 0x02)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import unittest
+import numpy as np
+from pytoynes import Emulator, VectorEmulator, ProcessVectorEmulator
+from pytoynes.controller import BUTTON_START
+
+class TestVectorEmulator(unittest.TestCase):
+    def test_matches_single_emulators(self):
+        envs = VectorEmulator('./super_mario.nes', 3, frame_skip=2)
+        observations = envs.step()
+        for _ in range(20):
+            self.assertIs(envs.step(np.array([0, BUTTON_START, 0])), observations)
+        self.assertEqual(observations.shape, (3, 240, 256))
+
+        emulator = Emulator('./super_mario.nes')
+        emulator.run_frames(2)
+        emulator.run_frames(40, BUTTON_START)
+        self.assertTrue((observations[1] == emulator.frame).all())
+        self.assertTrue((observations[0] == observations[2]).all())
+        self.assertTrue((envs.ram[0] == envs.ram[2]).all())
+        self.assertFalse((envs.ram[0] == envs.ram[1]).all())
+
+        # RAM views follow the consoles
+        envs.emulators[2].bus.ram[0x10] ^= 0xFF
+        self.assertEqual(envs.ram[2][0x10], envs.emulators[2].bus.ram[0x10])
+        self.assertNotEqual(envs.ram[0][0x10], envs.ram[2][0x10])
+
+    def test_max_pool(self):
+        envs = VectorEmulator('./super_mario.nes', 1, frame_skip=3, max_pool=True)
+        emulator = Emulator('./super_mario.nes')
+        for _ in range(10):
+            envs.step()
+            frames = []
+            for _ in range(3):
+                emulator.step_frame()
+                frames.append(emulator.frame.copy())
+            self.assertTrue((envs.observations[0] == np.maximum.reduce(frames)).all())
+
+    def test_frame_skip_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            VectorEmulator('./super_mario.nes', 1, frame_skip=0)
+
+    def test_process_pool_matches_in_process(self):
+        envs = VectorEmulator('./super_mario.nes', 3, frame_skip=2)
+        with ProcessVectorEmulator('./super_mario.nes', 3, num_workers=2, frame_skip=2) as pool:
+            observations = pool.step()
+            envs.step()
+            for actions in ([0, BUTTON_START, 0], [[BUTTON_START, 0], [0, 0], [0, BUTTON_START]], None):
+                for _ in range(3):
+                    self.assertIs(pool.step(actions), observations)
+                    envs.step(actions)
+            self.assertTrue((observations == envs.observations).all())
+            for i, emulator in enumerate(envs.emulators):
+                self.assertTrue((pool.ram[i] == envs.ram[i]).all())
+                self.assertEqual(pool.audio_length[i], len(emulator.audio))
+                self.assertTrue((pool.audio[i, :pool.audio_length[i]] == emulator.audio).all())
+        self.assertIsNone(pool.observations)
+
+    def test_process_pool_bad_rom(self):
+        def segments():
+            return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+        before = segments()
+        with self.assertRaisesRegex(ChildProcessError, 'worker 0'):
+            ProcessVectorEmulator('./missing.nes', 2, num_workers=2)
+        # No shared memory left behind
+        self.assertEqual(segments(), before)
+
+if __name__ == '__main__':
+    unittest.main()